@@ -0,0 +1,66 @@
+import argparse
+import os
+import tempfile
+import time
+
+# Output benchmark of the GDML files of the default configuration (full and _noDaughters): write time, file size
+# and read time (back into a pyg4ometry Registry) of the plain, gzip and zstd outputs.
+
+FORMATS = [".gdml", ".gdml.gz", ".gdml.zst"]
+
+def best_time(function, repeat):
+    """
+    Returns the tuple (best wall time in seconds of repeat calls of function, result of the last call).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def benchmark(registry, filename, repeat):
+    """
+    Returns the tuple (write time, file size in bytes, read time) of the GDML file of registry.
+    """
+    import writer
+
+    def write():
+        # remove the file so that it is written every time instead of being found unchanged
+        if os.path.exists(filename):
+            os.remove(filename)
+        writer.write(registry, filename)
+    write_time, _ = best_time(write, repeat)
+    read_time, _ = best_time(lambda: writer.read_registry(filename), repeat)
+    return write_time, os.path.getsize(filename), read_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the write time, size and read time of the plain and compressed GDML outputs.")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs of each step, the best time is reported")
+    args = parser.parse_args()
+
+    import pyg4ometry
+    import trexdm
+    import utils
+    import writer
+
+    # neither the build nor the reader need the meshes of the volumes
+    pyg4ometry.config.doMeshing = False
+    reg = trexdm.build_detector()
+    utils.prune_registry(reg)
+    registries = {"full": reg, "_noDaughters": utils.transfer_childless_world(reg)}
+
+    formats = FORMATS
+    try:
+        writer._import_zstandard()
+    except ImportError as error:
+        print(f"{error}, skipping .gdml.zst")
+        formats = [extension for extension in FORMATS if not extension.endswith(".zst")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, registry in registries.items():
+            print(f"\n{name}:")
+            print(f"    {'format':<10} {'write (s)':>10} {'size (kB)':>10} {'read (s)':>10}")
+            for extension in formats:
+                write_time, size, read_time = benchmark(registry, os.path.join(tmp, "trexdm" + extension), args.repeat)
+                print(f"    {extension:<10} {write_time:10.3f} {size/1e3:10.1f} {read_time:10.3f}")
@@ -0,0 +1,88 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Startup benchmark of the generator: wall time of "trexdm.py --help" and of a full GDML build,
+# the build split in phases, and the import time of the heaviest packages (python -X importtime).
+
+GENERATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Same steps as trexdm.main on a cache miss, timed separately
+PHASES_SCRIPT = """
+import time
+start = time.perf_counter()
+import pyg4ometry
+imported = time.perf_counter()
+import trexdm
+import utils
+pyg4ometry.config.doMeshing = {meshing}
+reg = trexdm.build_detector()
+built = time.perf_counter()
+utils.write_gdml(reg, {filename!r})
+written = time.perf_counter()
+print(imported - start, built - imported, written - built)
+"""
+
+def run_python(args, env=None):
+    """
+    Runs the python interpreter with the given arguments in the generator directory.
+    Returns the tuple (wall time in seconds, stdout, stderr).
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=GENERATOR_DIR, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout, result.stderr
+
+def best_time(args, repeat, env=None):
+    """
+    Returns the best wall time of repeat runs of the python interpreter with the given arguments.
+    """
+    return min(run_python(args, env)[0] for _ in range(repeat))
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+    Returns the list of (package, import time in seconds) adding up the self time of every module of each top level
+    package (e.g. all the vtkmodules.* for vtkmodules), slowest first.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) * 1e-6
+    return sorted(packages.items(), key=lambda package: package[1], reverse=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup and build time of trexdm.py.")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs of each command, the best time is reported")
+    parser.add_argument("--top", type=int, default=10, help="Number of packages listed in the import breakdown")
+    parser.add_argument("--meshing", action="store_true", default=False, help="Also time the build with the volume meshes enabled")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never serve the build from (or store it in) the user's geometry cache
+        env = dict(os.environ, TREXDM_CACHE_DIR=os.path.join(tmp, "cache"))
+        filename = os.path.join(tmp, "trexdm.gdml")
+
+        help_time = best_time(["trexdm.py", "--help"], args.repeat, env)
+        build_time = best_time(["trexdm.py", "--no-cache", "-f", filename], args.repeat, env)
+        print(f"trexdm.py --help:  {help_time:8.3f} s")
+        print(f"trexdm.py (build): {build_time:8.3f} s")
+
+        for meshing in ([False, True] if args.meshing else [False]):
+            _, stdout, _ = run_python(["-c", PHASES_SCRIPT.format(meshing=meshing, filename=filename)], env)
+            import_time, build_phase, write_phase = (float(value) for value in stdout.split()[-3:])
+            print(f"\nBuild phases (meshing {'on' if meshing else 'off'}):")
+            print(f"    import pyg4ometry: {import_time:8.3f} s")
+            print(f"    build_detector:    {build_phase:8.3f} s")
+            print(f"    GDML write:        {write_phase:8.3f} s")
+
+        _, _, stderr = run_python(["-X", "importtime", "trexdm.py", "--no-cache", "-f", filename], env)
+        packages = parse_importtime(stderr)
+        print(f"\nImport time of the build by package (total {sum(t for _, t in packages):.3f} s):")
+        for package, import_time in packages[:args.top]:
+            print(f"    {import_time:8.3f} s  {package}")
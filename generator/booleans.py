@@ -0,0 +1,566 @@
+import argparse
+import sys
+
+# Analysis of the boolean solids (union, subtraction, intersection, multi-union) of a registry.
+# Geant4 evaluates a boolean solid by evaluating both operands at every node, transforming the point into the frame
+# of the second one, so deep chains of booleans are expensive to navigate.
+
+BOOLEAN_TYPES = ("Union", "Subtraction", "Intersection")
+
+def get_operands(solid):
+    """
+    Returns the list of operand solids of a boolean solid, an empty list for a primitive solid.
+    """
+    if solid.type in BOOLEAN_TYPES:
+        operands = [solid.obj1, solid.obj2]
+    elif solid.type == "MultiUnion":
+        operands = solid.objects
+    else:
+        return []
+    # boolean operands may be given by name
+    return [solid.registry.solidDict[operand] if isinstance(operand, str) else operand for operand in operands]
+
+def analyse_solid(solid, results=None):
+    """
+    Returns a dictionary with the boolean statistics of solid:
+    depth: number of nested boolean solids, 0 for a primitive solid.
+    booleans: number of boolean nodes of the tree.
+    primitives: number of primitive solids of the tree (a primitive used twice counts twice).
+    cost: estimated navigation cost, the number of primitive evaluations weighted by the number of boolean
+    nodes (point transformations) above each of them. A chain of n unions costs ~n^2/2, a multi-union of n solids ~2n.
+    param results: Optional dictionary {solid name: statistics} used to reuse the statistics of shared subtrees.
+    """
+    if results is None:
+        results = {}
+    if solid.name in results:
+        return results[solid.name]
+    operands = get_operands(solid)
+    if not operands:
+        stats = {"depth": 0, "booleans": 0, "primitives": 1, "cost": 1}
+    else:
+        operand_stats = [analyse_solid(operand, results) for operand in operands]
+        primitives = sum(s["primitives"] for s in operand_stats)
+        stats = {
+            "depth": 1 + max(s["depth"] for s in operand_stats),
+            "booleans": 1 + sum(s["booleans"] for s in operand_stats),
+            "primitives": primitives,
+            # every primitive below this node pays one more transformation
+            "cost": sum(s["cost"] for s in operand_stats) + primitives,
+        }
+    results[solid.name] = stats
+    return stats
+
+def analyse_registry(registry, used_only=True):
+    """
+    Returns the list of (solid name, statistics) of the solids of the registry, worst (highest cost) first.
+    param used_only: If True, only the solids of logical volumes are listed (their operands are included in their
+    statistics); otherwise every solid of the registry is listed.
+    """
+    results = {}
+    if used_only:
+        solids = {volume.solid.name: volume.solid for volume in registry.logicalVolumeDict.values() if hasattr(volume, "solid")}
+    else:
+        solids = registry.solidDict
+    report = [(name, analyse_solid(solid, results)) for name, solid in solids.items()]
+    return sorted(report, key=lambda item: (item[1]["cost"], item[1]["depth"]), reverse=True)
+
+def check_depth_budget(registry, max_depth):
+    """
+    Raises a ValueError listing the solids of the registry whose boolean depth is larger than max_depth.
+    """
+    offenders = [(name, stats) for name, stats in analyse_registry(registry, used_only=False) if stats["depth"] > max_depth]
+    if offenders:
+        names = ", ".join(f"{name} ({stats['depth']})" for name, stats in offenders)
+        raise ValueError(f"Boolean depth budget of {max_depth} exceeded by {len(offenders)} solids: {names}")
+
+def print_report(report, top=20):
+    """
+    Prints the statistics of the top solids of a report returned by analyse_registry.
+    """
+    print(f"{'solid':<40} {'depth':>6} {'booleans':>9} {'primitives':>11} {'cost':>8}")
+    for name, stats in report[:top]:
+        print(f"{name:<40} {stats['depth']:>6} {stats['booleans']:>9} {stats['primitives']:>11} {stats['cost']:>8}")
+    print(f"{len(report)} solids, total cost {sum(stats['cost'] for _, stats in report)}, max depth {max((stats['depth'] for _, stats in report), default=0)}")
+
+# Transformations are handled as (A, a): a point p in the frame of an operand is at A @ p + a in the frame of the
+# boolean. Booleans rotate their second operand by the rotation matrix given by their Tait-Bryan angles, as Geant4 and
+# pyg4ometry do, unlike placements which rotate the daughter by its inverse (see utils.get_matrix).
+
+def get_transform(rotation, position):
+    """
+    Returns the (A, a) transformation of a boolean operand placed with the given rotation and position.
+    """
+    import pyg4ometry.transformation as tf
+    import numpy as np
+    return tf.tbxyz2matrix(rotation), np.array(position, dtype=float)
+
+def compose(first, second):
+    """
+    Returns the transformation applying second and then first.
+    """
+    return first[0] @ second[0], first[0] @ second[1] + first[1]
+
+def invert(transform):
+    return transform[0].T, -transform[0].T @ transform[1]
+
+def to_rotation_position(transform, tolerance=1e-12):
+    """
+    Returns the [rotation, position] of a boolean operand for the (A, a) transformation, with rounding noise removed.
+    """
+    import pyg4ometry.transformation as tf
+    rotation = [0.0 if abs(angle) < tolerance else float(angle) for angle in tf.matrix2tbxyz(transform[0])]
+    position = [0.0 if abs(x) < tolerance else float(x) for x in transform[1]]
+    return [rotation, position]
+
+def is_identity(transform, tolerance=1e-12):
+    import numpy as np
+    return np.allclose(transform[0], np.eye(3), atol=tolerance) and np.allclose(transform[1], 0, atol=tolerance)
+
+def get_operand_transforms(solid):
+    """
+    Returns the list of (operand solid, (A, a) transformation) of a boolean solid, an empty list for a primitive solid.
+    """
+    import numpy as np
+    identity = (np.eye(3), np.zeros(3))
+    operands = get_operands(solid)
+    if solid.type in BOOLEAN_TYPES:
+        return [(operands[0], identity), (operands[1], get_transform(solid.tra2[0].eval(), solid.tra2[1].eval()))]
+    if solid.type == "MultiUnion":
+        return [(operand, get_transform(t[0].eval(), t[1].eval())) for operand, t in zip(operands, solid.transformations)]
+    return []
+
+def check_equivalence(solid, other, n_points=20000, seed=0):
+    """
+    Samples n_points random points in the extent of both solids and returns the number of points that are inside
+    one solid and outside the other (0 for equivalent solids).
+    """
+    import numpy as np
+    import sampling
+    low_a, high_a = sampling.get_extent(solid)
+    low_b, high_b = sampling.get_extent(other)
+    low, high = np.minimum(low_a, low_b), np.maximum(high_a, high_b)
+    points = np.random.default_rng(seed).uniform(low, high, size=(n_points, 3))
+    return int(np.count_nonzero(sampling.inside(solid, points) != sampling.inside(other, points)))
+
+def get_union_leaves(solid, transform=None, users=None):
+    """
+    Returns the list of (solid, transformation) of the operands of a tree of unions and multi-unions that are not
+    unions themselves, with their transformations relative to solid.
+    param users: Optional dictionary with the number of users of each solid (see get_users). Unions with more than
+    one user are kept as leaves, so that their operands are not duplicated.
+    """
+    import numpy as np
+    if transform is None:
+        transform = (np.eye(3), np.zeros(3))
+    leaves = []
+    for operand, operand_transform in get_operand_transforms(solid):
+        operand_transform = compose(transform, operand_transform)
+        if operand.type in ("Union", "MultiUnion") and (users is None or users.get(operand.name, 0) <= 1):
+            leaves.extend(get_union_leaves(operand, operand_transform, users))
+        else:
+            leaves.append((operand, operand_transform))
+    return leaves
+
+def get_users(registry):
+    """
+    Returns a dictionary with the number of logical volumes and boolean solids using each solid of the registry.
+    """
+    users = {}
+    solids = [volume.solid for volume in registry.logicalVolumeDict.values() if hasattr(volume, "solid")]
+    for solid in solids:
+        users[solid.name] = users.get(solid.name, 0) + 1
+    for solid in registry.solidDict.values():
+        for operand in get_operands(solid):
+            users[operand.name] = users.get(operand.name, 0) + 1
+    return users
+
+def make_union(name, leaves, registry, mode="multiunion"):
+    """
+    Creates a solid with the union of leaves, a list of (solid, transformation).
+    param mode: "multiunion" for a single G4MultiUnion, "balanced" for a balanced tree of unions.
+    Returns the tuple (solid, transformation of the solid). A balanced tree is built in the frame of the first leaf.
+    """
+    from pyg4ometry import geant4 as g4
+    import numpy as np
+    if mode == "balanced":
+        nodes = []
+        def build(group):
+            # a group of unions is built in the frame of its first leaf
+            if len(group) == 1:
+                return group[0]
+            left_solid, left_transform = build(group[:len(group)//2])
+            right_solid, right_transform = build(group[len(group)//2:])
+            nodes.append(None)
+            node = g4.solid.Union(
+                name=name if len(nodes) == len(leaves) - 1 else f"{name}_node{len(nodes)}",
+                obj1=left_solid,
+                obj2=right_solid,
+                tra2=to_rotation_position(compose(invert(left_transform), right_transform)),
+                registry=registry
+            )
+            return node, left_transform
+        return build(leaves)
+    if mode != "multiunion":
+        raise ValueError("Invalid union mode. Choose either 'multiunion' or 'balanced'.")
+    solid = g4.solid.MultiUnion(
+        name=name,
+        objects=[leaf for leaf, _ in leaves],
+        transformations=[to_rotation_position(transform) for _, transform in leaves],
+        registry=registry
+    )
+    return solid, (np.eye(3), np.zeros(3))
+
+def get_reachable_solids(registry):
+    """
+    Returns the set of names of the solids used by the logical volumes of the registry, directly or as operands.
+    """
+    reachable = set()
+    pending = [volume.solid for volume in registry.logicalVolumeDict.values() if hasattr(volume, "solid")]
+    while pending:
+        solid = pending.pop()
+        if solid.name in reachable:
+            continue
+        reachable.add(solid.name)
+        pending.extend(get_operands(solid))
+    return reachable
+
+def flatten_booleans(registry, mode="multiunion", min_operands=3, hoist_subtractions=True, verify=False, n_points=20000):
+    """
+    Rewrites the boolean solids of the logical volumes of the registry to reduce their depth, keeping their shape and name.
+    Trees of unions with at least min_operands operands become a single multi-union (or a balanced tree of unions,
+    see make_union). Chains of subtractions A - B1 - B2 ... - Bn with at least min_operands subtracted solids become
+    A - (B1 + B2 ... + Bn), with the subtracted solids in a multi-union (or balanced tree) named <name>_subtracted.
+    Unions and subtractions used by more than one solid or volume are kept, so that nothing is duplicated.
+    The intermediate solids of the rewritten chains are removed from the registry if nothing else uses them.
+    param verify: If True, every rewritten solid is compared with the original one by point sampling
+    (see check_equivalence) and a ValueError is raised if they differ.
+    Returns the list of (solid name, statistics before, statistics after), see analyse_solid.
+    """
+    from pyg4ometry import geant4 as g4
+
+    rebuilt = {}
+    intermediate = set()
+    report = []
+    users = get_users(registry)
+
+    def rebuild(solid):
+        if solid.name in rebuilt:
+            return rebuilt[solid.name]
+        rebuilt[solid.name] = solid
+        operands = get_operands(solid)
+        if not operands:
+            return solid
+
+        new_solid = None
+        if solid.type in ("Union", "MultiUnion"):
+            leaves = get_union_leaves(solid, users=users)
+            if len(leaves) >= min_operands:
+                intermediate.update(get_tree_names(solid, users))
+                leaves = [(rebuild(leaf), transform) for leaf, transform in leaves]
+                # the new solid takes the name of the old one. A balanced tree is built in the frame of its
+                # first leaf, which is the frame of the solid only if that leaf is not transformed.
+                del registry.solidDict[solid.name]
+                union_mode = mode if is_identity(leaves[0][1]) else "multiunion"
+                new_solid = make_union(solid.name, leaves, registry, union_mode)[0]
+        elif solid.type == "Subtraction" and hoist_subtractions:
+            # walk down the chain of subtractions, stopping at solids used elsewhere
+            base = solid
+            chain = set()
+            subtracted = []
+            while base.type == "Subtraction" and (base is solid or users.get(base.name, 0) <= 1):
+                chain.add(base.name)
+                (base, _), (operand, transform) = get_operand_transforms(base)
+                if operand.type in ("Union", "MultiUnion") and users.get(operand.name, 0) <= 1:
+                    chain.update(get_tree_names(operand, users))
+                    subtracted = get_union_leaves(operand, transform, users) + subtracted
+                else:
+                    subtracted = [(operand, transform)] + subtracted
+            if len(subtracted) >= min_operands:
+                intermediate.update(chain)
+                base = rebuild(base)
+                subtracted = [(rebuild(leaf), transform) for leaf, transform in subtracted]
+                subtracted_solid, transform = make_union(f"{solid.name}_subtracted", subtracted, registry, mode)
+                del registry.solidDict[solid.name]
+                new_solid = g4.solid.Subtraction(
+                    name=solid.name,
+                    obj1=base,
+                    obj2=subtracted_solid,
+                    tra2=to_rotation_position(transform),
+                    registry=registry
+                )
+
+        if new_solid is None:
+            # the solid is kept, but its operands may have been rewritten
+            if solid.type == "MultiUnion":
+                solid.objects = [rebuild(operand) for operand in operands]
+            else:
+                solid.obj1, solid.obj2 = (rebuild(operand) for operand in operands)
+            return solid
+
+        if verify:
+            mismatches = check_equivalence(solid, new_solid, n_points=n_points)
+            if mismatches:
+                raise ValueError(f"Flattened solid {solid.name} differs from the original in {mismatches} of {n_points} sampled points.")
+        report.append((solid.name, analyse_solid(solid), analyse_solid(new_solid)))
+        rebuilt[solid.name] = new_solid
+        return new_solid
+
+    for volume in list(registry.logicalVolumeDict.values()):
+        if hasattr(volume, "solid"):
+            volume.solid = rebuild(volume.solid)
+
+    # remove the intermediate solids of the rewritten chains that nothing uses anymore
+    reachable = get_reachable_solids(registry)
+    for name in intermediate - reachable:
+        registry.solidDict.pop(name, None)
+    return report
+
+def get_tree_names(solid, users):
+    """
+    Returns the names of the unions of the tree of solid (solid included) that get_union_leaves inlines.
+    """
+    names = {solid.name}
+    for operand in get_operands(solid):
+        if operand.type in ("Union", "MultiUnion") and users.get(operand.name, 0) <= 1:
+            names |= get_tree_names(operand, users)
+    return names
+
+def print_flatten_report(report):
+    """
+    Prints the depth and cost of the solids rewritten by flatten_booleans.
+    """
+    print(f"{'solid':<40} {'depth':>13} {'cost':>15}")
+    for name, before, after in report:
+        print(f"{name:<40} {before['depth']:>6} -> {after['depth']:<4} {before['cost']:>7} -> {after['cost']:<5}")
+
+# Hollow frames: a box with an axis aligned box shaped hole going through its whole thickness along z. A square frame
+# with a centred square hole is a 4 sided polyhedra (its inner and outer radii are the distances to the sides), any
+# other frame is the union of up to 4 bars around the hole. A frame trimmed by an intersection, (A * X) - B, is the
+# frame intersected with the same solid, (A - B) * X.
+
+def get_frame(solid, tolerance=1e-9):
+    """
+    Returns the tuple (half lengths of the outer box, lower corner, upper corner of the hole, trim) in mm of a frame,
+    a subtraction of a box from a box with the hole going through along z, or None if solid is not a frame. The corners
+    of the hole are (x, y) arrays clipped to the outer box. If the outer box is intersected with another solid before
+    the subtraction, trim is the (solid, transformation) of that solid, otherwise None.
+    """
+    import numpy as np
+    if solid.type != "Subtraction":
+        return None
+    (outer, _), (hole, (A, a)) = get_operand_transforms(solid)
+    trim = None
+    if outer.type == "Intersection":
+        (outer, outer_transform), trim = get_operand_transforms(outer)
+        if not is_identity(outer_transform):
+            return None
+    if outer.type != "Box" or hole.type != "Box":
+        return None
+    # the hole may be rotated by multiples of 90 degrees, which keeps it axis aligned
+    if not np.allclose(np.abs(A).sum(axis=0), 1, atol=tolerance) or not np.allclose(np.abs(A), np.round(np.abs(A)), atol=tolerance):
+        return None
+    half = np.array([outer.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ")]) / 2
+    hole_half = np.abs(A) @ (np.array([hole.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ")]) / 2)
+    if a[2] - hole_half[2] > -half[2] + tolerance or a[2] + hole_half[2] < half[2] - tolerance:
+        return None
+    low = np.maximum(a[:2] - hole_half[:2], -half[:2])
+    high = np.minimum(a[:2] + hole_half[:2], half[:2])
+    # an empty hole, or a hole taking the whole box
+    if np.any(high - low <= tolerance) or (np.all(low <= -half[:2] + tolerance) and np.all(high >= half[:2] - tolerance)):
+        return None
+    return half, low, high, trim
+
+def is_square_frame(half, low, high, tolerance=1e-9):
+    """
+    Returns True for a frame given by get_frame that is square with a centred square hole.
+    """
+    import numpy as np
+    return (np.allclose(low + high, 0, atol=tolerance) and abs(half[0] - half[1]) <= tolerance
+            and abs((high[0] - low[0]) - (high[1] - low[1])) <= tolerance)
+
+def make_frame(name, half, low, high, registry, tolerance=1e-9):
+    """
+    Creates the solid of a frame given by get_frame: a Polyhedra for a square frame with a centred square hole,
+    otherwise a multi-union of the bars around the hole.
+    """
+    from pyg4ometry import geant4 as g4
+    import numpy as np
+    if is_square_frame(half, low, high, tolerance):
+        hole_half, outer_half, thickness = float(high[0] - low[0]) / 2, float(half[0]), float(half[2])
+        return g4.solid.Polyhedra(
+            name=name,
+            pSPhi=45,
+            pDPhi=360,
+            numSide=4,
+            numZPlanes=2,
+            zPlane=[-thickness, thickness],
+            rInner=[hole_half, hole_half],
+            rOuter=[outer_half, outer_half],
+            registry=registry,
+            lunit="mm",
+            aunit="deg"
+        )
+    # bars below and above the hole along y take the whole width, the bars on its sides the height of the hole
+    bars = [
+        ((-half[0], -half[1]), (half[0], low[1])),
+        ((-half[0], high[1]), (half[0], half[1])),
+        ((-half[0], low[1]), (low[0], high[1])),
+        ((high[0], low[1]), (half[0], high[1])),
+    ]
+    bars = [(np.array(bar_low), np.array(bar_high)) for bar_low, bar_high in bars]
+    bars = [(bar_low, bar_high) for bar_low, bar_high in bars if np.all(bar_high - bar_low > tolerance)]
+    leaves = []
+    for i, (bar_low, bar_high) in enumerate(bars):
+        size = [float(length) for length in bar_high - bar_low]
+        box = g4.solid.Box(name=f"{name}_bar{i}", pX=size[0], pY=size[1], pZ=float(2*half[2]), registry=registry, lunit="mm")
+        leaves.append((box, (np.eye(3), np.append((bar_low + bar_high) / 2, 0))))
+    return make_union(name, leaves, registry)[0]
+
+def time_inside(solid, points, repeat=3):
+    """
+    Returns the best time in seconds per point of the point containment test of solid (see sampling.inside).
+    """
+    import time
+    import sampling
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sampling.inside(solid, points)
+        times.append(time.perf_counter() - start)
+    return min(times) / len(points)
+
+def simplify_frames(registry, rectangular=False, verify=False, measure=False, n_points=20000):
+    """
+    Rewrites the frames of the registry (box minus box with a through hole, see get_frame) as a single Polyhedra when
+    they are square with a centred square hole, keeping their shape and name. With rectangular, the other frames
+    become a multi-union of the bars around the hole. Trimmed frames become the intersection of the new frame, named
+    <name>_frame, with the trimming solid.
+    The solids of the rewritten frames are removed from the registry if nothing else uses them.
+    param verify: If True, every rewritten solid is compared with the original one by point sampling
+    (see check_equivalence) and a ValueError is raised if they differ.
+    param measure: If True, the time per point of the containment test of the original and new solids is measured
+    with n_points points in their extent and added to their statistics as "time" (in seconds).
+    Returns the list of (solid name, statistics before, statistics after), see analyse_solid.
+    """
+    from pyg4ometry import geant4 as g4
+    import numpy as np
+    import sampling
+
+    rebuilt = {}
+    intermediate = set()
+    report = []
+
+    def rebuild(solid):
+        if solid.name in rebuilt:
+            return rebuilt[solid.name]
+        rebuilt[solid.name] = solid
+        operands = get_operands(solid)
+        if not operands:
+            return solid
+
+        new_solid = None
+        frame = get_frame(solid)
+        if frame is not None and (rectangular or is_square_frame(*frame[:3])):
+            half, low, high, trim = frame
+            # the new solid takes the name of the old one
+            del registry.solidDict[solid.name]
+            if trim is None:
+                new_solid = make_frame(solid.name, half, low, high, registry)
+            else:
+                trim_solid, trim_transform = trim
+                new_solid = g4.solid.Intersection(
+                    name=solid.name,
+                    obj1=make_frame(f"{solid.name}_frame", half, low, high, registry),
+                    obj2=rebuild(trim_solid),
+                    tra2=to_rotation_position(trim_transform),
+                    registry=registry
+                )
+
+        if new_solid is None:
+            # the solid is kept, but its operands may have been rewritten
+            if solid.type == "MultiUnion":
+                solid.objects = [rebuild(operand) for operand in operands]
+            else:
+                solid.obj1, solid.obj2 = (rebuild(operand) for operand in operands)
+            return solid
+
+        pending = list(operands)
+        while pending:
+            operand = pending.pop()
+            intermediate.add(operand.name)
+            pending.extend(get_operands(operand))
+        if verify:
+            mismatches = check_equivalence(solid, new_solid, n_points=n_points)
+            if mismatches:
+                raise ValueError(f"Frame {solid.name} differs from the original in {mismatches} of {n_points} sampled points.")
+        before, after = dict(analyse_solid(solid)), dict(analyse_solid(new_solid))
+        if measure:
+            low, high = sampling.get_extent(solid)
+            points = np.random.default_rng(0).uniform(low, high, size=(n_points, 3))
+            before["time"], after["time"] = time_inside(solid, points), time_inside(new_solid, points)
+        report.append((solid.name, before, after))
+        rebuilt[solid.name] = new_solid
+        return new_solid
+
+    for volume in list(registry.logicalVolumeDict.values()):
+        if hasattr(volume, "solid"):
+            volume.solid = rebuild(volume.solid)
+
+    # remove the boxes of the rewritten frames that nothing uses anymore
+    reachable = get_reachable_solids(registry)
+    for name in intermediate - reachable:
+        registry.solidDict.pop(name, None)
+    return report
+
+def print_frames_report(report):
+    """
+    Prints the cost, and the measured time per point if any, of the frames rewritten by simplify_frames.
+    """
+    print(f"{'frame':<40} {'cost':>15} {'time per point (ns)':>25}")
+    for name, before, after in report:
+        time = f"{before['time']*1e9:>10.1f} -> {after['time']*1e9:<8.1f}" if "time" in before else ""
+        print(f"{name:<40} {before['cost']:>7} -> {after['cost']:<5} {time:>25}")
+    if report and "time" in report[0][1]:
+        before, after = (sum(stats[i]["time"] for stats in report) for i in (1, 2))
+        print(f"{len(report)} frames, total time per point {before*1e9:.1f} ns -> {after*1e9:.1f} ns ({after/before:.2f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the boolean depth, primitive count and estimated navigation cost of the solids of a geometry.")
+    parser.add_argument("files", nargs="*", help="GDML files to analyse. Defaults to building the default trexdm configuration.")
+    parser.add_argument("--top", type=int, default=20, help="Number of solids listed, worst first")
+    parser.add_argument("--all-solids", action="store_true", default=False, help="List every solid, not only the solids of logical volumes")
+    parser.add_argument("--max-depth", type=int, default=None, help="Exit with an error if any solid has a larger boolean depth")
+    parser.add_argument("--flatten", choices=["multiunion", "balanced"], default=None, help="Flatten the boolean chains first (see flatten_booleans)")
+    parser.add_argument("--frames", action="store_true", default=False, help="Rewrite the square box minus box frames as polyhedra first, reporting the measured time per point (see simplify_frames)")
+    parser.add_argument("--rectangular-frames", action="store_true", default=False, help="With --frames, also rewrite the other frames as multi-unions of bars")
+    parser.add_argument("--verify", action="store_true", default=False, help="Check every flattened solid or frame against the original one by point sampling")
+    parser.add_argument("--points", type=int, default=20000, help="Number of sampled points of the equivalence check")
+    args = parser.parse_args()
+
+    import pyg4ometry
+
+    registries = []
+    if args.files:
+        for filename in args.files:
+            registries.append((filename, pyg4ometry.gdml.Reader(filename).getRegistry()))
+    else:
+        import trexdm
+        pyg4ometry.config.doMeshing = False
+        registries.append(("trexdm (default configuration)", trexdm.build_detector()))
+
+    failed = False
+    for label, reg in registries:
+        print(f"=== {label} ===")
+        if args.frames:
+            print_frames_report(simplify_frames(reg, rectangular=args.rectangular_frames, verify=args.verify, measure=True, n_points=args.points))
+        if args.flatten:
+            print_flatten_report(flatten_booleans(reg, mode=args.flatten, verify=args.verify, n_points=args.points))
+        print_report(analyse_registry(reg, used_only=not args.all_solids), top=args.top)
+        if args.max_depth is not None:
+            try:
+                check_depth_budget(reg, args.max_depth)
+            except ValueError as error:
+                print(error)
+                failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,99 @@
+import ast
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+from importlib import metadata
+
+# This module must stay light: it is imported before pyg4ometry so that a cache hit
+# never pays for building (or even importing) the geometry machinery.
+
+GENERATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_MODULES = ["vessel", "shielding", "gem", "micromegas", "fieldcage", "materials", "utils", "booleans", "sampling", "envelopes", "writer"]
+
+CACHE_DIR = os.environ.get("TREXDM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "trexdm-geometry"))
+
+def module_digest(module_name):
+    """
+    Returns a digest of the top level statements of a generator module (dimension constants and builder code).
+    The module is parsed, not imported, and the digest does not change with comments or formatting.
+    param module_name: Name of the module in the generator directory, without the .py extension.
+    """
+    with open(os.path.join(GENERATOR_DIR, module_name + ".py")) as f:
+        tree = ast.parse(f.read())
+    digest = hashlib.sha256()
+    for node in tree.body:
+        digest.update(ast.dump(node, include_attributes=False).encode())
+    return digest.hexdigest()
+
+def config_key(config, modules=None):
+    """
+    Returns the cache key of a detector configuration.
+    The key covers the configuration values, the digest of every generator module and the pyg4ometry version,
+    so changing any dimension constant invalidates the cached geometries built from it.
+    param config: Dictionary with the configuration parameters (gas, cathode type, calibration flags...).
+    param modules: Names of the modules the build depends on. Defaults to GENERATOR_MODULES.
+    """
+    if modules is None:
+        modules = GENERATOR_MODULES
+    try:
+        pyg4ometry_version = metadata.version("pyg4ometry")
+    except metadata.PackageNotFoundError:
+        pyg4ometry_version = "unknown"
+    content = {
+        "config": config,
+        "modules": {name: module_digest(name) for name in sorted(modules)},
+        "pyg4ometry": pyg4ometry_version,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+def cached_path(key, suffix="", cache_dir=None, extension=".gdml"):
+    """
+    Returns the path of the cached GDML file for the given key.
+    param suffix: Suffix of the variant of the file, e.g. "_noDaughters".
+    param extension: Extension of the file, ".gdml" or a compressed one such as ".gdml.gz".
+    """
+    return os.path.join(cache_dir or CACHE_DIR, f"{key}{suffix}{extension}")
+
+def contains(key, suffix="", cache_dir=None, extension=".gdml"):
+    """
+    Returns True if the cache holds a GDML file for the given key.
+    """
+    return os.path.isfile(cached_path(key, suffix, cache_dir, extension))
+
+def fetch(key, filename, suffix="", cache_dir=None, extension=".gdml"):
+    """
+    Copies the cached GDML file for the given key to filename, unless filename already has the same content (so its
+    modification time is kept).
+    Returns True on a cache hit, False otherwise.
+    """
+    path = cached_path(key, suffix, cache_dir, extension)
+    if not os.path.isfile(path):
+        return False
+    if os.path.abspath(path) != os.path.abspath(filename) and not (os.path.isfile(filename) and filecmp.cmp(path, filename, shallow=False)):
+        shutil.copyfile(path, filename)
+    return True
+
+def store(key, filename, suffix="", cache_dir=None, extension=".gdml"):
+    """
+    Stores the GDML file filename in the cache under the given key.
+    The file is copied to a temporary name first so that concurrent builds never see a partial file.
+    """
+    path = cached_path(key, suffix, cache_dir, extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(filename, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def load_registry(key, suffix="", cache_dir=None, extension=".gdml"):
+    """
+    Reads the cached GDML file for the given key back into a pyg4ometry Registry.
+    Raises KeyError if the key is not in the cache.
+    """
+    path = cached_path(key, suffix, cache_dir, extension)
+    if not os.path.isfile(path):
+        raise KeyError(f"Geometry with key '{key}' not found in cache '{cache_dir or CACHE_DIR}'.")
+    import writer
+    return writer.read_registry(path)
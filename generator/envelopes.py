@@ -0,0 +1,204 @@
+import argparse
+import fnmatch
+import sys
+import time
+
+import numpy as np
+
+# Levels of detail of the assemblies, from the most to the least detailed:
+# full: every part as designed.
+# reduced: the thin laminates collapsed into single volumes (see materials.get_laminate_material).
+# envelope: every assembly is replaced by a few envelopes, volumes of simple shape made of a mixture with the mass of
+# every material of the parts they stand for, e.g. for shielding studies far from the gas. The gas volumes are kept.
+LEVELS = ("full", "reduced", "envelope")
+
+# Largest relative deviation of the mass of each material from the full level (see check_masses), for the default
+# number of Monte Carlo points per solid (200000) or more. The masses are estimated from the Monte Carlo volumes of
+# the solids, whose statistical errors reach a few 0.1% for the thin layers, and the collapsed Micromegas board
+# weighs its copper foils with the board area estimated the same way. The envelopes do not keep the gas between the
+# parts, so the gases are not checked there.
+MASS_TOLERANCES = {"reduced": 0.01, "envelope": 0.02}
+
+def check_level(lod):
+    """
+    Raises a ValueError if lod is not one of LEVELS.
+    """
+    if lod not in LEVELS:
+        raise ValueError(f"Invalid level of detail '{lod}'. Choose one of {', '.join(LEVELS)}.")
+
+def get_masses(volume, registry, masses=None, volumes=None, n_points=200000, seed=0):
+    """
+    Returns the dictionary {material name: mass in g} of a logical or assembly volume and every volume below it. The
+    material of a volume fills its solid minus its daughters (see sampling.get_volume).
+    param masses: Optional dictionary the masses are added to.
+    param volumes: Optional dictionary {solid name: volume in mm3} of the solids already measured, reused between calls.
+    """
+    import materials
+    import sampling
+
+    if masses is None:
+        masses = {}
+    if volumes is None:
+        volumes = {}
+
+    def get_volume(solid):
+        if solid.name not in volumes:
+            volumes[solid.name] = sampling.get_volume(solid, n_points=n_points, seed=seed)
+        return volumes[solid.name]
+
+    daughters = sampling.get_daughter_volumes(volume)
+    if hasattr(volume, "solid"):
+        own_volume = get_volume(volume.solid) - sum(get_volume(logical.solid) for _, logical, _ in daughters)
+        material = materials.get_library_name(volume.material, registry)
+        masses[material] = masses.get(material, 0) + own_volume*1e-3*materials.get_density(material, registry)
+    for _, logical, _ in daughters:
+        get_masses(logical, registry, masses, volumes, n_points, seed)
+    return masses
+
+def make_envelopes(assembly, envelopes, registry, n_points=200000):
+    """
+    Replaces daughters of an assembly volume by envelopes made of a mixture with the mass of every material of the
+    daughters they stand for (see materials.get_mixture_material). The envelopes must not overlap the daughters kept
+    next to them.
+    param envelopes: List of (name, solid, rotation, position, patterns): the envelope is placed at rotation, position
+    and stands for the daughters whose name matches one of the glob patterns. A daughter goes to the first envelope
+    matching it, the daughters matched by none are kept.
+    Returns the dictionary {envelope name: masses {material name: mass in g}}.
+    """
+    from pyg4ometry import geant4 as g4
+    import materials
+    import sampling
+    import utils
+
+    volumes = {}
+    daughters = list(assembly.daughterVolumes)
+    result = {}
+    for name, solid, rotation, position, patterns in envelopes:
+        absorbed = [physical for physical in daughters if any(fnmatch.fnmatchcase(physical.name, pattern) for pattern in patterns)]
+        if not absorbed:
+            raise ValueError(f"Envelope '{name}' of {assembly.name} does not stand for any daughter.")
+        masses = {}
+        for physical in absorbed:
+            get_masses(physical.logicalVolume, registry, masses, volumes, n_points)
+            utils.remove_physical_volume(physical, registry)
+            daughters.remove(physical)
+        material = materials.get_mixture_material(f"{name}Mixture", masses, sampling.get_volume(solid, n_points=n_points), registry)
+        logical = g4.LogicalVolume(solid, material, f"{name}_LV", registry)
+        g4.PhysicalVolume(rotation, position, logical, name, assembly, registry)
+        result[name] = masses
+    return result
+
+def count_volumes(volume):
+    """
+    Returns the number of volumes placed below a logical volume, with the daughters of assembly volumes placed
+    directly, as Geant4 does.
+    """
+    import utils
+    return sum(1 + count_volumes(physical.logicalVolume) for physical, _, _ in utils.get_placements(volume))
+
+def report_level(registry, n_points=200000, seed=1, locate_points=None):
+    """
+    Returns a dictionary with the size of the geometry of registry: number of placed volumes, logical volumes and
+    boolean nodes of their solids, the mass in g of each material (mixtures split into the materials they are made
+    of, see materials.get_mass_fractions), the names of the gases among them and, if locate_points are given, the
+    time in seconds to find the material at those points (see sampling.get_materials), a proxy of the navigation time.
+    """
+    import booleans
+    import materials
+    import sampling
+    import utils
+
+    world = registry.getWorldVolume()
+    logical_volumes = [volume for volume in utils.get_subtree_volumes(world).values() if volume.type == "logical"]
+    results = {}
+    report = {
+        "volumes": count_volumes(world),
+        "logical_volumes": len(logical_volumes),
+        "booleans": sum(booleans.analyse_solid(volume.solid, results)["booleans"] for volume in logical_volumes),
+        "masses": {},
+    }
+    for name, mass in get_masses(world, registry, n_points=n_points, seed=seed).items():
+        for material, fraction in materials.get_mass_fractions(name, registry).items():
+            report["masses"][material] = report["masses"].get(material, 0) + mass*fraction
+    report["gases"] = sorted(name for name in report["masses"] if getattr(materials.get_material(name, registry), "state", None) == "gas")
+    if locate_points is not None:
+        start = time.perf_counter()
+        sampling.get_materials(world, locate_points)
+        report["locate_time"] = time.perf_counter() - start
+    return report
+
+def check_masses(reports, tolerances=MASS_TOLERANCES):
+    """
+    Returns the list of (level, material name, relative deviation) of the masses of the reports {level: report_level
+    result} that deviate from the full level by more than the tolerance of their level (see MASS_TOLERANCES).
+    """
+    reference = reports["full"]["masses"]
+    failures = []
+    for level, report in reports.items():
+        if level not in tolerances:
+            continue
+        for name, reference_mass in reference.items():
+            if reference_mass == 0 or (level == "envelope" and name in report["gases"]):
+                continue
+            deviation = report["masses"].get(name, 0)/reference_mass - 1
+            if abs(deviation) > tolerances[level]:
+                failures.append((level, name, deviation))
+    return failures
+
+def print_report(reports):
+    """
+    Prints the reports {level: report_level result} side by side, with the deviation of the mass of each material
+    from the first level.
+    """
+    levels = list(reports)
+    reference = reports[levels[0]]
+    print(f"{'':24} " + " ".join(f"{level:>18}" for level in levels))
+    for key, label in (("volumes", "placed volumes"), ("logical_volumes", "logical volumes"), ("booleans", "boolean nodes")):
+        print(f"{label:24} " + " ".join(f"{reports[level][key]:>18}" for level in levels))
+    if all("locate_time" in report for report in reports.values()):
+        print(f"{'locate time (s)':24} " + " ".join(f"{reports[level]['locate_time']:>18.3f}" for level in levels))
+    print("mass (kg), deviation from " + levels[0])
+    names = sorted(set().union(*(report["masses"] for report in reports.values())), key=lambda name: -reference["masses"].get(name, 0))
+    for name in names:
+        cells = []
+        for level in levels:
+            mass = reports[level]["masses"].get(name, 0)
+            reference_mass = reference["masses"].get(name, 0)
+            if level == levels[0] or reference_mass == 0:
+                cells.append(f"{mass/1e3:>18.4g}")
+            else:
+                cells.append(f"{mass/1e3:>10.4g} {100*(mass/reference_mass - 1):>+6.2f}%")
+        print(f"{name:24} " + " ".join(cells))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the size, the navigation time and the mass of each material of the detector at every level of detail.")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--points", type=int, default=200000, help="Monte Carlo points per solid for the masses (default: %(default)s)")
+    parser.add_argument("--locate-points", type=int, default=20000, help="Random points in the inner gas whose material is looked up (default: %(default)s)")
+    parser.add_argument("--check", action="store_true", default=False, help="Fail if the mass of a material deviates from the full level by more than MASS_TOLERANCES")
+    args = parser.parse_args()
+    if args.check and "full" not in args.levels:
+        parser.error("--check needs the full level")
+
+    import pyg4ometry
+    import sampling
+    import trexdm
+
+    pyg4ometry.config.doMeshing = False
+    reports = {}
+    points = None
+    for level in args.levels:
+        registry = trexdm.build_detector({"lod": level})
+        if points is None:
+            # the same points in the extent of the inner gas for every level
+            low, high = sampling.get_extent(registry.logicalVolumeDict["gas_LV"].solid)
+            points = np.random.default_rng(0).uniform(low, high, size=(args.locate_points, 3))
+        reports[level] = report_level(registry, n_points=args.points, locate_points=points)
+    print_report(reports)
+    if args.check:
+        failures = check_masses(reports)
+        for level, name, deviation in failures:
+            print(f"{level}: the mass of {name} deviates by {100*deviation:+.2f}%, more than {100*MASS_TOLERANCES[level]:.1f}%")
+        if failures:
+            sys.exit(1)
+        print("Masses within " + ", ".join(f"{100*MASS_TOLERANCES[level]:.1f}% ({level})" for level in reports if level in MASS_TOLERANCES) + " of the full level")
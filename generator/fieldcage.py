@@ -1,8 +1,9 @@
-import vtk
 import pyg4ometry
 from pyg4ometry import geant4 as g4
 from pyg4ometry import transformation as tf
 import numpy as np
+import envelopes
+import materials
 import utils
 
 cathodeLength = 206 # mm
@@ -118,10 +119,99 @@ handleSlotWidth = 20
 vacuumCylinderLength = 45 # this is to much, as it extrudes the gas volume
 vacuumCylinderRadius = 20 # mm
 
-def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathode_type="wired"):
+fieldcageEnvelopeRadius = 187.0 # mm, same as the Micromegas base (micromegas.mMBaseRadius)
+fieldcageEnvelopeHoleLength = 250.0 # mm, side of the drift gas volumes (micromegas.mMLength)
+cathodeEnvelopeThickness = sideSeparatorThickness # mm, the drift gas volumes start on both sides of it
+
+# How the wires of the wired cathode are built:
+# "union": a chain of nested unions (cathodeWireX1...cathodeWiredFull), one level per wire
+# "multiunion": a single multi-union solid (cathodeWiredFull) holding every wire
+# "placements": one physical volume of the single wire volume per wire, no boolean at all
+CATHODE_WIRES_MODES = ("union", "multiunion", "placements")
+
+def get_cathode_wired_placement():
+    """
+    Returns the (rotation, position) of the wired cathode solid (cathodeWiredFull) in the field cage assembly frame.
+    """
+    first_wire_distance_to_frame = (cathodeWireLength - (cathodeWireNumber-1)*cathodeDistanceBetweenWires) / 2
+    return [90*np.pi/180, 0, 0], [-cathodeWireLength/2+first_wire_distance_to_frame, 0, cathodeWireRadius]
+
+def get_cathode_wire_transforms(assembly_frame=False):
+    """
+    Returns the list of (name, rotation, position) of every wire of the wired cathode.
+    The transforms are the ones of the wires inside the cathodeWiredFull solid, or the ones of the wires in the field
+    cage assembly frame if assembly_frame is True.
+    """
+    first_wire_distance_to_frame = (cathodeWireLength - (cathodeWireNumber-1)*cathodeDistanceBetweenWires) / 2
+    z_shift = cathodeWireRadius*2 # to avoid overlap between x wires and y wires
+    transforms = []
+    for i in range(cathodeWireNumber):
+        transforms.append((f"cathodeWireX{i+1}", [0, 0, 0], [i * cathodeDistanceBetweenWires, 0, 0]))
+    for i in range(cathodeWireNumber):
+        wire_position = cathodeWireLength/2 - first_wire_distance_to_frame - i * cathodeDistanceBetweenWires
+        transforms.append((f"cathodeWireY{i+1}", [0, 90*np.pi/180, 0], [cathodeWireLength/2-first_wire_distance_to_frame, z_shift, wire_position]))
+    if not assembly_frame:
+        return transforms
+
+    # Booleans and placements both apply the inverse of the rotation matrix, so the composed rotation
+    # is R_wire @ R_cathode and the wire position is rotated by the inverse of R_cathode
+    cathode_rotation, cathode_position = get_cathode_wired_placement()
+    cathode_matrix = tf.tbxyz2matrix(cathode_rotation)
+    return [
+        (
+            wire_name,
+            list(tf.matrix2tbxyz(tf.tbxyz2matrix(rotation) @ cathode_matrix)),
+            (np.array(cathode_position) + cathode_matrix.T @ np.array(position)).tolist(),
+        )
+        for wire_name, rotation, position in transforms
+    ]
+
+def place_cathode_wires(mother, registry, position=[0, 0, 0], z_min=-np.inf, z_max=np.inf):
+    """
+    Places every wire of the wired cathode as a physical volume of cathodeSingleWire_LV inside mother.
+    Only the wires whose centre, in the field cage assembly frame, has z_min <= z < z_max are placed.
+    param position: Position of the origin of the field cage assembly in the mother frame.
+    Returns the list of created physical volumes.
+    """
+    cathodeSingleWire_LV = utils.get_logical_volume_by_name("cathodeSingleWire_LV", registry)
+    wires = []
+    for wire_name, wire_rotation, wire_position in get_cathode_wire_transforms(assembly_frame=True):
+        if not z_min <= wire_position[2] < z_max:
+            continue
+        wires.append(g4.PhysicalVolume(
+            name=wire_name,
+            rotation=wire_rotation,
+            position=(np.array(wire_position) + np.array(position)).tolist(),
+            logicalVolume=cathodeSingleWire_LV,
+            motherVolume=mother,
+            registry=registry
+        ))
+    return wires
+
+def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathode_type="wired", cathode_wires="union", with_cathode_wires=True, collapse_laminates=False, lod="full", ring_replicas=False, gas="Argon1%Isobutane1.1bar"):
     """
     Generate the field cage assembly for the TREX-DM geometry.
+    param cathode_wires: How the wired cathode is built, one of CATHODE_WIRES_MODES.
+    param with_cathode_wires: If False, the wires are not placed in the assembly when cathode_wires is "placements",
+    so that they can be placed inside the drift gas volumes instead (see place_cathode_wires).
+    param collapse_laminates: If True, the plain cathode is a single volume (the kapton foil, without the copper layers)
+    made of a mixture with the mass and composition of its three layers (see materials.get_laminate_material).
+    param lod: Level of detail, see envelopes.LEVELS. "reduced" implies collapse_laminates, at "envelope" the assembly
+    is a slab of cathodeEnvelopeThickness across the drift gas volumes, wires included, and a square cylinder around
+    them with the rest of the parts.
+    param ring_replicas: If True, the rings of each side are a replica (G4PVReplica) of a slice with one ring, filling
+    a ring stack volume (ringStack_LV) of the size of the rings, instead of ringNumber placements per side. The
+    placements of the rings are unchanged.
+    param gas: Gas between the rings of the ring stacks (see materials.get_material), used with ring_replicas.
     """
+    if cathode_wires not in CATHODE_WIRES_MODES:
+        raise ValueError(f"Invalid cathode wires mode. Choose one of {', '.join(CATHODE_WIRES_MODES)}.")
+    envelopes.check_level(lod)
+    if lod == "reduced":
+        collapse_laminates = True
+    elif lod == "envelope":
+        # the placed wires are part of the cathode envelope
+        with_cathode_wires = True
     # Registry
     if registry is None:
         reg = g4.Registry()
@@ -129,16 +219,9 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
         reg = registry
 
     # Materials
-    """
-    # Use this for the pyg4ometry coloured material visualisation
-    copper = g4.MaterialPredefined("G4_Cu")
-    teflon = g4.MaterialPredefined("G4_TEFLON")
-    kapton = g4.MaterialPredefined("G4_KAPTON")
-    """
-    # Use this to generate gdmls with NIST materials definitions
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    teflon = g4.nist_material_2geant4Material("G4_TEFLON")
-    kapton = g4.nist_material_2geant4Material("G4_KAPTON")
+    copper = materials.get_material("G4_Cu", reg)
+    teflon = materials.get_material("G4_TEFLON", reg)
+    kapton = materials.get_material("G4_KAPTON", reg)
 
     if cathode_type == "plain":
         # Create the the cathode
@@ -189,24 +272,33 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
         
         first_wire_distance_to_frame = (cathodeWireLength - (cathodeWireNumber-1)*cathodeDistanceBetweenWires) / 2
         z_shift = cathodeWireRadius*2 # to avoid overlap between x wires and y wires
-        for i in range(cathodeWireNumber-1): # first cathodeWire has two wires already
-            wire_position = (i+1) * cathodeDistanceBetweenWires
-
-            cathodeWire = g4.solid.Union(
-                name=f"cathodeWireX{i+1}",
-                obj1=cathodeWire if i!=0 else cathodeSingleWire,
-                obj2=cathodeSingleWire,
-                tra2=[[0, 0, 0], [wire_position, 0, 0]], #
-                registry=reg
-            )
-        for i in range(cathodeWireNumber):
-            wire_position = cathodeWireLength/2 - first_wire_distance_to_frame - i * cathodeDistanceBetweenWires
-
-            cathodeWire = g4.solid.Union(
-                name=f"cathodeWireX{cathodeWireNumber}Y{i+1}" if i!= cathodeWireNumber-1 else "cathodeWiredFull",
-                obj1=cathodeWire,
-                obj2=cathodeSingleWire,
-                tra2=[[0, 90*np.pi/180, 0], [cathodeWireLength/2-first_wire_distance_to_frame, z_shift, wire_position]],
+        if cathode_wires == "union":
+            for i in range(cathodeWireNumber-1): # first cathodeWire has two wires already
+                wire_position = (i+1) * cathodeDistanceBetweenWires
+
+                cathodeWire = g4.solid.Union(
+                    name=f"cathodeWireX{i+1}",
+                    obj1=cathodeWire if i!=0 else cathodeSingleWire,
+                    obj2=cathodeSingleWire,
+                    tra2=[[0, 0, 0], [wire_position, 0, 0]], #
+                    registry=reg
+                )
+            for i in range(cathodeWireNumber):
+                wire_position = cathodeWireLength/2 - first_wire_distance_to_frame - i * cathodeDistanceBetweenWires
+
+                cathodeWire = g4.solid.Union(
+                    name=f"cathodeWireX{cathodeWireNumber}Y{i+1}" if i!= cathodeWireNumber-1 else "cathodeWiredFull",
+                    obj1=cathodeWire,
+                    obj2=cathodeSingleWire,
+                    tra2=[[0, 90*np.pi/180, 0], [cathodeWireLength/2-first_wire_distance_to_frame, z_shift, wire_position]],
+                    registry=reg
+                )
+        elif cathode_wires == "multiunion":
+            wire_transforms = get_cathode_wire_transforms()
+            cathodeWire = g4.solid.MultiUnion(
+                name="cathodeWiredFull",
+                objects=[cathodeSingleWire] * len(wire_transforms),
+                transformations=[[rotation, position] for _, rotation, position in wire_transforms],
                 registry=reg
             )
 
@@ -668,10 +760,16 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
             material=copper,
             registry=reg
         )
+        foil_material = kapton
+        if collapse_laminates:
+            foil_material = materials.get_laminate_material("cathodeLaminate", [
+                ("G4_KAPTON", cathodeKaptonThickness),
+                ("G4_Cu", 2*cathodeCuThickness),
+            ], reg, thickness=cathodeKaptonThickness)
         cathodeFoilKapton_LV = g4.LogicalVolume(
             name="cathodeFoilKapton_LV",
             solid=cathodeFoilKapton,
-            material=kapton,
+            material=foil_material,
             registry=reg
         )
     elif cathode_type == "wired":
@@ -683,12 +781,20 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
             registry=reg
         )
         """
-        cathodeWired_LV = g4.LogicalVolume(
-            name="cathodeWired_LV",
-            solid=cathodeWire, # the last one is the full wired cathode
-            material=copper,
-            registry=reg
-        )
+        if cathode_wires == "placements":
+            cathodeSingleWire_LV = g4.LogicalVolume(
+                name="cathodeSingleWire_LV",
+                solid=cathodeSingleWire,
+                material=copper,
+                registry=reg
+            )
+        else:
+            cathodeWired_LV = g4.LogicalVolume(
+                name="cathodeWired_LV",
+                solid=cathodeWire, # the last one is the full wired cathode
+                material=copper,
+                registry=reg
+            )
     else:
         raise ValueError("Invalid cathode type. Choose either 'plain' or 'wired'.")
 
@@ -830,22 +936,23 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
             registry=reg
         )
             
-        cathodeFoilCuLeft_PV = g4.PhysicalVolume(
-            name="cathodeFoilCuLeft",
-            rotation=[0, 0, 0],
-            position=[0, 0, cathodeKaptonThickness/2],
-            logicalVolume=cathodeFoilCu_LV,
-            motherVolume=fieldcage_assembly,
-            registry=reg
-        )
-        cathodeFoilCuRight_PV = g4.PhysicalVolume(
-            name="cathodeFoilCuRight",
-            rotation=[0, 0, 0],
-            position=[0, 0, -cathodeKaptonThickness/2],
-            logicalVolume=cathodeFoilCu_LV,
-            motherVolume=fieldcage_assembly,
-            registry=reg
-        )
+        if not collapse_laminates:
+            cathodeFoilCuLeft_PV = g4.PhysicalVolume(
+                name="cathodeFoilCuLeft",
+                rotation=[0, 0, 0],
+                position=[0, 0, cathodeKaptonThickness/2],
+                logicalVolume=cathodeFoilCu_LV,
+                motherVolume=fieldcage_assembly,
+                registry=reg
+            )
+            cathodeFoilCuRight_PV = g4.PhysicalVolume(
+                name="cathodeFoilCuRight",
+                rotation=[0, 0, 0],
+                position=[0, 0, -cathodeKaptonThickness/2],
+                logicalVolume=cathodeFoilCu_LV,
+                motherVolume=fieldcage_assembly,
+                registry=reg
+            )
     elif cathode_type == "wired":
 
         """ # old implementation with individual PV for each wire
@@ -871,14 +978,18 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
                 registry=reg
             )
         """
-        cathodeWired_PV = g4.PhysicalVolume(
-            name="cathodeWired",
-            rotation=[90*np.pi/180, 0, 0],
-            position=[-cathodeWireLength/2+first_wire_distance_to_frame, 0, cathodeWireRadius],
-            logicalVolume=cathodeWired_LV,
-            motherVolume=fieldcage_assembly,
-            registry=reg
-        )
+        if cathode_wires == "placements":
+            if with_cathode_wires:
+                place_cathode_wires(fieldcage_assembly, reg)
+        else:
+            cathodeWired_PV = g4.PhysicalVolume(
+                name="cathodeWired",
+                rotation=[90*np.pi/180, 0, 0],
+                position=[-cathodeWireLength/2+first_wire_distance_to_frame, 0, cathodeWireRadius],
+                logicalVolume=cathodeWired_LV,
+                motherVolume=fieldcage_assembly,
+                registry=reg
+            )
     else:
         raise ValueError("Invalid cathode type. Choose either 'plain' or 'wired'.")
 
@@ -975,24 +1086,128 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
         registry=reg
     )
     
-    for i in range(ringNumber):
-        distance = (ringSeparation + ringThickness) * i # to the beginning of the board
+    if ring_replicas:
+        # the stack ends with the rings board and is made of ringNumber slices of one ring pitch, with the ring at the
+        # same offset in every slice
+        ringPitch = ringSeparation + ringThickness
+        ringStackEnd = sideSeparatorThickness/2 + cathodeSideFrameThickness + ringsBoardThickness
+        ringStackLength = ringNumber * ringPitch
+        ringStackStart = ringStackEnd - ringStackLength
+        ringOffset = (sideSeparatorThickness/2 + cathodeSideFrameThickness + ringThickness/2) - (ringStackStart + ringPitch/2)
+        if ringStackStart < sideSeparatorThickness/2 or abs(ringOffset) + ringThickness/2 > ringPitch/2:
+            raise ValueError("The rings do not fit in a ring stack of ringNumber slices inside the rings board. Please adjust the parameters.")
+        gas_material = materials.get_material(gas, reg)
+        ringStack0 = g4.solid.Box(
+            name="ringStack0",
+            pX=ringLength,
+            pY=ringLength,
+            pZ=ringStackLength,
+            lunit="mm",
+            registry=reg
+        )
+        ringStackCut = g4.solid.Box(
+            name="ringStackCut",
+            pX=ringInnerLength,
+            pY=ringInnerLength,
+            pZ=ringStackLength + 0.01,  # Slightly larger to ensure cut
+            lunit="mm",
+            registry=reg
+        )
+        ringStack = g4.solid.Subtraction(
+            name="ringStack",
+            obj1=ringStack0,
+            obj2=ringStackCut,
+            tra2=[[0, 0, 0], [0, 0, 0]],
+            registry=reg
+        )
+        ringSlice0 = g4.solid.Box(
+            name="ringSlice0",
+            pX=ringLength,
+            pY=ringLength,
+            pZ=ringPitch,
+            lunit="mm",
+            registry=reg
+        )
+        ringSliceCut = g4.solid.Box(
+            name="ringSliceCut",
+            pX=ringInnerLength,
+            pY=ringInnerLength,
+            pZ=ringPitch + 0.01,  # Slightly larger to ensure cut
+            lunit="mm",
+            registry=reg
+        )
+        ringSlice = g4.solid.Subtraction(
+            name="ringSlice",
+            obj1=ringSlice0,
+            obj2=ringSliceCut,
+            tra2=[[0, 0, 0], [0, 0, 0]],
+            registry=reg
+        )
+        ringStack_LV = g4.LogicalVolume(
+            name="ringStack_LV",
+            solid=ringStack,
+            material=gas_material,
+            registry=reg
+        )
+        ringSlice_LV = g4.LogicalVolume(
+            name="ringSlice_LV",
+            solid=ringSlice,
+            material=gas_material,
+            registry=reg
+        )
         g4.PhysicalVolume(
-            name=f"ringLeft{i+1}",
+            name="ring",
             rotation=[0, 0, 0],
-            position=[0, 0, +(sideSeparatorThickness/2 + cathodeSideFrameThickness + ringThickness/2 + distance)],
+            position=[0, 0, ringOffset],
             logicalVolume=ring_LV,
-            motherVolume=fieldcage_assembly,
+            motherVolume=ringSlice_LV,
+            registry=reg
+        )
+        g4.ReplicaVolume(
+            "ringSlices",
+            utils.prepare_replicated_volume(ringSlice_LV),
+            ringStack_LV,
+            g4.ReplicaVolume.Axis.kZAxis,
+            ringNumber,
+            ringPitch,
             registry=reg
         )
+        # the right stack is the left one turned around the x axis, the stack is symmetric in y
         g4.PhysicalVolume(
-            name=f"ringRight{i+1}",
+            name="ringStackLeft",
             rotation=[0, 0, 0],
-            position=[0, 0, -(sideSeparatorThickness/2 + cathodeSideFrameThickness + ringThickness/2 + distance)],
-            logicalVolume=ring_LV,
+            position=[0, 0, +(ringStackStart + ringStackLength/2)],
+            logicalVolume=ringStack_LV,
             motherVolume=fieldcage_assembly,
             registry=reg
         )
+        g4.PhysicalVolume(
+            name="ringStackRight",
+            rotation=[np.pi, 0, 0],
+            position=[0, 0, -(ringStackStart + ringStackLength/2)],
+            logicalVolume=ringStack_LV,
+            motherVolume=fieldcage_assembly,
+            registry=reg
+        )
+    else:
+        for i in range(ringNumber):
+            distance = (ringSeparation + ringThickness) * i # to the beginning of the board
+            g4.PhysicalVolume(
+                name=f"ringLeft{i+1}",
+                rotation=[0, 0, 0],
+                position=[0, 0, +(sideSeparatorThickness/2 + cathodeSideFrameThickness + ringThickness/2 + distance)],
+                logicalVolume=ring_LV,
+                motherVolume=fieldcage_assembly,
+                registry=reg
+            )
+            g4.PhysicalVolume(
+                name=f"ringRight{i+1}",
+                rotation=[0, 0, 0],
+                position=[0, 0, -(sideSeparatorThickness/2 + cathodeSideFrameThickness + ringThickness/2 + distance)],
+                logicalVolume=ring_LV,
+                motherVolume=fieldcage_assembly,
+                registry=reg
+            )
 
 
     supportCorners_PV = g4.PhysicalVolume(
@@ -1108,6 +1323,64 @@ def generate_fieldcage_assembly(name="fieldcage_assembly", registry=None, cathod
         motherVolume=fieldcage_assembly,
         registry=reg
     )
+
+    if lod == "envelope":
+        envelope_length = 2*(sideSeparatorThickness/2 + cathodeSideFrameThickness + cornersThickness + closerFrameThickness)
+        cathodeEnvelope = g4.solid.Box(
+            name="cathodeEnvelope",
+            pX=fieldcageEnvelopeHoleLength,
+            pY=fieldcageEnvelopeHoleLength,
+            pZ=cathodeEnvelopeThickness,
+            lunit="mm",
+            registry=reg
+        )
+        # the supports are cut by the cylinder, which keeps clear of the calibration taps of the vessel
+        fieldcageEnvelopeBox = g4.solid.Box(
+            name="fieldcageEnvelopeBox",
+            pX=supportLength,
+            pY=supportLength,
+            pZ=envelope_length,
+            lunit="mm",
+            registry=reg
+        )
+        fieldcageEnvelopeCylinder = g4.solid.Tubs(
+            name="fieldcageEnvelopeCylinder",
+            pRMin=0,
+            pRMax=fieldcageEnvelopeRadius,
+            pDz=envelope_length,
+            pSPhi=0,
+            pDPhi=360,
+            aunit="deg",
+            lunit="mm",
+            registry=reg
+        )
+        fieldcageEnvelopeHole = g4.solid.Box(
+            name="fieldcageEnvelopeHole",
+            pX=fieldcageEnvelopeHoleLength,
+            pY=fieldcageEnvelopeHoleLength,
+            pZ=envelope_length + 1,
+            lunit="mm",
+            registry=reg
+        )
+        fieldcageEnvelope0 = g4.solid.Intersection(
+            name="fieldcageEnvelope0",
+            obj1=fieldcageEnvelopeBox,
+            obj2=fieldcageEnvelopeCylinder,
+            tra2=[[0, 0, 0], [0, 0, 0]],
+            registry=reg
+        )
+        fieldcageEnvelope = g4.solid.Subtraction(
+            name="fieldcageEnvelope",
+            obj1=fieldcageEnvelope0,
+            obj2=fieldcageEnvelopeHole,
+            tra2=[[0, 0, 0], [0, 0, 0]],
+            registry=reg
+        )
+        envelopes.make_envelopes(fieldcage_assembly, [
+            ("cathodeEnvelope", cathodeEnvelope, [0, 0, 0], [0, 0, 0], ["cathodeFoil*", "cathodeWire*", "cathodeWired", "cathodeFrame", "cathodeFeedthrough"]),
+            ("fieldcageEnvelope", fieldcageEnvelope, [0, 0, 0], [0, 0, 0], ["*"]),
+        ], reg)
+
     return reg
 
 
@@ -1123,14 +1396,13 @@ if __name__ == "__main__":
     fieldcage_assembly = utils.get_logical_volume_by_name("fieldcage_assembly", reg)
 
     if args.gdml:
-        galactic = g4.nist_material_2geant4Material("G4_Galactic")
+        galactic = materials.get_material("G4_Galactic", reg)
         assembly_LV = fieldcage_assembly.logicalVolume(material=galactic)
         reg.setWorld(assembly_LV.name)
-        w = pyg4ometry.gdml.Writer()
-        w.addDetector(reg)
-        w.write('fieldcage.gdml')
+        utils.write_gdml(reg, 'fieldcage.gdml')
 
     if args.vis:
+        import pyg4ometry.visualisation
         v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
         v.addLogicalVolume(fieldcage_assembly.logicalVolume())
         v.addAxes(300)
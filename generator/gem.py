@@ -1,7 +1,8 @@
-import vtk
 import pyg4ometry
 from pyg4ometry import geant4 as g4
 import numpy as np
+import envelopes
+import materials
 import utils
 
 gemKaptonFoilLength = 280.0 # mm
@@ -40,11 +41,21 @@ gemmMSeparatorFixerToSeparatorDistance = 3.64 # mm, this is the closer edges of
 
 gemmMSeparatorDistance = 248.0 # mm, this is the distance between the two closer edges of the separators
 
-def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True):
+gemEnvelopeRadius = 187.0 # mm, same as the Micromegas base (micromegas.mMBaseRadius)
+gemEnvelopeHoleLength = 250.0 # mm, side of the drift and transfer gas volumes (micromegas.mMLength)
+
+def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True, collapse_laminates=False, lod="full"):
     """
     Generates the GEM assembly with all its components.
+    param collapse_laminates: If True, the GEM foil is a single volume (the kapton foil, without the copper layers) made
+    of a mixture with the mass and composition of its three layers (see materials.get_laminate_material).
+    param lod: Level of detail, see envelopes.LEVELS. "reduced" implies collapse_laminates, at "envelope" the assembly
+    is the foil across the gas volumes and a cylinder around them with the frame and the separators.
     Returns the assembly volume.
     """
+    envelopes.check_level(lod)
+    if lod == "reduced":
+        collapse_laminates = True
 
     # Registry
     if registry is None:
@@ -52,16 +63,9 @@ def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True
     else:
         reg = registry
     # Materials
-    # Use this for the pyg4ometry coloured material visualisation
-    """
-    copper = g4.MaterialPredefined("G4_Cu")
-    teflon = g4.MaterialPredefined("G4_TEFLON")
-    kapton = g4.MaterialPredefined("G4_KAPTON")
-    """
-    # Use this to generate gdmls with NIST materials definitions
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    teflon = g4.nist_material_2geant4Material("G4_TEFLON")
-    kapton = g4.nist_material_2geant4Material("G4_KAPTON")
+    copper = materials.get_material("G4_Cu", reg)
+    teflon = materials.get_material("G4_TEFLON", reg)
+    kapton = materials.get_material("G4_KAPTON", reg)
     
     ### Corners Cut to save the vessel radius ###
     mMBBaseCornerRadius = 187.0 # 187 mm is the radius of the corners
@@ -299,6 +303,16 @@ def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True
         registry=reg
     )
 
+    foil_material = kapton
+    if collapse_laminates:
+        import sampling
+        # the copper layers are smaller than the kapton foil: share of the foil area covered by each of them
+        copper_fraction = (sampling.get_volume(gemTop, n_points=200000) / gemCopperFoilThickness) / (sampling.get_volume(gemKaptonFoil, n_points=200000) / gemKaptonFoilThickness)
+        foil_material = materials.get_laminate_material("gemLaminate", [
+            ("G4_KAPTON", gemKaptonFoilThickness),
+            ("G4_Cu", 2*gemCopperFoilThickness*copper_fraction),
+        ], reg, thickness=gemKaptonFoilThickness)
+
     ### JOIN THE SOLIDS INTO THE ASSEMBLY ###
     gem_assembly = g4.AssemblyVolume(
         name=name,
@@ -309,7 +323,7 @@ def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True
     gemKaptonFoil_LV = g4.LogicalVolume(
         name="gemKaptonFoil_LV",
         solid=gemKaptonFoil,
-        material=kapton,
+        material=foil_material,
         registry=reg
     )
     gemTop_LV = g4.LogicalVolume(
@@ -357,22 +371,23 @@ def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True
         motherVolume=gem_assembly,
         registry=reg
     )
-    gemTop_PV = g4.PhysicalVolume(
-        name="gemTop",
-        rotation=[0, 0, 0],
-        position=[0, 0, side_z_dir*(gemCopperFoilThickness/2 + gemKaptonFoilThickness/2)],
-        logicalVolume=gemTop_LV,
-        motherVolume=gem_assembly,
-        registry=reg
-    )
-    gemBottom_PV = g4.PhysicalVolume(
-        name="gemBottom",
-        rotation=[0, 0, 0],
-        position=[0, 0, -side_z_dir*(gemCopperFoilThickness/2 + gemKaptonFoilThickness/2)],
-        logicalVolume=gemBottom_LV,
-        motherVolume=gem_assembly,
-        registry=reg
-    )
+    if not collapse_laminates:
+        gemTop_PV = g4.PhysicalVolume(
+            name="gemTop",
+            rotation=[0, 0, 0],
+            position=[0, 0, side_z_dir*(gemCopperFoilThickness/2 + gemKaptonFoilThickness/2)],
+            logicalVolume=gemTop_LV,
+            motherVolume=gem_assembly,
+            registry=reg
+        )
+        gemBottom_PV = g4.PhysicalVolume(
+            name="gemBottom",
+            rotation=[0, 0, 0],
+            position=[0, 0, -side_z_dir*(gemCopperFoilThickness/2 + gemKaptonFoilThickness/2)],
+            logicalVolume=gemBottom_LV,
+            motherVolume=gem_assembly,
+            registry=reg
+        )
     gemFrame_PV = g4.PhysicalVolume(
         name="gemFrame",
         rotation=[0, 0, 0],
@@ -423,6 +438,49 @@ def generate_gem_assembly(name="gem_assembly", registry=None, is_right_side=True
         registry=reg
     )
 
+    if lod == "envelope":
+        # from the micromegas side of the separators to the drift side of the frame
+        envelope_low = gemKaptonFoilThickness/2 + gemmMSeparatorThickness
+        envelope_high = gemKaptonFoilThickness + gemFrameThickness
+        gemFoilEnvelope = g4.solid.Box(
+            name="gemFoilEnvelope",
+            pX=gemEnvelopeHoleLength,
+            pY=gemEnvelopeHoleLength,
+            pZ=gemKaptonFoilThickness + 2*gemCopperFoilThickness,
+            lunit="mm",
+            registry=reg
+        )
+        gemEnvelopeCylinder = g4.solid.Tubs(
+            name="gemEnvelopeCylinder",
+            pRMin=0,
+            pRMax=gemEnvelopeRadius,
+            pDz=envelope_low + envelope_high,
+            pSPhi=0,
+            pDPhi=360,
+            aunit="deg",
+            lunit="mm",
+            registry=reg
+        )
+        gemEnvelopeHole = g4.solid.Box(
+            name="gemEnvelopeHole",
+            pX=gemEnvelopeHoleLength,
+            pY=gemEnvelopeHoleLength,
+            pZ=envelope_low + envelope_high + 1,
+            lunit="mm",
+            registry=reg
+        )
+        gemEnvelope = g4.solid.Subtraction(
+            name="gemEnvelope",
+            obj1=gemEnvelopeCylinder,
+            obj2=gemEnvelopeHole,
+            tra2=[[0, 0, 0], [0, 0, 0]],
+            registry=reg
+        )
+        envelopes.make_envelopes(gem_assembly, [
+            ("gemFoilEnvelope", gemFoilEnvelope, [0, 0, 0], [0, 0, 0], ["gemKaptonFoil", "gemTop", "gemBottom"]),
+            ("gemEnvelope", gemEnvelope, [0, 0, 0], [0, 0, side_z_dir*(envelope_high - envelope_low)/2], ["*"]),
+        ], reg)
+
     return reg
 
 if __name__ == "__main__":
@@ -436,14 +494,13 @@ if __name__ == "__main__":
     gem_assembly = utils.get_logical_volume_by_name("gem_assembly", reg)
 
     if args.gdml:
-        galactic = g4.nist_material_2geant4Material("G4_Galactic")
+        galactic = materials.get_material("G4_Galactic", reg)
         assembly_LV = gem_assembly.logicalVolume(material=galactic)
         reg.setWorld(assembly_LV.name)
-        w = pyg4ometry.gdml.Writer()
-        w.addDetector(reg)
-        w.write('gem.gdml')
+        utils.write_gdml(reg, 'gem.gdml')
 
     if args.vis:
+        import pyg4ometry.visualisation
         v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
         v.addLogicalVolume(gem_assembly.logicalVolume())
         v.addAxes(300)
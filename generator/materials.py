@@ -0,0 +1,204 @@
+import re
+import weakref
+
+from pyg4ometry import geant4 as g4
+
+# Material library shared by the generators: every material is defined once per registry and cached, so the
+# components use the same material objects.
+# Gas mixtures are named after their composition and pressure, e.g. "Argon1%Isobutane1.1bar" (argon with 1% of
+# isobutane in volume at 1.1 bar), and their density is computed with the ideal gas law.
+# Stacks of thin layers merged into a single volume get a mixture of the materials of the layers that keeps their mass
+# and composition (see get_laminate_material), and so do the volumes standing for several parts (see
+# get_mixture_material).
+
+GAS_CONSTANT = 8.314462618 # J/(mol K)
+MIXTURE_TEMPERATURE = 298.15 # K, temperature of the gas mixtures
+COMPONENT_TEMPERATURE = 293.15 # K, temperature of the pure gases used as components of the mixtures
+COMPONENT_PRESSURE = 1 # bar
+
+# Use pyg4ometry predefined materials (only the NIST name) instead of their full definition, e.g. for the
+# pyg4ometry coloured material visualisation
+PREDEFINED = False
+
+# Pure gases that can be mixed, by the name used in the gas mixture names: chemical formula {element: atoms}
+GASES = {
+    "Argon": {"Ar": 1},
+    "Neon": {"Ne": 1},
+    "Isobutane": {"C": 4, "H": 10},
+}
+
+# Materials already defined in each registry: {registry: {name: material}}
+_materials = weakref.WeakKeyDictionary()
+# Mass fractions of the mixtures of laminates and parts defined in each registry: {registry: {name: {material name: fraction}}}
+_mixtures = weakref.WeakKeyDictionary()
+
+_mixture_pattern = re.compile(r"([A-Za-z]+)((?:\d+(?:\.\d+)?%[A-Za-z]+)*)(\d+(?:\.\d+)?)bar")
+_additive_pattern = re.compile(r"(\d+(?:\.\d+)?)%([A-Za-z]+)")
+
+def add_gas(name, formula):
+    """
+    Adds a pure gas that can be used in the gas mixtures, e.g. add_gas("Xenon", {"Xe": 1}).
+    param formula: Chemical formula of the gas, {element symbol: number of atoms}.
+    """
+    GASES[name] = dict(formula)
+
+def get_molar_mass(formula):
+    """
+    Returns the molar mass in g/mol of the chemical formula {element symbol: number of atoms}, from the natural
+    isotopic composition of the NIST elements.
+    """
+    molar_mass = 0
+    for symbol, atoms in formula.items():
+        isotopes = g4.nist_materials_name_lookup(f"G4_{symbol}")["isotopes"]
+        molar_mass += atoms*sum(mass*abundance for _, mass, abundance in isotopes)
+    return molar_mass
+
+def get_gas_density(molar_mass, pressure, temperature=MIXTURE_TEMPERATURE):
+    """
+    Returns the density in g/cm3 of an ideal gas.
+    param molar_mass: Molar mass in g/mol.
+    param pressure: Pressure in bar.
+    param temperature: Temperature in K.
+    """
+    return pressure*1e5*molar_mass/(GAS_CONSTANT*temperature)*1e-6
+
+def parse_gas_mixture(name):
+    """
+    Returns the volume fractions {gas: fraction} and the pressure in bar of a gas mixture name such as
+    "Argon1%Isobutane1.1bar" or "Neon2%Isobutane4bar". The first gas makes up the rest of the mixture.
+    """
+    match = _mixture_pattern.fullmatch(name)
+    if match is None:
+        raise ValueError(f"Gas mixture '{name}' is not defined.")
+    base, additives, pressure = match.groups()
+    fractions = {gas: float(percent)/100 for percent, gas in _additive_pattern.findall(additives)}
+    fractions[base] = 1 - sum(fractions.values())
+    for gas in fractions:
+        if gas not in GASES:
+            raise ValueError(f"Gas mixture '{name}' is not defined: unknown gas '{gas}'.")
+    if fractions[base] <= 0:
+        raise ValueError(f"Gas mixture '{name}' is not defined: the fractions add up to more than 100%.")
+    return {gas: fractions[gas] for gas in sorted(fractions, key=lambda gas: gas != base)}, float(pressure)
+
+def get_material(name, registry):
+    """
+    Returns the material name of registry, defining it the first time. The name is either a NIST material
+    ("G4_Cu", "G4_KAPTON"...), a pure gas of GASES followed by "Gas" ("ArgonGas") or a gas mixture
+    ("Argon1%Isobutane1.1bar", see parse_gas_mixture).
+    """
+    materials = _materials.setdefault(registry, {})
+    if name not in materials:
+        if name.startswith("G4_"):
+            materials[name] = g4.MaterialPredefined(name) if PREDEFINED else g4.nist_material_2geant4Material(name)
+        elif name.endswith("Gas") and name[:-len("Gas")] in GASES:
+            materials[name] = _define_gas(name[:-len("Gas")], registry)
+        else:
+            materials[name] = _define_gas_mixture(name, registry)
+    return materials[name]
+
+def get_library_name(material, registry):
+    """
+    Returns the name a material of registry was defined with by get_material or the mixture functions, e.g. "G4_Cu"
+    for the NIST copper named "Material_G4_Cu", or its own name if it was defined elsewhere.
+    """
+    for name, defined in _materials.get(registry, {}).items():
+        if defined is material:
+            return name
+    return material.name
+
+def get_density(name, registry):
+    """
+    Returns the density in g/cm3 of the material name of registry (see get_material), also for predefined materials.
+    """
+    if name.startswith("G4_"):
+        return g4.nist_materials_name_lookup(name)["density"]
+    return get_material(name, registry).density
+
+def get_laminate_material(name, layers, registry, thickness=None):
+    """
+    Returns the material name of registry for a stack of thin layers merged into a single volume, defining it the
+    first time. Each material of the layers enters with its share of the mass of the stack and the density is the mass
+    of the stack over the thickness of the volume, so the volume keeps the mass and composition of the layers.
+    param layers: List of (material name, thickness) of the layers. A layer covering only part of the volume enters
+    with its thickness times the covered fraction of the area.
+    param thickness: Thickness of the merged volume, in the units of the layers. Defaults to the sum of the layers.
+    """
+    materials = _materials.setdefault(registry, {})
+    if name not in materials:
+        # mass of each material per unit area of the stack
+        masses = {}
+        for component, layer_thickness in layers:
+            masses[component] = masses.get(component, 0) + layer_thickness*get_density(component, registry)
+        if thickness is None:
+            thickness = sum(layer_thickness for _, layer_thickness in layers)
+        materials[name] = _define_mixture(name, masses, sum(masses.values())/thickness, registry)
+    return materials[name]
+
+def get_mixture_material(name, masses, volume, registry):
+    """
+    Returns the material name of registry for a volume standing for several parts, defining it the first time. The
+    mass of each material of the parts is spread over the volume, so the volume keeps the mass and composition of
+    the parts.
+    param masses: Dictionary {material name: mass in g} of the parts (see get_material).
+    param volume: Volume in mm3 filled by the mixture.
+    """
+    materials = _materials.setdefault(registry, {})
+    if name not in materials:
+        masses = {component: mass for component, mass in masses.items() if mass > 0}
+        if not masses or volume <= 0:
+            raise ValueError(f"Mixture '{name}' needs a positive mass and volume.")
+        materials[name] = _define_mixture(name, masses, sum(masses.values())/(volume*1e-3), registry)
+    return materials[name]
+
+def get_mass_fractions(name, registry):
+    """
+    Returns the mass fractions {material name: fraction} of the materials a mixture of laminates or parts of registry
+    is made of (see get_laminate_material and get_mixture_material), through mixtures of mixtures; {name: 1} for the
+    other materials.
+    """
+    mixture = _mixtures.get(registry, {}).get(name)
+    if mixture is None:
+        return {name: 1}
+    fractions = {}
+    for component, fraction in mixture.items():
+        for material, component_fraction in get_mass_fractions(component, registry).items():
+            fractions[material] = fractions.get(material, 0) + fraction*component_fraction
+    return fractions
+
+def _define_mixture(name, masses, density, registry):
+    mass = sum(masses.values())
+    material = g4.MaterialCompound(name,
+                                   density=density,
+                                   number_of_components=len(masses),
+                                   registry=registry)
+    for component, component_mass in masses.items():
+        material.add_material(get_material(component, registry), component_mass/mass)
+    _mixtures.setdefault(registry, {})[name] = {component: component_mass/mass for component, component_mass in masses.items()}
+    return material
+
+def _define_gas(gas, registry):
+    formula = GASES[gas]
+    molar_mass = get_molar_mass(formula)
+    material = g4.MaterialCompound(f"{gas}Gas",
+                                   density=get_gas_density(molar_mass, COMPONENT_PRESSURE, COMPONENT_TEMPERATURE),
+                                   number_of_components=len(formula),
+                                   state="gas",
+                                   registry=registry)
+    for symbol, atoms in formula.items():
+        element = g4.nist_element_2geant4Element(f"G4_{symbol}")
+        material.add_element_massfraction(element, atoms*get_molar_mass({symbol: 1})/molar_mass)
+    return material
+
+def _define_gas_mixture(name, registry):
+    fractions, pressure = parse_gas_mixture(name)
+    # mass of each gas in a mole of the mixture
+    masses = {gas: fraction*get_molar_mass(GASES[gas]) for gas, fraction in fractions.items()}
+    molar_mass = sum(masses.values())
+    material = g4.MaterialCompound(name,
+                                   density=get_gas_density(molar_mass, pressure),
+                                   number_of_components=len(fractions),
+                                   state="gas",
+                                   registry=registry)
+    for gas, mass in masses.items():
+        material.add_material(get_material(f"{gas}Gas", registry), mass/molar_mass)
+    return material
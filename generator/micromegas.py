@@ -1,8 +1,9 @@
-import vtk
 import pyg4ometry
 from pyg4ometry import geant4 as g4
 from pyg4ometry import transformation as tf
 import numpy as np
+import envelopes
+import materials
 import utils
 
 mMBaseLength = 324.0 # 324 mm is the full length, so half is 162 mm
@@ -460,14 +461,21 @@ def generate_limandes(name="limande", suffix="", thickness_in_mm=1, thickness_be
 
     return reg
 
-def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_right_side=True, simple_geometry=False):
+def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_right_side=True, simple_geometry=False, collapse_laminates=False, lod="full"):
     """
     Generates the micromegas assembly with all its components.
     param name: Name of the assembly volume.
     param registry: Registry to use for the Geant4 objects. If None, a new registry is created.
     param is_right_side: If True, the assembly is for the right side, otherwise for the left side. The sides are mirrored.
+    param collapse_laminates: If True, the board and the limandes are single volumes (their outer copper layer, without
+    daughters) made of a mixture with the mass and composition of all their layers (see materials.get_laminate_material).
+    param lod: Level of detail, see envelopes.LEVELS. "reduced" implies collapse_laminates, at "envelope" the assembly is
+    a single cylinder from the face of the board up to the vessel cap.
     Returns the assembly volume.
     """
+    envelopes.check_level(lod)
+    if lod == "reduced":
+        collapse_laminates = True
 
     # Registry
     if registry is None:
@@ -476,16 +484,9 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
         reg = registry
 
     # Materials
-    # Use this for the pyg4ometry coloured material visualisation
-    """
-    copper = g4.MaterialPredefined("G4_Cu")
-    teflon = g4.MaterialPredefined("G4_TEFLON")
-    kapton = g4.MaterialPredefined("G4_KAPTON")
-    """
-    # Use this to generate gdmls with NIST materials definitions
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    teflon = g4.nist_material_2geant4Material("G4_TEFLON")
-    kapton = g4.nist_material_2geant4Material("G4_KAPTON")
+    copper = materials.get_material("G4_Cu", reg)
+    teflon = materials.get_material("G4_TEFLON", reg)
+    kapton = materials.get_material("G4_KAPTON", reg)
 
     # Make different side by z->-z transformation.
     # We use rotation to easily mirror the volumes which are symmetric y->-y.
@@ -783,6 +784,22 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
         limandeInnerA = utils.get_solid_by_name("limandeInnerA", reg)
         limandeInnerB = utils.get_solid_by_name("limandeInnerB", reg)
 
+    board_material = copper
+    limande_material = copper
+    if collapse_laminates:
+        import sampling
+        # the copper foils of the active area only cover part of the board, whose mean area includes the folds (the
+        # volume estimate only weighs the foils, so a few 1e5 points are enough)
+        foil_fraction = mMLength**2 / (sampling.get_volume(mMBoardCopper, n_points=200000) / mMBoardThickness)
+        board_material = materials.get_laminate_material("mMBoardLaminate", [
+            ("G4_Cu", 2*mMCopperFoilThickness*(1 + foil_fraction)),
+            ("G4_KAPTON", mMBoardThickness - 2*mMCopperFoilThickness*(1 + foil_fraction)),
+        ], reg)
+        limande_material = materials.get_laminate_material("limandeLaminate", [
+            ("G4_Cu", 2*limandeCopperThickness),
+            ("G4_KAPTON", limandeThickness - 2*limandeCopperThickness),
+        ], reg)
+
 
     ### JOIN THE SOLIDS INTO THE ASSEMBLY
     micromegas_assembly = g4.AssemblyVolume(
@@ -826,7 +843,7 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
 
     mMBoardCopper_LV = g4.LogicalVolume(
         solid=mMBoardCopper,
-        material=copper,
+        material=board_material,
         name="mMBoardCopper_LV",
         registry=reg
     )
@@ -859,13 +876,13 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
     if not simple_geometry:
         limandeA_LV = g4.LogicalVolume(
             solid=limandeA,
-            material=copper,
+            material=limande_material,
             name="limandeA_LV",
             registry=reg
         )
         limandeB_LV = g4.LogicalVolume(
             solid=limandeB,
-            material=copper,
+            material=limande_material,
             name="limandeB_LV",
             registry=reg
         )
@@ -1005,31 +1022,32 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
         )
         #print("height of the support: ", mMSupport_pos_z-mMBaseThickness/2+capSupportBaseThickness/2, " mm")
 
-    mMCopperFoilLayer2_PV = g4.PhysicalVolume(
-        rotation=[0, 0, 0],
-        position=[0, 0, mMBoardThickness/2 - mMKaptonFoilThickness - mMCopperFoilThickness -mMKaptonFoilThickness - mMCopperFoilThickness/2],
-        name="mMCopperFoilLayer2",
-        logicalVolume=mMCopperFoil_LV,
-        motherVolume=mMBoardKapton_LV,
-        registry=reg
-    )
-    mMCopperFoilLayer3_PV = g4.PhysicalVolume(
-        rotation=[0, 0, 0],
-        position=[0, 0, mMBoardThickness/2 - mMKaptonFoilThickness - mMCopperFoilThickness*2 - mMKaptonFoilThickness*2 - mMCopperFoilThickness/2],
-        name="mMCopperFoilLayer3",
-        logicalVolume=mMCopperFoil_LV,
-        motherVolume=mMBoardKapton_LV,
-        registry=reg
-    )
+    if not collapse_laminates:
+        mMCopperFoilLayer2_PV = g4.PhysicalVolume(
+            rotation=[0, 0, 0],
+            position=[0, 0, mMBoardThickness/2 - mMKaptonFoilThickness - mMCopperFoilThickness -mMKaptonFoilThickness - mMCopperFoilThickness/2],
+            name="mMCopperFoilLayer2",
+            logicalVolume=mMCopperFoil_LV,
+            motherVolume=mMBoardKapton_LV,
+            registry=reg
+        )
+        mMCopperFoilLayer3_PV = g4.PhysicalVolume(
+            rotation=[0, 0, 0],
+            position=[0, 0, mMBoardThickness/2 - mMKaptonFoilThickness - mMCopperFoilThickness*2 - mMKaptonFoilThickness*2 - mMCopperFoilThickness/2],
+            name="mMCopperFoilLayer3",
+            logicalVolume=mMCopperFoil_LV,
+            motherVolume=mMBoardKapton_LV,
+            registry=reg
+        )
 
-    mMBoardKapton_PV = g4.PhysicalVolume(
-        rotation=[0, 0, 0],
-        position=[0, 0, 0],
-        name="mMBoardKapton",
-        logicalVolume=mMBoardKapton_LV,
-        motherVolume=mMBoardCopper_LV,
-        registry=reg
-    )
+        mMBoardKapton_PV = g4.PhysicalVolume(
+            rotation=[0, 0, 0],
+            position=[0, 0, 0],
+            name="mMBoardKapton",
+            logicalVolume=mMBoardKapton_LV,
+            motherVolume=mMBoardCopper_LV,
+            registry=reg
+        )
 
     mMBoardCopper_PV = g4.PhysicalVolume(
         rotation=side_rot.tolist(),
@@ -1040,7 +1058,7 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
         registry=reg
     )
 
-    if not simple_geometry:
+    if not simple_geometry and not collapse_laminates:
         limandeInnerA_PV = g4.PhysicalVolume(
             rotation=[0, 0, 0],
             position=[0, 0, 0],
@@ -1057,7 +1075,8 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
             motherVolume=limandeB_LV,
             registry=reg
         )
-        
+
+    if not simple_geometry:
         limande_z_pos = side_z_dir*(mMBaseThickness/2 + mMBaseBracketThickness + mMTeflonSpacerPadThickness + mMBoardThickness + limandeThickness/2)
         limande_x_or_y = mMBaseLength/2 - mMBaseEndToBracketDistance - limandeBracketSideWidth/2
         limande1_PV = g4.PhysicalVolume(
@@ -1093,6 +1112,25 @@ def generate_micromegas_assembly(name="micromegas_assembly", registry=None, is_r
             registry=reg
         )
 
+    if lod == "envelope":
+        # from the face of the board to the top of the supports, at the vessel cap
+        envelope_low = mMBaseThickness/2 + mMBoardThickness
+        envelope_high = mMBaseThickness/2 + capSupportFinalHeight
+        micromegasEnvelope = g4.solid.Tubs(
+            name="micromegasEnvelope",
+            pRMin=0,
+            pRMax=mMBaseRadius,
+            pDz=envelope_low + envelope_high,
+            pSPhi=0,
+            pDPhi=360,
+            aunit="deg",
+            lunit="mm",
+            registry=reg
+        )
+        envelopes.make_envelopes(micromegas_assembly, [
+            ("micromegasEnvelope", micromegasEnvelope, [0, 0, 0], [0, 0, side_z_dir*(envelope_high - envelope_low)/2], ["*"]),
+        ], reg)
+
     return reg
 
 if __name__ == "__main__":
@@ -1106,14 +1144,13 @@ if __name__ == "__main__":
     micromegas_assembly = utils.get_logical_volume_by_name("micromegas_assembly", reg)
 
     if args.gdml:
-        galactic = g4.nist_material_2geant4Material("G4_Galactic")
+        galactic = materials.get_material("G4_Galactic", reg)
         assembly_LV = micromegas_assembly.logicalVolume(material=galactic)
         reg.setWorld(assembly_LV.name)
-        w = pyg4ometry.gdml.Writer()
-        w.addDetector(reg)
-        w.write('micromegas.gdml')
+        utils.write_gdml(reg, 'micromegas.gdml')
 
     if args.vis:
+        import pyg4ometry.visualisation
         v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
         v.addLogicalVolume(micromegas_assembly.logicalVolume())
         v.addAxes(300)
@@ -0,0 +1,186 @@
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import sampling
+
+# Overlap check of the placed volumes of a registry, in two stages for every mother volume:
+# broad phase: the axis aligned bounding boxes of the daughters (in the frame of the mother) are sorted along x and
+# swept (sort and sweep), only the pairs of daughters whose boxes intersect are kept, and the daughters whose box
+# sticks out of the box of the mother.
+# narrow phase: points sampled on the surface of each candidate daughter are tested, in vectorised batches, against
+# the other daughter of the pair (overlap) or against the mother (protrusion).
+# A surface point overlaps a solid when it is inside it on both sides of the surface, by more than the tolerance.
+
+# Registry checked by the worker processes, inherited when they are forked
+_registry = None
+
+def get_boxes(placements):
+    """
+    Returns the (N, 3) arrays of the minimum and maximum corners of the bounding boxes of the (name, solid,
+    transformation) placements, in the frame of their mother.
+    """
+    extents = [sampling.get_operand_extent(solid, transform) for _, solid, transform in placements]
+    return np.array([low for low, _ in extents]).reshape(-1, 3), np.array([high for _, high in extents]).reshape(-1, 3)
+
+def get_candidate_pairs(low, high, tolerance=0.0):
+    """
+    Returns the list of (i, j) pairs, i < j, of the boxes intersecting by more than tolerance (sort and sweep along x).
+    """
+    order = np.argsort(low[:, 0], kind="stable")
+    sorted_low = low[order, 0]
+    # boxes starting before the end of each box along x
+    ends = np.searchsorted(sorted_low, high[order, 0] - tolerance, side="left")
+    pairs = []
+    for k, end in enumerate(ends):
+        others = order[k+1:end]
+        if len(others) == 0:
+            continue
+        i = order[k]
+        intersecting = np.all((low[others] < high[i] - tolerance) & (high[others] > low[i] + tolerance), axis=1)
+        pairs.extend((min(i, j), max(i, j)) for j in others[intersecting])
+    return sorted(pairs)
+
+def count_inside(solid, transform, points, normals, tolerance):
+    """
+    Returns the indices of the surface points (with their normals, in the frame of the mother) inside solid placed
+    with transform on both sides of the surface.
+    """
+    A, a = transform
+    low, high = sampling.get_operand_extent(solid, transform)
+    candidates = np.flatnonzero(np.all((points > low - tolerance) & (points < high + tolerance), axis=1))
+    if len(candidates) == 0:
+        return candidates
+    local_points = (points[candidates] - a) @ A
+    local_normals = normals[candidates] @ A
+    overlapping = sampling.inside(solid, local_points - tolerance*local_normals)
+    overlapping &= sampling.inside(solid, local_points + tolerance*local_normals)
+    return candidates[overlapping]
+
+def check_volume(volume, n_points=10000, tolerance=1e-3, seed=0):
+    """
+    Checks the daughters of a logical volume for overlaps between them and for protrusions out of the volume.
+    Returns the list of overlaps, dictionaries with the names of the mother, the daughter and the other daughter
+    (None for a protrusion), the number of offending surface points and the first of them in the frame of the mother.
+    param n_points: Number of points sampled on the surface of each daughter.
+    param tolerance: Overlaps shallower than this distance in mm are ignored, so touching volumes do not overlap.
+    """
+    placements = sampling.get_daughter_placements(volume)
+    if not placements:
+        return []
+    rng = np.random.default_rng([seed, zlib.crc32(volume.name.encode())])
+    low, high = get_boxes(placements)
+    mother_low, mother_high = sampling.get_extent(volume.solid)
+    protruding = np.flatnonzero(np.any((low < mother_low - tolerance) | (high > mother_high + tolerance), axis=1))
+    pairs = get_candidate_pairs(low, high, tolerance)
+
+    # surface points of the daughters, in their own frame: repeated daughters (rings, wires...) share their solid
+    surfaces = {}
+    def get_surface(index):
+        _, solid, (A, a) = placements[index]
+        if solid.name not in surfaces:
+            surfaces[solid.name] = sampling.surface_points(solid, n_points, rng, tolerance)
+        points, normals = surfaces[solid.name]
+        return points @ A.T + a, normals @ A.T
+
+    def report(index, other, offending, points):
+        return {
+            "mother": volume.name,
+            "daughter": placements[index][0],
+            "other": None if other is None else placements[other][0],
+            "points": len(offending),
+            "point": points[offending[0]].tolist(),
+        }
+
+    overlaps = []
+    for index in protruding:
+        points, normals = get_surface(index)
+        # a daughter surface point just inside the daughter must be inside the mother
+        outside = np.flatnonzero(~sampling.inside(volume.solid, points - tolerance*normals))
+        if len(outside):
+            overlaps.append(report(index, None, outside, points))
+    for i, j in pairs:
+        for index, other in ((i, j), (j, i)):
+            points, normals = get_surface(index)
+            offending = count_inside(placements[other][1], placements[other][2], points, normals, tolerance)
+            if len(offending):
+                overlaps.append(report(index, other, offending, points))
+                break  # one report per pair
+    return overlaps
+
+def _check_volume_by_name(task):
+    name, n_points, tolerance, seed = task
+    start = time.perf_counter()
+    overlaps = check_volume(_registry.logicalVolumeDict[name], n_points, tolerance, seed)
+    return name, overlaps, time.perf_counter() - start
+
+def check_registry(registry, n_points=10000, tolerance=1e-3, seed=0, jobs=None):
+    """
+    Checks every logical volume of the registry with check_volume, in parallel across mother volumes.
+    Returns the list of (mother name, overlaps, check time in seconds).
+    param jobs: Number of worker processes. Defaults to the number of CPUs; 1 checks in this process.
+    """
+    global _registry
+    names = [
+        name for name, volume in registry.logicalVolumeDict.items()
+        if hasattr(volume, "solid") and volume.daughterVolumes
+    ]
+    tasks = [(name, n_points, tolerance, seed) for name in names]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        _registry = registry
+        return [_check_volume_by_name(task) for task in tasks]
+    # the workers inherit the registry when forked instead of receiving a pickled copy
+    _registry = registry
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), mp_context=context) as executor:
+        return list(executor.map(_check_volume_by_name, tasks))
+
+def print_report(results, verbose=False):
+    """
+    Prints the overlaps found by check_registry. Returns the number of overlaps.
+    """
+    n_overlaps = 0
+    for name, overlaps, elapsed in results:
+        if verbose:
+            print(f"{name}: {len(overlaps)} overlaps, checked in {elapsed:.3f} s")
+        for overlap in overlaps:
+            point = ", ".join(f"{x:.3f}" for x in overlap["point"])
+            if overlap["other"] is None:
+                print(f"{overlap['mother']}: {overlap['daughter']} protrudes from the mother ({overlap['points']} points, e.g. ({point}) mm)")
+            else:
+                print(f"{overlap['mother']}: {overlap['daughter']} overlaps {overlap['other']} ({overlap['points']} points, e.g. ({point}) mm)")
+        n_overlaps += len(overlaps)
+    return n_overlaps
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the placed volumes of a geometry for overlaps.")
+    parser.add_argument("file", nargs="?", default=None, help="GDML file. Defaults to building the default trexdm configuration.")
+    parser.add_argument("-n", "--points", type=int, default=10000, help="Number of points sampled on the surface of each daughter")
+    parser.add_argument("-t", "--tolerance", type=float, default=1e-3, help="Overlaps shallower than this (mm) are ignored")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Print the check time of every mother volume")
+    args = parser.parse_args()
+
+    import pyg4ometry
+    pyg4ometry.config.doMeshing = False
+    if args.file:
+        import writer
+        reg = writer.read_registry(args.file)
+    else:
+        import trexdm
+        reg = trexdm.build_detector()
+
+    start = time.perf_counter()
+    results = check_registry(reg, n_points=args.points, tolerance=args.tolerance, seed=args.seed, jobs=args.jobs)
+    n_overlaps = print_report(results, verbose=args.verbose)
+    print(f"{len(results)} mother volumes checked in {time.perf_counter() - start:.1f} s, {n_overlaps} overlaps")
+    if n_overlaps:
+        sys.exit(1)
@@ -0,0 +1,519 @@
+import argparse
+import itertools
+import json
+import sys
+import weakref
+
+import numpy as np
+
+import booleans
+
+# Point containment tests for the solids of a registry, vectorised with numpy: points are (N, 3) arrays in mm in the
+# frame of the solid. Box, Tubs and Polyhedra are evaluated analytically, other primitives through their mesh, and booleans
+# operand by operand. They power Monte Carlo estimates of volumes and masses and shape regression checks.
+# Points can also be sampled on the surface of a solid (with their outward normals), which the overlap checker uses.
+
+def box_inside(solid, points):
+    half = np.array([solid.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ")]) / 2
+    return np.all(np.abs(points) <= half, axis=1)
+
+def box_extent(solid):
+    half = np.array([solid.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ")]) / 2
+    return -half, half
+
+def tubs_inside(solid, points):
+    rmin = solid.evaluateParameterWithUnits("pRMin")
+    rmax = solid.evaluateParameterWithUnits("pRMax")
+    dz = solid.evaluateParameterWithUnits("pDz") / 2  # pDz is the full length
+    sphi = solid.evaluateParameterWithUnits("pSPhi")
+    dphi = solid.evaluateParameterWithUnits("pDPhi")
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    r2 = x*x + y*y
+    result = (np.abs(z) <= dz) & (r2 <= rmax*rmax)
+    if rmin > 0:
+        result &= r2 >= rmin*rmin
+    if dphi < 2*np.pi:
+        result &= np.mod(np.arctan2(y, x) - sphi, 2*np.pi) <= dphi
+    return result
+
+def tubs_extent(solid):
+    rmax = solid.evaluateParameterWithUnits("pRMax")
+    dz = solid.evaluateParameterWithUnits("pDz") / 2
+    return np.array([-rmax, -rmax, -dz]), np.array([rmax, rmax, dz])
+
+def box_volume(solid):
+    x, y, z = (solid.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ"))
+    return x*y*z
+
+def box_area(solid):
+    x, y, z = (solid.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ"))
+    return 2 * (x*y + y*z + z*x)
+
+def box_surface(solid, n_points, rng):
+    half = np.array([solid.evaluateParameterWithUnits(name) for name in ("pX", "pY", "pZ")]) / 2
+    face_areas = np.array([half[1]*half[2], half[2]*half[0], half[0]*half[1]])
+    axis = rng.choice(3, size=n_points, p=face_areas / face_areas.sum())
+    sign = rng.choice([-1.0, 1.0], size=n_points)
+    points = rng.uniform(-half, half, size=(n_points, 3))
+    points[np.arange(n_points), axis] = sign * half[axis]
+    normals = np.zeros((n_points, 3))
+    normals[np.arange(n_points), axis] = sign
+    return points, normals
+
+def tubs_dimensions(solid):
+    return (solid.evaluateParameterWithUnits("pRMin"), solid.evaluateParameterWithUnits("pRMax"),
+            solid.evaluateParameterWithUnits("pDz") / 2, solid.evaluateParameterWithUnits("pSPhi"),
+            min(solid.evaluateParameterWithUnits("pDPhi"), 2*np.pi))
+
+def tubs_face_areas(solid):
+    """
+    Returns the areas of the outer, inner, end cap (both) and phi cut (both) faces of a Tubs.
+    """
+    rmin, rmax, dz, sphi, dphi = tubs_dimensions(solid)
+    phi_faces = 2 * (rmax - rmin) * 2*dz if dphi < 2*np.pi else 0
+    return np.array([dphi*rmax*2*dz, dphi*rmin*2*dz, dphi*(rmax*rmax - rmin*rmin), phi_faces])
+
+def tubs_volume(solid):
+    rmin, rmax, dz, sphi, dphi = tubs_dimensions(solid)
+    return dphi/2*(rmax*rmax - rmin*rmin) * 2*dz
+
+def tubs_area(solid):
+    return tubs_face_areas(solid).sum()
+
+def tubs_surface(solid, n_points, rng):
+    rmin, rmax, dz, sphi, dphi = tubs_dimensions(solid)
+    face_areas = tubs_face_areas(solid)
+    face = rng.choice(4, size=n_points, p=face_areas / face_areas.sum())
+    phi = rng.uniform(sphi, sphi + dphi, size=n_points)
+    z = rng.uniform(-dz, dz, size=n_points)
+    r = np.where(face == 0, rmax, rmin)
+    normal_r = np.where(face == 0, 1.0, -1.0)
+    normal_phi = np.zeros(n_points)
+    normal_z = np.zeros(n_points)
+    caps = face == 2
+    r[caps] = np.sqrt(rng.uniform(rmin*rmin, rmax*rmax, size=np.count_nonzero(caps)))
+    z[caps] = rng.choice([-dz, dz], size=np.count_nonzero(caps))
+    normal_r[caps] = 0
+    normal_z[caps] = np.sign(z[caps])
+    cuts = face == 3
+    r[cuts] = rng.uniform(rmin, rmax, size=np.count_nonzero(cuts))
+    end = rng.random(np.count_nonzero(cuts)) < 0.5
+    phi[cuts] = np.where(end, sphi + dphi, sphi)
+    normal_r[cuts] = 0
+    normal_phi[cuts] = np.where(end, 1.0, -1.0)
+    cos, sin = np.cos(phi), np.sin(phi)
+    points = np.column_stack([r*cos, r*sin, z])
+    normals = np.column_stack([normal_r*cos - normal_phi*sin, normal_r*sin + normal_phi*cos, normal_z])
+    return points, normals
+
+def polyhedra_dimensions(solid):
+    """
+    Returns the start phi, delta phi, number of sides and the lists of z, inner and outer tangent distances of a Polyhedra.
+    """
+    sphi = solid.evaluateParameterWithUnits("pSPhi")
+    dphi = min(solid.evaluateParameterWithUnits("pDPhi"), 2*np.pi)
+    numSide = int(solid.evaluateParameter(solid.numSide))
+    z, rmin, rmax = (np.array(solid.evaluateParameterWithUnits(name), dtype=float) for name in ("zPlane", "rInner", "rOuter"))
+    return sphi, dphi, numSide, z, rmin, rmax
+
+def polyhedra_inside(solid, points):
+    sphi, dphi, numSide, z_planes, rmin, rmax = polyhedra_dimensions(solid)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    # the rInner and rOuter of a polyhedra are the distances to the sides, measured along the normal of the side
+    # the point faces
+    phi = np.mod(np.arctan2(y, x) - sphi, 2*np.pi)
+    side = np.minimum(np.floor(phi / (dphi/numSide)), numSide - 1)
+    normal = sphi + (side + 0.5) * dphi/numSide
+    distance = x*np.cos(normal) + y*np.sin(normal)
+    result = np.zeros(len(points), dtype=bool)
+    # each pair of consecutive z planes is a section with linearly varying distances
+    for i in range(len(z_planes) - 1):
+        z0, z1 = z_planes[i], z_planes[i+1]
+        if z0 == z1:
+            continue
+        in_section = (z >= min(z0, z1)) & (z <= max(z0, z1))
+        t = (z - z0) / (z1 - z0)
+        inner = rmin[i] + t*(rmin[i+1] - rmin[i])
+        outer = rmax[i] + t*(rmax[i+1] - rmax[i])
+        result |= in_section & (distance >= inner) & (distance <= outer)
+    if dphi < 2*np.pi:
+        result &= phi <= dphi
+    return result
+
+def polyhedra_volume(solid):
+    sphi, dphi, numSide, z, rmin, rmax = polyhedra_dimensions(solid)
+    # the section of a polyhedra at a tangent distance r has an area k*r*r, which varies quadratically within a section
+    k = numSide*np.tan(dphi/numSide/2)
+    def integral(r):
+        return np.sum(np.abs(np.diff(z)) * (r[:-1]**2 + r[:-1]*r[1:] + r[1:]**2) / 3)
+    return k*(integral(rmax) - integral(rmin))
+
+def polyhedra_extent(solid):
+    sphi, dphi, numSide, z, rmin, rmax = polyhedra_dimensions(solid)
+    # the corners of the sides are on the rays between sides, at the tangent distance over the cosine of half a side
+    angles = sphi + np.arange(numSide + 1) * dphi/numSide
+    radii = np.concatenate([rmin, rmax]) / np.cos(dphi/numSide/2)
+    x = np.outer(radii, np.cos(angles))
+    y = np.outer(radii, np.sin(angles))
+    return np.array([x.min(), y.min(), z.min()]), np.array([x.max(), y.max(), z.max()])
+
+# Triangles of the meshes of the primitive solids, used for the point containment tests: {solid: triangles}. The
+# entries go away with their solids, so repeated builds in one process do not keep them alive.
+_triangles = weakref.WeakKeyDictionary()
+
+def get_triangles(solid):
+    """
+    Returns the (N, 3, 3) array with the triangles of the mesh of a primitive solid.
+    """
+    cached = _triangles.get(solid)
+    if cached is not None:
+        return cached
+    vertices, polygons, _ = solid.mesh().toVerticesAndPolygons()
+    vertices = np.array(vertices, dtype=float)
+    triangles = [[polygon[0], polygon[i], polygon[i+1]] for polygon in polygons for i in range(1, len(polygon) - 1)]
+    triangles = vertices[np.array(triangles, dtype=int)]
+    _triangles[solid] = triangles
+    return triangles
+
+def mesh_inside(solid, points, chunk_size=512):
+    """
+    Returns a boolean array, True for the points (N x 3 array) inside the mesh of solid.
+    Counts the crossings of a ray from each point with the triangles of the mesh (Moller-Trumbore).
+    """
+    triangles = get_triangles(solid)
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    # an irrational direction so that the rays do not go through edges of the (mostly axis aligned) meshes
+    direction = np.array([0.5773502691896258, 0.5773502691896257, 0.5773502691896259]) + np.array([1e-3, np.sqrt(2)*1e-3, np.pi*1e-3])
+    direction /= np.linalg.norm(direction)
+    h = np.cross(direction, e2)
+    det = np.einsum("ij,ij->i", e1, h)
+    valid = np.abs(det) > 1e-12
+    v0, e1, e2, h, det = v0[valid], e1[valid], e2[valid], h[valid], det[valid]
+    inv_det = 1 / det
+    result = np.zeros(len(points), dtype=bool)
+    for start in range(0, len(points), chunk_size):
+        s = points[start:start+chunk_size, None, :] - v0[None, :, :]
+        u = np.einsum("pij,ij->pi", s, h) * inv_det
+        q = np.cross(s, e1[None, :, :])
+        v = (q @ direction) * inv_det
+        t = np.einsum("pij,ij->pi", q, e2) * inv_det
+        hits = (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+        result[start:start+chunk_size] = hits.sum(axis=1) % 2 == 1
+    return result
+
+def mesh_surface(solid, n_points, rng):
+    """
+    Returns (points, outward normals) of n_points sampled uniformly on the triangles of the mesh of solid.
+    """
+    triangles = get_triangles(solid)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    chosen = rng.choice(len(triangles), size=n_points, p=areas / areas.sum())
+    u, v = rng.random((2, n_points))
+    flip = u + v > 1
+    u[flip], v[flip] = 1 - u[flip], 1 - v[flip]
+    t = triangles[chosen]
+    points = t[:, 0] + u[:, None]*(t[:, 1] - t[:, 0]) + v[:, None]*(t[:, 2] - t[:, 0])
+    return points, normals[chosen] / areas[chosen, None]
+
+def mesh_area(solid):
+    triangles = get_triangles(solid)
+    return np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1).sum() / 2
+
+# Analytic containment test, extent, volume, area and surface sampling of each primitive type, the other primitives use
+# their mesh (polyhedra only for their area and surface)
+PRIMITIVES = {
+    "Box": {"inside": box_inside, "extent": box_extent, "volume": box_volume, "area": box_area, "surface": box_surface},
+    "Tubs": {"inside": tubs_inside, "extent": tubs_extent, "volume": tubs_volume, "area": tubs_area, "surface": tubs_surface},
+    "Polyhedra": {"inside": polyhedra_inside, "extent": polyhedra_extent, "volume": polyhedra_volume, "area": mesh_area, "surface": mesh_surface},
+}
+
+def to_operand_frame(points, transform):
+    A, a = transform
+    if booleans.is_identity(transform):
+        return points
+    return (points - a) @ A
+
+def get_operand_extent(operand, transform):
+    """
+    Returns the (minimum, maximum) corners of an axis aligned box containing operand placed with transform.
+    """
+    A, a = transform
+    low, high = get_extent(operand)
+    corners = np.array(list(itertools.product(*zip(low, high)))) @ A.T + a
+    return corners.min(axis=0), corners.max(axis=0)
+
+def inside(solid, points):
+    """
+    Returns a boolean array, True for the points (N x 3 array, in mm in the frame of solid) inside solid.
+    Points on the surface count as inside.
+    """
+    if solid.type in PRIMITIVES:
+        return PRIMITIVES[solid.type]["inside"](solid, points)
+    operands = booleans.get_operand_transforms(solid)
+    if not operands:
+        return mesh_inside(solid, points)
+    is_union = solid.type in ("Union", "MultiUnion")
+    result = np.zeros(len(points), dtype=bool) if is_union else None
+    for operand, transform in operands:
+        if result is None:  # first operand of a subtraction or intersection
+            result = inside(operand, to_operand_frame(points, transform))
+            continue
+        # only evaluate the points whose result can still change and that are in the extent of the operand
+        pending = np.flatnonzero(~result if is_union else result)
+        low, high = get_operand_extent(operand, transform)
+        in_extent = np.all((points[pending] >= low) & (points[pending] <= high), axis=1)
+        if solid.type == "Intersection":
+            result[pending[~in_extent]] = False
+        pending = pending[in_extent]
+        if len(pending) == 0:
+            continue
+        operand_inside = inside(operand, to_operand_frame(points[pending], transform))
+        result[pending] = ~operand_inside if solid.type == "Subtraction" else operand_inside
+    return result
+
+def get_area(solid):
+    """
+    Returns the area of a primitive solid, or an upper bound (the sum of the areas of the operands) for a boolean.
+    """
+    if solid.type in PRIMITIVES:
+        return PRIMITIVES[solid.type]["area"](solid)
+    operands = booleans.get_operands(solid)
+    if not operands:
+        return mesh_area(solid)
+    return sum(get_area(operand) for operand in operands)
+
+def _operand_surfaces(solid, n_points, rng):
+    """
+    Returns (points, normals) sampled on the surfaces of the primitives of solid, in the frame of solid.
+    """
+    if solid.type in PRIMITIVES:
+        return PRIMITIVES[solid.type]["surface"](solid, n_points, rng)
+    operands = booleans.get_operand_transforms(solid)
+    if not operands:
+        return mesh_surface(solid, n_points, rng)
+    areas = np.array([get_area(operand) for operand, _ in operands])
+    counts = rng.multinomial(n_points, areas / areas.sum())
+    points, normals = [], []
+    for (operand, (A, a)), count in zip(operands, counts):
+        if count == 0:
+            continue
+        operand_points, operand_normals = _operand_surfaces(operand, count, rng)
+        points.append(operand_points @ A.T + a)
+        normals.append(operand_normals @ A.T)
+    return np.concatenate(points), np.concatenate(normals)
+
+def surface_points(solid, n_points, rng=None, tolerance=1e-3):
+    """
+    Returns (points, outward normals) sampled on the surface of solid, in its frame.
+    The surfaces of the primitives of a boolean are sampled (proportionally to their area) and only the points where the
+    boundary of the boolean lies are kept, so fewer than n_points are returned for booleans.
+    param tolerance: Distance in mm along the normal used to tell whether a point is on the surface.
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    points, normals = _operand_surfaces(solid, n_points, rng)
+    if solid.type in PRIMITIVES or not booleans.get_operands(solid):
+        return points, normals
+    inside_behind = inside(solid, points - tolerance*normals)
+    inside_ahead = inside(solid, points + tolerance*normals)
+    on_surface = inside_behind != inside_ahead
+    # the surfaces of subtracted solids face the other way
+    normals = np.where(inside_ahead[:, None], -normals, normals)
+    return points[on_surface], normals[on_surface]
+
+def get_extent(solid):
+    """
+    Returns the (minimum, maximum) corners of an axis aligned box containing solid.
+    """
+    if solid.type in PRIMITIVES:
+        return PRIMITIVES[solid.type]["extent"](solid)
+    operands = booleans.get_operand_transforms(solid)
+    if not operands:
+        triangles = get_triangles(solid)
+        return triangles.min(axis=(0, 1)), triangles.max(axis=(0, 1))
+    extents = [get_operand_extent(operand, transform) for operand, transform in operands]
+    if solid.type == "Subtraction":
+        return extents[0]
+    if solid.type == "Intersection":
+        return np.maximum(extents[0][0], extents[1][0]), np.minimum(extents[0][1], extents[1][1])
+    return np.min([low for low, _ in extents], axis=0), np.max([high for _, high in extents], axis=0)
+
+def get_volume(solid, n_points=1000000, seed=0, chunk_size=200000):
+    """
+    Returns the volume of solid in mm3: exact for the primitives of PRIMITIVES, estimated by Monte Carlo in the extent
+    of the solid otherwise (with a fixed seed, so that the same solid always gives the same value).
+    """
+    if solid.type in PRIMITIVES:
+        return PRIMITIVES[solid.type]["volume"](solid)
+    low, high = get_extent(solid)
+    rng = np.random.default_rng(seed)
+    n_inside = 0
+    for start in range(0, n_points, chunk_size):
+        points = rng.uniform(low, high, size=(min(chunk_size, n_points - start), 3))
+        n_inside += np.count_nonzero(inside(solid, points))
+    return float(np.prod(high - low)) * n_inside / n_points
+
+def get_daughter_volumes(volume, transform=None, prefix=""):
+    """
+    Returns the list of (name, logical volume, transformation) of the daughters of a logical volume, in the frame of the
+    volume. The daughters of assembly volumes are placed directly, as Geant4 does, and named after the path of
+    physical volumes leading to them (e.g. "resistorAssemblyLeft/resistor_PV"), and replicas once per copy (see
+    utils.get_copies).
+    """
+    import utils
+
+    if transform is None:
+        transform = (np.eye(3), np.zeros(3))
+    daughters = []
+    copies, matrices = utils.get_daughter_copies(volume)
+    for (physical, name), matrix in zip(copies, matrices):
+        daughter_transform = booleans.compose(transform, (matrix[:3, :3], matrix[:3, 3]))
+        logical = physical.logicalVolume
+        if hasattr(logical, "solid"):
+            daughters.append((prefix + name, logical, daughter_transform))
+        else:
+            daughters.extend(get_daughter_volumes(logical, daughter_transform, prefix + name + "/"))
+    return daughters
+
+def get_daughter_placements(volume):
+    """
+    Returns the list of (name, solid, transformation) of the daughters of a logical volume, in the frame of the volume
+    (see get_daughter_volumes).
+    """
+    return [(name, logical.solid, transform) for name, logical, transform in get_daughter_volumes(volume)]
+
+def get_materials(volume, points):
+    """
+    Returns the array with the name of the material at each point (N x 3 array, in mm in the frame of the logical
+    volume): the material of the deepest volume containing it. A point inside several daughters (an overlap) takes
+    the first one, as it would be in the order of the daughters.
+    """
+    materials = np.full(len(points), volume.material.name, dtype=object)
+    free = np.ones(len(points), dtype=bool)
+    for _, logical, transform in get_daughter_volumes(volume):
+        candidates = np.flatnonzero(free)
+        low, high = get_operand_extent(logical.solid, transform)
+        candidates = candidates[np.all((points[candidates] >= low) & (points[candidates] <= high), axis=1)]
+        if len(candidates) == 0:
+            continue
+        local = to_operand_frame(points[candidates], transform)
+        hits = inside(logical.solid, local)
+        materials[candidates[hits]] = get_materials(logical, local[hits])
+        free[candidates[hits]] = False
+    return materials
+
+def get_daughter_solids(volume):
+    """
+    Returns the list of (solid, transformation) of the daughters of a logical volume, in the frame of the volume.
+    """
+    return [(solid, transform) for _, solid, transform in get_daughter_placements(volume)]
+
+def estimate_volume(volume, n_points=1000000, seed=0, chunk_size=200000):
+    """
+    Estimates by Monte Carlo the volume of the solid of a logical volume and the volume of its own material
+    (the solid minus its daughters), sampling n_points uniformly in the extent of the solid.
+    Returns a dictionary with the volumes and their statistical errors in mm3, and the mass in g if the density
+    of the material is known.
+    """
+    solid = volume.solid
+    low, high = get_extent(solid)
+    box_volume = float(np.prod(high - low))
+    daughters = get_daughter_solids(volume)
+    rng = np.random.default_rng(seed)
+    n_solid = n_material = 0
+    for start in range(0, n_points, chunk_size):
+        points = rng.uniform(low, high, size=(min(chunk_size, n_points - start), 3))
+        in_solid = inside(solid, points)
+        in_material = in_solid.copy()
+        for daughter, transform in daughters:
+            pending = np.flatnonzero(in_material)
+            if len(pending) == 0:
+                break
+            in_material[pending] = ~inside(daughter, to_operand_frame(points[pending], transform))
+        n_solid += np.count_nonzero(in_solid)
+        n_material += np.count_nonzero(in_material)
+
+    def volume_and_error(n):
+        fraction = n / n_points
+        return box_volume * fraction, box_volume * np.sqrt(fraction * (1 - fraction) / n_points)
+
+    solid_volume, solid_error = volume_and_error(n_solid)
+    material_volume, material_error = volume_and_error(n_material)
+    result = {
+        "solid": solid.name,
+        "volume": solid_volume,
+        "volume_error": solid_error,
+        "material_volume": material_volume,
+        "material_volume_error": material_error,
+    }
+    density = getattr(volume.material, "density", None)  # g/cm3
+    if density:
+        result["mass"] = material_volume * 1e-3 * density
+        result["mass_error"] = material_error * 1e-3 * density
+    return result
+
+def estimate_registry(registry, n_points=1000000, seed=0):
+    """
+    Returns a dictionary {logical volume name: estimate_volume result} for every logical volume of the registry.
+    """
+    return {
+        name: estimate_volume(volume, n_points=n_points, seed=seed)
+        for name, volume in registry.logicalVolumeDict.items()
+        if hasattr(volume, "solid")
+    }
+
+def compare_estimates(estimates, reference, n_sigma=5):
+    """
+    Returns the list of (volume name, quantity, value, reference value) of the volumes and masses of estimates that
+    differ from reference by more than n_sigma combined statistical errors, or that are missing from either.
+    """
+    differences = []
+    for name in sorted(set(estimates) | set(reference)):
+        if name not in estimates or name not in reference:
+            differences.append((name, "missing", name in estimates, name in reference))
+            continue
+        for quantity in ("volume", "material_volume"):
+            value, reference_value = estimates[name][quantity], reference[name][quantity]
+            error = np.hypot(estimates[name][f"{quantity}_error"], reference[name][f"{quantity}_error"])
+            if abs(value - reference_value) > n_sigma * error + 1e-9 * abs(reference_value):
+                differences.append((name, quantity, value, reference_value))
+    return differences
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo volume and mass of the logical volumes of a geometry.")
+    parser.add_argument("file", nargs="?", default=None, help="GDML file. Defaults to building the default trexdm configuration.")
+    parser.add_argument("-n", "--points", type=int, default=1000000, help="Number of sampled points per volume")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", type=str, default=None, help="Save the estimates to this JSON file, to be used as reference")
+    parser.add_argument("--compare", type=str, default=None, help="Compare the estimates with a reference JSON file and exit with an error if they differ")
+    parser.add_argument("--sigma", type=float, default=5, help="Number of statistical errors allowed by --compare")
+    args = parser.parse_args()
+
+    import pyg4ometry
+    if args.file:
+        reg = pyg4ometry.gdml.Reader(args.file).getRegistry()
+    else:
+        import trexdm
+        pyg4ometry.config.doMeshing = False
+        reg = trexdm.build_detector()
+
+    estimates = estimate_registry(reg, n_points=args.points, seed=args.seed)
+    print(f"{'logical volume':<35} {'solid volume [cm3]':>20} {'material volume [cm3]':>23} {'mass [kg]':>18}")
+    for name, estimate in estimates.items():
+        mass = f"{estimate['mass']*1e-3:9.4f} +- {estimate['mass_error']*1e-3:.4f}" if "mass" in estimate else ""
+        print(f"{name:<35} {estimate['volume']*1e-3:11.3f} +- {estimate['volume_error']*1e-3:<6.3f} {estimate['material_volume']*1e-3:11.3f} +- {estimate['material_volume_error']*1e-3:<8.3f} {mass:>18}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(estimates, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)
+        differences = compare_estimates(estimates, reference, n_sigma=args.sigma)
+        for difference in differences:
+            print("Differs from reference: {} {} {} (reference {})".format(*difference))
+        if differences:
+            sys.exit(1)
@@ -1,7 +1,8 @@
-import vtk
 import pyg4ometry
 import numpy as np
 from pyg4ometry import geant4 as g4
+import envelopes
+import materials
 import utils
 
 copperTopThickness = 50
@@ -34,7 +35,14 @@ copperTopSizeX  = leadSizeX
 copperTopSizeY  = copperCageThickness
 copperTopSizeZ  = leadSizeZ
 
-def generate_shielding_assembly_by_parts(name="shielding_assembly", open_calibration_lead_block=False, registry=None):
+def generate_shielding_assembly_by_parts(name="shielding_assembly", open_calibration_lead_block=False, registry=None, lod="full"):
+    """
+    Generates the shielding geometry for the TREX-DM detector as an assembly of its parts.
+    param lod: Level of detail, see envelopes.LEVELS. The shielding is made of a few homogeneous blocks and is the same
+    at every level.
+    Returns a Geant4 Registry containing the shielding geometry.
+    """
+    envelopes.check_level(lod)
     # Registry
     if registry is None:
         reg = g4.Registry()
@@ -43,14 +51,9 @@ def generate_shielding_assembly_by_parts(name="shielding_assembly", open_calibra
 
     # Materials
     
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    lead = g4.nist_material_2geant4Material("G4_Pb")
-    air = g4.nist_material_2geant4Material("G4_AIR")
-    """
-    copper = g4.MaterialPredefined("G4_Cu", reg)
-    lead = g4.MaterialPredefined("G4_Pb", reg)
-    air = g4.MaterialPredefined("G4_AIR", reg)
-    """
+    copper = materials.get_material("G4_Cu", reg)
+    lead = materials.get_material("G4_Pb", reg)
+    air = materials.get_material("G4_AIR", reg)
 
     copperCageYpos = -castleSizeY/2 + leadThickness + copperCageOutSizeY/2
     leadCageYpos = -castleSizeY/2 + leadSizeY/2
@@ -259,25 +262,22 @@ def generate_shielding_assembly_by_parts(name="shielding_assembly", open_calibra
 
     return reg
 
-def generate_shielding_volume(name="shielding_LV", open_calibration_lead_block=False, registry=None):
+def generate_shielding_volume(name="shielding_LV", open_calibration_lead_block=False, registry=None, lod="full"):
     """
     Generates the shielding geometry for the TREX-DM detector.
+    param lod: Level of detail, see envelopes.LEVELS. The shielding is the same at every level.
     Returns a Geant4 Registry containing the shielding geometry.
     """
+    envelopes.check_level(lod)
     # Registry
     if registry is None:
         reg = g4.Registry()
     else:
         reg = registry  
 
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    lead = g4.nist_material_2geant4Material("G4_Pb")
-    air = g4.nist_material_2geant4Material("G4_AIR")
-    """
-    copper = g4.MaterialPredefined("G4_Cu", reg)
-    lead = g4.MaterialPredefined("G4_Pb", reg)
-    air = g4.MaterialPredefined("G4_AIR", reg)
-    """
+    copper = materials.get_material("G4_Cu", reg)
+    lead = materials.get_material("G4_Pb", reg)
+    air = materials.get_material("G4_AIR", reg)
 
     copperCage = g4.solid.Box(
         name="copperCage",
@@ -437,14 +437,13 @@ if __name__ == "__main__":
 
 
     if args.gdml:
-        galactic = g4.nist_material_2geant4Material("G4_Galactic")
+        galactic = materials.get_material("G4_Galactic", reg)
         assembly_LV = shielding.logicalVolume(material=galactic)
         reg.setWorld(assembly_LV.name)
-        w = pyg4ometry.gdml.Writer()
-        w.addDetector(reg)
-        w.write('shielding.gdml')
+        utils.write_gdml(reg, 'shielding.gdml')
 
     if args.vis:
+        import pyg4ometry.visualisation
         v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
         v.addLogicalVolume(shielding)
         v.addAxes(200)
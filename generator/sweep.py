@@ -0,0 +1,154 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import time
+
+import cache
+import trexdm
+
+# Full configuration matrix. A grid spec file may override any of these lists.
+DEFAULT_GRID = {
+    "gas": [
+        "Argon1%Isobutane1bar",
+        "Argon1%Isobutane1.1bar",
+        "Argon2%Isobutane1.1bar",
+        "Neon2%Isobutane1.1bar",
+        "Neon2%Isobutane2bar",
+        "Neon2%Isobutane4bar",
+    ],
+    "cathode_type": ["wired", "plain"],
+    "left_calibration_open": [True, False],
+    "right_calibration_open": [True, False],
+    "open_calibration_lead_blocks": [False, True],
+    "simplify_mm_geometry": [False, True],
+}
+
+def expand_grid(grid):
+    """
+    Returns the list of configurations of every combination of the values in grid.
+    Parameters missing from grid take the default value of trexdm.DEFAULT_CONFIG.
+    """
+    keys = list(trexdm.DEFAULT_CONFIG.keys())
+    values = [grid.get(key, [trexdm.DEFAULT_CONFIG[key]]) for key in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+def build_variant(task):
+    """
+    Builds and writes one configuration of the sweep. Runs in a worker process.
+    param task: Tuple (config, filename, childless, cache_key).
+    Returns the tuple (filename, build time in seconds).
+    """
+    import pyg4ometry
+    import utils
+
+    config, filename, childless, cache_key = task
+    noDaughtersName, extension = trexdm.childless_name(filename)
+    start = time.perf_counter()
+    # The sweep never visualises, so skip building the meshes of the volumes
+    pyg4ometry.config.doMeshing = False
+    # every variant is built from scratch: building all the sub-assemblies takes a few milliseconds, less than
+    # writing the file, so they are not shared between variants
+    reg = trexdm.build_detector(config)
+
+    utils.write_gdml(reg, filename)
+    if cache_key is not None:
+        cache.store(cache_key, filename, extension=extension)
+
+    if childless:
+        reg_noDaughters = utils.transfer_childless_world(reg)
+        utils.write_gdml(reg_noDaughters, noDaughtersName)
+        if cache_key is not None:
+            cache.store(cache_key, noDaughtersName, "_noDaughters", extension=extension)
+
+    return filename, time.perf_counter() - start
+
+def check_variant(config, filename, childless=False):
+    """
+    Builds the configuration of a sweep variant on its own, as trexdm.py does, and compares it with the files
+    written by the sweep (and the _noDaughters file if childless).
+    Returns the list of the file names whose content differs.
+    """
+    import hashlib
+    import pyg4ometry
+    import utils
+    import writer
+
+    pyg4ometry.config.doMeshing = False
+    reg = trexdm.build_detector(config)
+    utils.prune_registry(reg)
+    expected = [(filename, reg)]
+    if childless:
+        expected.append((trexdm.childless_name(filename)[0], utils.transfer_childless_world(reg)))
+    mismatches = []
+    for name, registry in expected:
+        utils.prune_registry(registry)
+        if writer.read_hash(name) != hashlib.sha256(writer.to_string(registry).encode()).hexdigest():
+            mismatches.append(name)
+    return mismatches
+
+def run_sweep(grid, output_dir=".", jobs=None, childless=False, use_cache=True, compression=None):
+    """
+    Generates the GDML file of every configuration of grid in output_dir, using a pool of jobs worker processes.
+    Configurations already in the geometry cache are copied from it instead of being built.
+    param compression: "gz" or "zst" to write compressed .gdml.gz or .gdml.zst files.
+    Returns the list of written file names.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    modules = cache.GENERATOR_MODULES + ["trexdm"]
+    tasks = []
+    written = []
+    for config in expand_grid(grid):
+        filename = os.path.join(output_dir, trexdm.default_name(config)) + (f".{compression}" if compression else "")
+        noDaughtersName, extension = trexdm.childless_name(filename)
+        key = cache.config_key(config, modules=modules) if use_cache else None
+        if key is not None and cache.contains(key, extension=extension) and (not childless or cache.contains(key, "_noDaughters", extension=extension)):
+            cache.fetch(key, filename, extension=extension)
+            if childless:
+                cache.fetch(key, noDaughtersName, "_noDaughters", extension=extension)
+            print(f"{filename}: found in cache")
+            written.append(filename)
+            continue
+        tasks.append((config, filename, childless, key))
+
+    if tasks:
+        jobs = jobs or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            for filename, elapsed in executor.map(build_variant, tasks):
+                print(f"{filename}: built in {elapsed:.1f} s")
+                written.append(filename)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the GDML files of every combination of a configuration grid.")
+    parser.add_argument("-g", "--grid", type=str, default=None, help="JSON file mapping configuration parameters to lists of values. Defaults to the full matrix.")
+    parser.add_argument("-o", "--output-dir", type=str, default=".", help="Directory for the GDML files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--childless", action="store_true", default=False, help="Also write the _noDaughters version of each file")
+    parser.add_argument("--compression", choices=["gz", "zst"], default=None, help="Compress the GDML files as they are written (.gdml.gz or .gdml.zst)")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Always rebuild the geometry instead of using the GDML cache")
+    parser.add_argument("--check", action="store_true", default=False, help="Build the first variant again on its own, as trexdm.py does, and fail if its files differ from the sweep output")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid is not None:
+        with open(args.grid) as f:
+            grid = json.load(f)
+        unknown = set(grid) - set(trexdm.DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown configuration parameters in grid: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    written = run_sweep(grid, output_dir=args.output_dir, jobs=args.jobs, childless=args.childless, use_cache=not args.no_cache, compression=args.compression)
+    print(f"{len(written)} geometries written to {args.output_dir} in {time.perf_counter() - start:.1f} s")
+    if args.check:
+        config = expand_grid(grid)[0]
+        filename = os.path.join(args.output_dir, trexdm.default_name(config)) + (f".{args.compression}" if args.compression else "")
+        mismatches = check_variant(config, filename, childless=args.childless)
+        for name in mismatches:
+            print(f"{name} differs from the single build of its configuration")
+        if mismatches:
+            sys.exit(1)
+        print(f"{filename} matches the single build of its configuration")
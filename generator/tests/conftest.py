@@ -0,0 +1,10 @@
+import os
+import sys
+
+import pyg4ometry
+
+# The generators are scripts importing each other by module name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing is visualised, so the logical volumes are not meshed (see trexdm.py)
+pyg4ometry.config.doMeshing = False
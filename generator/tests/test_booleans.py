@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from pyg4ometry import geant4 as g4
+
+import booleans
+import materials
+import sampling
+import trexdm
+
+# Rotations and positions of the boxes of the hand-built solids, with rotations about every axis
+TRANSFORMS = [
+    ([0, 0, 0], [0, 0, 0]),
+    ([0, 0, 0.6386], [30, 0, 0]),
+    ([np.pi/2, 0, 0], [0, 25, 5]),
+    ([0.3, -0.4, 1.2], [-20, -10, 8]),
+    ([0, np.pi/2, np.pi], [10, 10, -15]),
+]
+
+def make_volume(solid, registry):
+    return g4.LogicalVolume(solid, materials.get_material("G4_Cu", registry), f"{solid.name}_LV", registry)
+
+def make_union_chain(registry):
+    solid = g4.solid.Box("box0", 40, 20, 10, registry)
+    for i, (rotation, position) in enumerate(TRANSFORMS[1:], 1):
+        box = g4.solid.Box(f"box{i}", 40, 20 - 2*i, 10 + i, registry)
+        solid = g4.solid.Union(f"union{i}", solid, box, [rotation, position], registry)
+    return solid
+
+def make_subtraction_chain(registry):
+    solid = g4.solid.Box("base", 80, 80, 40, registry)
+    for i, (rotation, position) in enumerate(TRANSFORMS[1:], 1):
+        box = g4.solid.Box(f"hole{i}", 30, 8 + i, 12, registry)
+        solid = g4.solid.Subtraction(f"subtraction{i}", solid, box, [rotation, position], registry)
+    return solid
+
+@pytest.mark.parametrize("mode", ["multiunion", "balanced"])
+@pytest.mark.parametrize("make_solid", [make_union_chain, make_subtraction_chain])
+def test_flattened_solid_matches_mesh_of_original(make_solid, mode):
+    # the original is evaluated through its pyg4ometry mesh, so the transformations of the flattened solid are
+    # checked against pyg4ometry and not only against the sampler
+    original_registry, registry = g4.Registry(), g4.Registry()
+    original = make_solid(original_registry)
+    volume = make_volume(make_solid(registry), registry)
+    report = booleans.flatten_booleans(registry, mode=mode)
+    assert [name for name, _, _ in report] == [original.name]
+    assert booleans.analyse_solid(volume.solid)["depth"] < booleans.analyse_solid(original)["depth"]
+    low, high = sampling.get_extent(original)
+    points = np.random.default_rng(0).uniform(low - 5, high + 5, size=(5000, 3))
+    expected = sampling.mesh_inside(original, points)
+    assert 0 < np.count_nonzero(expected) < len(points)
+    assert np.array_equal(sampling.inside(volume.solid, points), expected)
+
+@pytest.mark.parametrize("mode", ["multiunion", "balanced"])
+def test_flattened_detector_matches_original(mode):
+    original = trexdm.build_detector()
+    registry = trexdm.build_detector()
+    report = booleans.flatten_booleans(registry, mode=mode)
+    assert len(report) > 0
+    for name, before, after in report:
+        assert after["depth"] <= before["depth"]
+        assert booleans.check_equivalence(registry.solidDict[name], original.solidDict[name], n_points=5000) == 0
@@ -0,0 +1,72 @@
+import pytest
+from pyg4ometry import geant4 as g4
+
+import materials
+
+# Standard atomic weights (g/mol), independent of the NIST isotopes materials.get_molar_mass uses
+ATOMIC_WEIGHTS = {"Ar": 39.948, "Ne": 20.180, "C": 12.011, "H": 1.008}
+
+# Densities (g/cm3) and argon mass fractions of the argon mixtures, as they were hardcoded in vessel.py
+ARGON_MIXTURES = {
+    "Argon1%Isobutane1bar": (0.00161882, 0.9855),
+    "Argon1%Isobutane1.1bar": (0.00178070, 0.9855),
+    "Argon2%Isobutane1.1bar": (0.00178877, 0.9711),
+}
+
+def get_molar_mass(formula):
+    return sum(atoms*ATOMIC_WEIGHTS[symbol] for symbol, atoms in formula.items())
+
+def test_gas_density():
+    # argon at 1 bar and 20 C
+    assert materials.get_gas_density(ATOMIC_WEIGHTS["Ar"], 1, 293.15) == pytest.approx(1.6390e-3, rel=1e-4)
+    assert materials.get_molar_mass(materials.GASES["Isobutane"]) == pytest.approx(58.12, rel=1e-4)
+
+@pytest.mark.parametrize("name", ["Argon1%Isobutane1.1bar", "Neon2%Isobutane1.1bar", "Neon2%Isobutane4bar", "Argon5%Neon2%Isobutane2bar"])
+def test_gas_mixture(name):
+    fractions, pressure = materials.parse_gas_mixture(name)
+    assert sum(fractions.values()) == pytest.approx(1)
+    masses = {gas: fraction*get_molar_mass(materials.GASES[gas]) for gas, fraction in fractions.items()}
+    molar_mass = sum(masses.values())
+    registry = g4.Registry()
+    material = materials.get_material(name, registry)
+    assert material.density == pytest.approx(pressure*1e5*molar_mass/(materials.GAS_CONSTANT*materials.MIXTURE_TEMPERATURE)*1e-6, rel=1e-4)
+    assert {component.name: fraction for component, fraction, _ in material.components} == pytest.approx(
+        {f"{gas}Gas": mass/molar_mass for gas, mass in masses.items()}, rel=1e-4)
+
+@pytest.mark.parametrize("name", list(ARGON_MIXTURES))
+def test_argon_mixture_matches_previous_values(name):
+    density, argon_fraction = ARGON_MIXTURES[name]
+    material = materials.get_material(name, g4.Registry())
+    assert material.density == pytest.approx(density, rel=2e-5)
+    assert material.components[0][0].name == "ArgonGas"
+    assert material.components[0][1] == pytest.approx(argon_fraction, abs=1e-4)
+
+@pytest.mark.parametrize("name", ["Argon1%Xenon1bar", "Argon60%Neon50%Isobutane1bar", "Argon1%Isobutane"])
+def test_invalid_gas_mixture(name):
+    with pytest.raises(ValueError):
+        materials.get_material(name, g4.Registry())
+
+def test_laminate_keeps_mass():
+    registry = g4.Registry()
+    layers = [("G4_Cu", 0.017), ("G4_KAPTON", 0.05), ("G4_Cu", 0.017*0.4)]
+    material = materials.get_laminate_material("laminate", layers, registry, thickness=0.1)
+    masses = {"G4_Cu": 0.017*1.4*materials.get_density("G4_Cu", registry), "G4_KAPTON": 0.05*materials.get_density("G4_KAPTON", registry)}
+    mass = sum(masses.values())
+    assert material.density == pytest.approx(mass/0.1)
+    assert materials.get_mass_fractions("laminate", registry) == pytest.approx({name: m/mass for name, m in masses.items()})
+
+def test_mixture_keeps_mass():
+    registry = g4.Registry()
+    materials.get_laminate_material("laminate", [("G4_Cu", 1), ("G4_KAPTON", 3)], registry)
+    laminate_density = materials.get_density("laminate", registry)
+    # 50 g of copper and 10 cm3 of the laminate in 20 cm3
+    masses = {"G4_Cu": 50, "laminate": 10*laminate_density}
+    material = materials.get_mixture_material("mixture", masses, 20e3, registry)
+    assert material.density == pytest.approx(sum(masses.values())/20)
+    # the mass of each material of the laminate is kept through the mixture of mixtures
+    laminate_masses = {"G4_Cu": materials.get_density("G4_Cu", registry), "G4_KAPTON": 3*materials.get_density("G4_KAPTON", registry)}
+    copper = 50 + 10*laminate_masses["G4_Cu"]/4
+    kapton = 10*laminate_masses["G4_KAPTON"]/4
+    assert materials.get_mass_fractions("mixture", registry) == pytest.approx({"G4_Cu": copper/(copper + kapton), "G4_KAPTON": kapton/(copper + kapton)})
+    with pytest.raises(ValueError):
+        materials.get_mixture_material("empty", {"G4_Cu": 0}, 20e3, registry)
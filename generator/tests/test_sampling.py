@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from pyg4ometry import geant4 as g4
+
+import sampling
+
+def make_box(registry, name="box"):
+    return g4.solid.Box(name, 40, 24, 10, registry)
+
+def make_polyhedra(registry, name="polyhedra"):
+    # a hexagonal section varying along z, with a hole
+    return g4.solid.Polyhedra(name, 0.2, 360, 6, 3, [-15, 0, 20], [2, 5, 8], [10, 20, 14], registry, aunit="deg")
+
+def make_polyhedra_segment(registry, name="polyhedra_segment"):
+    # the pyg4ometry mesh of a segment with more than two z planes fills the missing phi range, hence only two
+    return g4.solid.Polyhedra(name, 0.2, 300, 5, 2, [-5, 5], [3, 4], [10, 12], registry, aunit="deg")
+
+def make_tubs(registry, name="tubs"):
+    return g4.solid.Tubs(name, 6, 18, 30, 0.5, 4, registry)
+
+def make_boolean(kind, registry):
+    solids = {"Union": g4.solid.Union, "Subtraction": g4.solid.Subtraction, "Intersection": g4.solid.Intersection}
+    return solids[kind](kind.lower(), make_box(registry), make_polyhedra(registry), [[0.3, -0.5, 1.1], [8, -4, 3]], registry)
+
+def get_points(solid, n_points=20000, seed=0):
+    low, high = sampling.get_extent(solid)
+    return np.random.default_rng(seed).uniform(low - 3, high + 3, size=(n_points, 3))
+
+def get_mesh_volume(solid):
+    triangles = sampling.get_triangles(solid)
+    return np.sum(np.einsum("ij,ij->i", triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2]))) / 6
+
+@pytest.mark.parametrize("make_solid", [make_box, make_polyhedra, make_polyhedra_segment])
+def test_primitive_matches_mesh(make_solid):
+    solid = make_solid(g4.Registry())
+    points = get_points(solid)
+    expected = sampling.mesh_inside(solid, points)
+    assert 0 < np.count_nonzero(expected) < len(points)
+    assert np.array_equal(sampling.inside(solid, points), expected)
+    assert sampling.get_volume(solid) == pytest.approx(get_mesh_volume(solid), rel=1e-9)
+
+def test_tubs_matches_mesh():
+    # the mesh of a tube is a polygon of pyg4ometry.config.SolidDefaults.Tubs.nslice sides, inscribed in its circles:
+    # the points between the circles and the polygons are left out
+    solid = make_tubs(g4.Registry())
+    rmin, rmax, dphi = solid.evaluateParameterWithUnits("pRMin"), solid.evaluateParameterWithUnits("pRMax"), solid.evaluateParameterWithUnits("pDPhi")
+    polygon = np.cos(dphi / solid.nslice / 2)
+    points = get_points(solid)
+    r = np.hypot(points[:, 0], points[:, 1])
+    points = points[((r < rmin*polygon) | (r > rmin)) & ((r < rmax*polygon) | (r > rmax))]
+    expected = sampling.mesh_inside(solid, points)
+    assert 0 < np.count_nonzero(expected) < len(points)
+    assert np.array_equal(sampling.inside(solid, points), expected)
+    assert sampling.get_volume(solid) == pytest.approx(dphi/2 * (rmax**2 - rmin**2) * 30)
+
+@pytest.mark.parametrize("kind", ["Union", "Subtraction", "Intersection"])
+def test_boolean_matches_mesh(kind):
+    solid = make_boolean(kind, g4.Registry())
+    points = get_points(solid)
+    expected = sampling.mesh_inside(solid, points)
+    assert 0 < np.count_nonzero(expected) < len(points)
+    assert np.array_equal(sampling.inside(solid, points), expected)
+    # Monte Carlo estimate, within 4 statistical errors
+    n_points = 200000
+    low, high = sampling.get_extent(solid)
+    volume = get_mesh_volume(solid)
+    p = volume / np.prod(high - low)
+    sigma = np.prod(high - low) * np.sqrt(p*(1 - p) / n_points)
+    assert abs(sampling.get_volume(solid, n_points=n_points) - volume) < 4*sigma
@@ -0,0 +1,55 @@
+import math
+import xml.etree.ElementTree as ET
+
+import pytest
+from pyg4ometry.gdml import Writer
+
+import trexdm
+import utils
+import writer
+
+def get_difference(element, other, path=""):
+    """
+    Returns a description of the first difference between two GDML elements, None if they are the same up to the
+    formatting of the numbers and the order of the attributes.
+    """
+    path = f"{path}/{element.tag}[{element.get('name', '')}]"
+    if element.tag != other.tag:
+        return f"{path}: tag {other.tag}"
+    if sorted(element.keys()) != sorted(other.keys()):
+        return f"{path}: attributes {sorted(element.keys())} and {sorted(other.keys())}"
+    for key, value in element.items():
+        other_value = other.get(key)
+        try:
+            same = math.isclose(float(value), float(other_value), rel_tol=1e-12, abs_tol=1e-12)
+        except ValueError:
+            same = value == other_value
+        if not same:
+            return f"{path}: {key}={value} and {other_value}"
+    if len(element) != len(other):
+        return f"{path}: {len(element)} and {len(other)} children"
+    for child, other_child in zip(element, other):
+        difference = get_difference(child, other_child, path)
+        if difference is not None:
+            return difference
+    return None
+
+def build(config):
+    registry = trexdm.build_detector(config)
+    utils.prune_registry(registry)
+    return registry
+
+@pytest.mark.parametrize("childless", [False, True])
+@pytest.mark.parametrize("config", [{}, {"ring_replicas": True}, {"cathode_type": "plain", "flatten_booleans": "multiunion"}])
+def test_same_document_as_pyg4ometry(config, childless, tmp_path):
+    registry = build(config)
+    if childless:
+        registry = utils.transfer_childless_world(registry)
+    dom_writer = Writer()
+    dom_writer.addDetector(registry)
+    dom_writer.write(str(tmp_path / "pyg4ometry.gdml"))
+    expected = ET.parse(tmp_path / "pyg4ometry.gdml").getroot()
+    assert get_difference(ET.fromstring(writer.to_string(registry)), expected) is None
+
+def test_byte_identical():
+    assert writer.to_string(build({})) == writer.to_string(build({}))
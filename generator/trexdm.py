@@ -1,14 +1,12 @@
-import vtk
-import pyg4ometry
-from pyg4ometry import geant4 as g4
-import numpy as np
+import argparse
+import hashlib
+import importlib
+import logging
+
+import booleans
+import cache
 
-import vessel
-import shielding
-import gem
-import micromegas
-import fieldcage
-import utils
+logger = logging.getLogger(__name__)
 
 
 LEFT_CALIBRATION_OPEN = True
@@ -16,353 +14,604 @@ RIGHT_CALIBRATION_OPEN = True
 OPEN_CALIBRATION_LEAD_BLOCKS = False
 GAS = "Neon2%Isobutane1.1bar"
 CATHODE_TYPE = "wired"  # "wired" or "plain"
+CATHODE_WIRES = "union"  # "union", "multiunion" or "placements", see fieldcage.CATHODE_WIRES_MODES
 SIMPLIFY_MM_GEOMETRY = False
+COLLAPSE_LAMINATES = False  # True to merge the thin layers of the Micromegas board, limandes, GEM and plain cathode into single volumes of mixed material
+LOD = "full"  # level of detail of every assembly: "full", "reduced" or "envelope", see envelopes.LEVELS
+RING_REPLICAS = False  # True to place the field cage rings of each side as a replica of a slice with one ring, see fieldcage.generate_fieldcage_assembly
+FLATTEN_BOOLEANS = None  # None, "multiunion" or "balanced", see booleans.flatten_booleans
+SIMPLIFY_FRAMES = False  # True to build the square box minus box frames as polyhedra, see booleans.simplify_frames
+GAS_DAUGHTERS = False  # True to place the parts subtracted from the gas volumes as their daughters, see utils.place_subtracted_parts
+SHIELDING_AS_PARENT = False  # True to use a single shielding volume as parent of the copper cage (see shielding.generate_shielding_volume)
+
+DEFAULT_CONFIG = {
+    "left_calibration_open": LEFT_CALIBRATION_OPEN,
+    "right_calibration_open": RIGHT_CALIBRATION_OPEN,
+    "open_calibration_lead_blocks": OPEN_CALIBRATION_LEAD_BLOCKS,
+    "gas": GAS,
+    "cathode_type": CATHODE_TYPE,
+    "cathode_wires": CATHODE_WIRES,
+    "simplify_mm_geometry": SIMPLIFY_MM_GEOMETRY,
+    "collapse_laminates": COLLAPSE_LAMINATES,
+    "lod": LOD,
+    "ring_replicas": RING_REPLICAS,
+    "shielding_as_parent": SHIELDING_AS_PARENT,
+    "flatten_booleans": FLATTEN_BOOLEANS,
+    "simplify_frames": SIMPLIFY_FRAMES,
+    "gas_daughters": GAS_DAUGHTERS,
+}
+
+# Configuration parameters each sub-assembly depends on. Assemblies built with the same values are identical.
+# Sub-assemblies of the detector, see generate_part
+PARTS = ("shielding", "vessel", "micromegas", "gem", "fieldcage")
+
+def make_config(config=None, **kwargs):
+    """
+    Returns a complete configuration: DEFAULT_CONFIG updated with config and kwargs.
+    Raises a ValueError for unknown parameters or invalid values.
+    """
+    full_config = dict(DEFAULT_CONFIG)
+    full_config.update(config or {})
+    full_config.update(kwargs)
+    unknown = set(full_config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown configuration parameters: {', '.join(sorted(unknown))}")
+    if full_config["cathode_type"] not in ("wired", "plain"):
+        raise ValueError("Invalid cathode type. Choose either 'plain' or 'wired'.")
+    if full_config["cathode_wires"] not in ("union", "multiunion", "placements"):
+        raise ValueError("Invalid cathode wires mode. Choose one of union, multiunion, placements.")
+    if full_config["flatten_booleans"] not in (None, "multiunion", "balanced"):
+        raise ValueError("Invalid boolean flattening mode. Choose either 'multiunion' or 'balanced'.")
+    if full_config["lod"] not in ("full", "reduced", "envelope"):
+        raise ValueError("Invalid level of detail. Choose one of full, reduced, envelope.")
+    return full_config
+
+def default_name(config):
+    """
+    Returns the default GDML file name for the given configuration.
+    """
+    config = make_config(config)
+    return (
+        f"{'trexdm_shieldingAsParent' if config['shielding_as_parent'] else 'trexdm'}"
+        f"_{config['gas']}"
+        f"_cathode-{config['cathode_type']}"
+        f"{'_wires-' + config['cathode_wires'] if config['cathode_type'] == 'wired' and config['cathode_wires'] != 'union' else ''}"
+        f"_leftCalib-{'open' if config['left_calibration_open'] else 'closed'}"
+        f"_rightCalib-{'open' if config['right_calibration_open'] else 'closed'}"
+        f"{'_simplifiedMM' if config['simplify_mm_geometry'] else ''}"
+        f"{'_laminates' if config['collapse_laminates'] else ''}"
+        f"{'_lod-' + config['lod'] if config['lod'] != 'full' else ''}"
+        f"{'_ringReplicas' if config['ring_replicas'] else ''}"
+        f"{'_calLeadBlocks-open' if config['open_calibration_lead_blocks'] else ''}"
+        f"{'_flat-' + config['flatten_booleans'] if config['flatten_booleans'] else ''}"
+        f"{'_polyhedraFrames' if config['simplify_frames'] else ''}"
+        f"{'_gasDaughters' if config['gas_daughters'] else ''}"
+        f".gdml"
+    )
+
+def childless_name(filename):
+    """
+    Returns the tuple (name of the _noDaughters file of the GDML file filename, extension of both files), keeping the
+    compression of the file, e.g. ("trexdm_noDaughters.gdml.gz", ".gdml.gz") for "trexdm.gdml.gz".
+    """
+    stem, gdml, compression = filename.partition(".gdml")
+    extension = gdml + compression if gdml else ".gdml"
+    return stem + "_noDaughters" + extension, extension
 
-
-
-reg = g4.Registry()
-
-#galactic = g4.nist_material_2geant4Material("G4_Galactic")
-air = g4.nist_material_2geant4Material("G4_AIR")
-# world solid and logical
-ws   = g4.solid.Box("ws",1.5,1.5,1.5,reg, "m")
-world  = g4.LogicalVolume(ws, air,"world",reg)
-
-# Generate the assemblies
-shielding.generate_shielding_assembly_by_parts(open_calibration_lead_block=OPEN_CALIBRATION_LEAD_BLOCKS, registry=reg)
-vessel.generate_vessel_assembly(registry=reg, left_calibration_is_open=LEFT_CALIBRATION_OPEN, right_calibration_is_open=RIGHT_CALIBRATION_OPEN, gas=GAS)
-micromegas.generate_micromegas_assembly(registry=reg, is_right_side=True, simple_geometry=SIMPLIFY_MM_GEOMETRY)
-gem.generate_gem_assembly(registry=reg, is_right_side=True)
-fieldcage.generate_fieldcage_assembly(registry=reg, cathode_type=CATHODE_TYPE)
-
-shielding_assembly = utils.get_logical_volume_by_name("shielding_assembly", reg)
-vessel_assembly = utils.get_logical_volume_by_name("vessel_assembly", reg)
-micromegas_assembly = utils.get_logical_volume_by_name("micromegas_assembly", reg)
-gem_assembly = utils.get_logical_volume_by_name("gem_assembly", reg)
-fieldcage_assembly = utils.get_logical_volume_by_name("fieldcage_assembly", reg)
-
-# Find the logical volumes needed for mounting the assemblies together
-outerGas_LV = utils.get_logical_volume_by_name("outerGas_LV", reg)
-innerGas_LV = utils.get_logical_volume_by_name("gas_LV", reg)
-
-gem_position_z = vessel.vesselLength/2 - micromegas.capSupportFinalHeight - micromegas.mMBaseThickness  - micromegas.mMBoardThickness - gem.gemmMSeparatorThickness - gem.gemKaptonFoilThickness/2
-mM_position_z = vessel.vesselLength/2 - micromegas.capSupportFinalHeight - 0.5*micromegas.mMBaseThickness
-
-# === CREATE THE SENSITIVE GAS VOLUME ===
-sensitiveGasWidth = micromegas.mMLength
-if CATHODE_TYPE == "plain":
-    cathodeSideThickness = fieldcage.cathodeKaptonThickness + fieldcage.cathodeCuThickness*2
-else:  # wired cathode
-    cathodeSideThickness = 0 #fieldcage.cathodeWireRadius*2
-
-driftLeftGasGap = (gem_position_z - gem.gemKaptonFoilThickness/2 - gem.gemCopperFoilThickness) - cathodeSideThickness #(fieldcage.cathodeKaptonThickness/2 + fieldcage.cathodeCuThickness)
-transferGasGap = gem.gemmMSeparatorThickness - gem.gemCopperFoilThickness
-driftLeftGas0 = g4.solid.Box(
-    name="driftLeftGas0",
-    pX=sensitiveGasWidth, # 206 mm because cathode frame is inside active gas volume so I need to avoid that overlap
-    pY=sensitiveGasWidth,
-    pZ=driftLeftGasGap,
-    registry=reg,
-    lunit="mm"
-)
-cathodeFrameSolid = utils.get_solid_by_name("cathodeFrame", reg)
-sideSeparatorSolid = utils.get_solid_by_name("sideSeparator", reg)
-cathodeFeedThroughSolid = utils.get_solid_by_name("cathodeFeedthrough", reg)
-cathodeWired = utils.get_solid_by_name("cathodeWiredFull", reg)
-driftLeftGas1 = g4.solid.Subtraction(
-    name="driftLeftGas1",
-    obj1=driftLeftGas0,
-    obj2=cathodeFrameSolid,
-    tra2=[[0, 0, 0], [0, 0, -driftLeftGasGap/2]],
-    registry=reg
-)
-driftLeftGas2 = g4.solid.Subtraction(
-    name="driftLeftGas2",
-    obj1=driftLeftGas1,
-    obj2=sideSeparatorSolid,
-    tra2=[[0, 0, 0], [0, 0, -driftLeftGasGap/2]],
-    registry=reg
-)
-
-cathodeFeedThroughPosition = utils.get_position_of_physical_volume("cathodeFeedthrough", reg)
-cathodeFeedThroughPosition[2] -= driftLeftGasGap/2 # relative to driftLeftGas1 center
-cathodeFeedThroughRotation = utils.get_rotation_of_physical_volume("cathodeFeedthrough", reg)
-driftLeftGas3 = g4.solid.Subtraction(
-    name="driftLeftGas3",
-    obj1=driftLeftGas2,
-    obj2=cathodeFeedThroughSolid,
-    tra2=[cathodeFeedThroughRotation, cathodeFeedThroughPosition],
-    registry=reg
-) 
-#rotation=[90*np.pi/180, 0, 0],
-#position=[-cathodeWireLength/2+first_wire_distance_to_frame, 0, cathodeWireRadius],
-cathodeWiredPosition = utils.get_position_of_physical_volume("cathodeWired", reg)
-cathodeWiredPosition[2] -= driftLeftGasGap/2 # relative to driftLeftGas2 center
-cathodeWiredRotation = utils.get_rotation_of_physical_volume("cathodeWired", reg)
-driftLeftGas = g4.solid.Subtraction(
-    name="driftLeftGas",
-    obj1=driftLeftGas3,
-    obj2=cathodeWired,
-    tra2=[cathodeWiredRotation, cathodeWiredPosition],
-    registry=reg
-)
-transferGasSolid = g4.solid.Box(
-    name="transferGasSolid",
-    pX=sensitiveGasWidth,
-    pY=sensitiveGasWidth,
-    pZ=transferGasGap,
-    registry=reg,
-    lunit="mm"
-)
-
-"""
-sensitiveGasLeft = g4.solid.Union(
-    name="sensitiveGasLeft",
-    obj1=driftLeftGas,
-    obj2=transferGasSolid,
-    tra2=[[0, 0, 0], [0, 0, driftLeftGasGap/2 + gem.gemCopperFoilThickness*2 + gem.gemKaptonFoilThickness + transferGasGap/2]],
-    registry=reg
-)
-"""
-
-driftRightGasGap = mM_position_z - micromegas.mMBaseThickness/2 - micromegas.mMBoardThickness 
-driftRightGas0 = g4.solid.Box(
-    name="driftRightGas0",
-    pX=sensitiveGasWidth,
-    pY=sensitiveGasWidth,
-    pZ=driftRightGasGap,
-    registry=reg,
-    lunit="mm"
-)
-
-driftRightGas1 = g4.solid.Subtraction(
-    name="driftRightGas1",
-    obj1=driftRightGas0,
-    obj2=cathodeFrameSolid,
-    tra2=[[0, 0, 0], [0, 0, driftRightGasGap/2]],
-    registry=reg
-)
-
-driftRightGas2 = g4.solid.Subtraction(
-    name="driftRightGas2",
-    obj1=driftRightGas1,
-    obj2=sideSeparatorSolid,
-    tra2=[[0, 0, 0], [0, 0, driftRightGasGap/2]],
-    registry=reg
-)
-
-cathodeFeedThroughPosition = utils.get_position_of_physical_volume("cathodeFeedthrough", reg)
-cathodeFeedThroughPosition[2] += driftRightGasGap/2 # relative to driftRightGas1 center
-cathodeFeedThroughRotation = utils.get_rotation_of_physical_volume("cathodeFeedthrough", reg)
-driftRightGas3 = g4.solid.Subtraction(
-    name="driftRightGas3",
-    obj1=driftRightGas2,
-    obj2=cathodeFeedThroughSolid,
-    tra2=[cathodeFeedThroughRotation, cathodeFeedThroughPosition],
-    registry=reg
-)
-
-cathodeWiredPosition = utils.get_position_of_physical_volume("cathodeWired", reg)
-cathodeWiredPosition[2] += driftRightGasGap/2 # relative to driftRightGas2 center
-cathodeWiredRotation = utils.get_rotation_of_physical_volume("cathodeWired", reg)
-driftRightGas = g4.solid.Subtraction(
-    name="driftRightGas",
-    obj1=driftRightGas3,
-    obj2=cathodeWired,
-    tra2=[cathodeWiredRotation, cathodeWiredPosition],
-    registry=reg
-)
-
-
-"""
-sensitiveGasBothSides = g4.solid.Union(
-    name="sensitiveGasBothSides",
-    obj1=sensitiveGasLeft,
-    obj2=driftRightGas,
-    tra2=[[0, np.pi, 0], [0, 0, -(driftLeftGasGap/2 + cathodeSideThickness)]],
-    registry=reg
-)
-"""
-
-gas_material = innerGas_LV.material
-"""
-sensitiveGasLeft_LV = g4.LogicalVolume(
-    name="sensitiveGasLeft_LV",
-    solid=sensitiveGasLeft,
-    material=gas_material,
-    registry=reg
-)
-sensitiveGasLeft_PV = g4.PhysicalVolume(
-    name="sensitiveGasLeft",
-    logicalVolume=sensitiveGasLeft_LV,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, driftLeftGasGap/2 + cathodeSideThickness],
-    registry=reg
-)
-"""
-
-driftGasLeft_LV = g4.LogicalVolume(
-    name="driftGasLeft_LV",
-    solid=driftLeftGas,
-    material=gas_material,
-    registry=reg
-)
-
-driftGasLeft_PV = g4.PhysicalVolume(
-    name="driftGasLeft",
-    logicalVolume=driftGasLeft_LV,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, driftLeftGasGap/2 + cathodeSideThickness],
-    registry=reg
-)
-
-transferGasLeft_LV = g4.LogicalVolume(
-    name="transferGasLeft_LV",
-    solid=transferGasSolid,
-    material=gas_material,
-    registry=reg
-)
-
-transferGasLeft_PV = g4.PhysicalVolume(
-    name="transferGasLeft",
-    logicalVolume=transferGasLeft_LV,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, driftLeftGasGap + cathodeSideThickness + gem.gemCopperFoilThickness*2 + gem.gemKaptonFoilThickness + transferGasGap/2],
-    registry=reg
-)
-
-driftGasRight_LV = g4.LogicalVolume(
-    name="driftGasRight_LV",
-    solid=driftRightGas,
-    material=gas_material,
-    registry=reg
-)
-
-driftGasRight_PV = g4.PhysicalVolume(
-    name="driftGasRight",
-    logicalVolume=driftGasRight_LV,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, -(driftRightGasGap/2 + cathodeSideThickness)],
-    registry=reg
-)
-
-# Create the physical volumes
-
-micromegasRight_PV = g4.PhysicalVolume(
-    name="micromegasRight",
-    logicalVolume=micromegas_assembly,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, -mM_position_z],
-    registry=reg
-)
-
-
-gemLeft_PV = g4.PhysicalVolume(
-    name="gemLeft",
-    logicalVolume=gem_assembly,
-    motherVolume=innerGas_LV,
-    rotation=[np.pi, 0, 0],
-    position=[0, 0, gem_position_z],
-    registry=reg
-)
-
-micromegasLeft_PV = g4.PhysicalVolume(
-    name="micromegasLeft",
-    logicalVolume=micromegas_assembly,
-    motherVolume=innerGas_LV,
-    rotation=[np.pi, 0, 0],
-    position=[0, 0, mM_position_z],
-    registry=reg
-)
-
-vesselassembly_PV = g4.PhysicalVolume(
-    name="vesselassembly",
-    logicalVolume=vessel_assembly,
-    motherVolume=outerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, 0],
-    registry=reg
-)
-
-shielding_PV = g4.PhysicalVolume(
-    name="shielding",
-    logicalVolume=shielding_assembly,
-    motherVolume=world,
-    rotation=[0, 0, 0],
-    position=[0, 0, 0],
-    registry=reg
-)
-
-fieldcage_PV = g4.PhysicalVolume(
-    name="fieldcage",
-    logicalVolume=fieldcage_assembly,
-    motherVolume=innerGas_LV,
-    rotation=[0, 0, 0],
-    position=[0, 0, 0],
-    registry=reg
-)
-
-
-reg.setWorld(world.name)
-
-
-import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument("--childless", action="store_true", default=False)
-defaultName = (
-    f"trexdm"
-    f"_{GAS}"
-    f"_cathode-{CATHODE_TYPE}"
-    f"_leftCalib-{'open' if LEFT_CALIBRATION_OPEN else 'closed'}"
-    f"_rightCalib-{'open' if RIGHT_CALIBRATION_OPEN else 'closed'}"
-    f"{'_simplifiedMM' if SIMPLIFY_MM_GEOMETRY else ''}"
-    f"{'_calLeadBlocks-open' if OPEN_CALIBRATION_LEAD_BLOCKS else ''}"
-    f".gdml"
-)
-parser.add_argument("-f", "--file", type=str, default=defaultName, help="Output GDML file name")
-
-args = parser.parse_args()
-
-w = pyg4ometry.gdml.Writer()
-w.addDetector(reg)
-w.write(args.file)
-
-if args.childless:
-    print("ORIGINAL WL DAUGHTERS LIST:")
-    for daughter in world.daughterVolumes:
-        print(f"{daughter.name}")
-    print("END OF ORIGINAL WL DAUGHTERS LIST")
+def generate_part(part, config, registry=None):
+    """
+    Generates the sub-assembly part ("shielding", "vessel", "micromegas", "gem" or "fieldcage") for the given configuration.
+    Returns the registry containing the sub-assembly.
+    """
+    module = importlib.import_module(part)
+    if part == "shielding":
+        if config["shielding_as_parent"]:
+            return module.generate_shielding_volume(open_calibration_lead_block=config["open_calibration_lead_blocks"], registry=registry, lod=config["lod"])
+        return module.generate_shielding_assembly_by_parts(open_calibration_lead_block=config["open_calibration_lead_blocks"], registry=registry, lod=config["lod"])
+    if part == "vessel":
+        return module.generate_vessel_assembly(registry=registry, left_calibration_is_open=config["left_calibration_open"], right_calibration_is_open=config["right_calibration_open"], gas=config["gas"], lod=config["lod"])
+    if part == "micromegas":
+        return module.generate_micromegas_assembly(registry=registry, is_right_side=True, simple_geometry=config["simplify_mm_geometry"], collapse_laminates=config["collapse_laminates"], lod=config["lod"])
+    if part == "gem":
+        return module.generate_gem_assembly(registry=registry, is_right_side=True, collapse_laminates=config["collapse_laminates"], lod=config["lod"])
+    if part == "fieldcage":
+        # placed wires go inside the drift gas volumes (see build_detector), not in the field cage assembly
+        return module.generate_fieldcage_assembly(registry=registry, cathode_type=config["cathode_type"], cathode_wires=config["cathode_wires"], with_cathode_wires=config["cathode_wires"] != "placements", collapse_laminates=config["collapse_laminates"], lod=config["lod"], ring_replicas=config["ring_replicas"], gas=config["gas"])
+    raise ValueError(f"Unknown detector part '{part}'.")
+
+def build_detector(config=None, registry=None, verify=False):
+    """
+    Builds the full TREX-DM detector for the given configuration. Importing this module builds nothing,
+    so it can be called several times, with different configurations, in the same interpreter.
+    param config: Dictionary with configuration parameters. Missing parameters take the values of DEFAULT_CONFIG.
+    param registry: Registry to use for the Geant4 objects. If None, a new registry is created.
+    param verify: If True, placing the gas daughters (gas_daughters) checks that the material at points sampled in every
+    rewritten gas is unchanged and raises a ValueError otherwise (see utils.place_subtracted_parts).
+    Returns the registry with the world volume set.
+    """
+    config = make_config(config)
+
+    # Imported here so that a cache hit does not pay for pyg4ometry and the generators
+    from pyg4ometry import geant4 as g4
+    import numpy as np
+
+    import vessel
+    import gem
+    import micromegas
+    import fieldcage
+    import materials
+    import utils
+
+    # Registry
+    if registry is None:
+        reg = g4.Registry()
+    else:
+        reg = registry
+
+    #galactic = materials.get_material("G4_Galactic", reg)
+    air = materials.get_material("G4_AIR", reg)
+    # world solid and logical
+    ws   = g4.solid.Box("ws",1.5,1.5,1.5,reg, "m")
+    world  = g4.LogicalVolume(ws, air,"world",reg)
+
+    # Generate the assemblies
+    for part in PARTS:
+        generate_part(part, config, registry=reg)
+
+    shielding_assembly = utils.get_logical_volume_by_name("shielding_LV" if config["shielding_as_parent"] else "shielding_assembly", reg)
+    vessel_assembly = utils.get_logical_volume_by_name("vessel_assembly", reg)
+    micromegas_assembly = utils.get_logical_volume_by_name("micromegas_assembly", reg)
+    gem_assembly = utils.get_logical_volume_by_name("gem_assembly", reg)
+    fieldcage_assembly = utils.get_logical_volume_by_name("fieldcage_assembly", reg)
+
+    # Find the logical volumes needed for mounting the assemblies together
+    outerGas_LV = utils.get_logical_volume_by_name("outerGas_LV", reg)
+    innerGas_LV = utils.get_logical_volume_by_name("gas_LV", reg)
+
+    gem_position_z = vessel.vesselLength/2 - micromegas.capSupportFinalHeight - micromegas.mMBaseThickness  - micromegas.mMBoardThickness - gem.gemmMSeparatorThickness - gem.gemKaptonFoilThickness/2
+    mM_position_z = vessel.vesselLength/2 - micromegas.capSupportFinalHeight - 0.5*micromegas.mMBaseThickness
+
+    # === CREATE THE SENSITIVE GAS VOLUME ===
+    sensitiveGasWidth = micromegas.mMLength
+    # at the envelope level the parts of the field cage are not inside the drift gas volumes anymore (see fieldcage.py)
+    detailed_fieldcage = config["lod"] != "envelope"
+    if not detailed_fieldcage:
+        cathodeSideThickness = fieldcage.cathodeEnvelopeThickness/2
+    elif config["cathode_type"] == "plain":
+        cathodeSideThickness = fieldcage.cathodeKaptonThickness + fieldcage.cathodeCuThickness*2
+    else:  # wired cathode
+        cathodeSideThickness = 0 #fieldcage.cathodeWireRadius*2
+
+    driftLeftGasGap = (gem_position_z - gem.gemKaptonFoilThickness/2 - gem.gemCopperFoilThickness) - cathodeSideThickness #(fieldcage.cathodeKaptonThickness/2 + fieldcage.cathodeCuThickness)
+    transferGasGap = gem.gemmMSeparatorThickness - gem.gemCopperFoilThickness
+    driftLeftGas0 = g4.solid.Box(
+        name="driftLeftGas0",
+        pX=sensitiveGasWidth, # 206 mm because cathode frame is inside active gas volume so I need to avoid that overlap
+        pY=sensitiveGasWidth,
+        pZ=driftLeftGasGap,
+        registry=reg,
+        lunit="mm"
+    )
+    # with placed wires the drift gas is the mother of the wires instead of having them subtracted
+    subtract_cathode_wires = config["cathode_type"] == "wired" and config["cathode_wires"] != "placements"
+    if detailed_fieldcage:
+        cathodeFrameSolid = utils.get_solid_by_name("cathodeFrame", reg)
+        sideSeparatorSolid = utils.get_solid_by_name("sideSeparator", reg)
+        cathodeFeedThroughSolid = utils.get_solid_by_name("cathodeFeedthrough", reg)
+        driftLeftGas1 = g4.solid.Subtraction(
+            name="driftLeftGas1",
+            obj1=driftLeftGas0,
+            obj2=cathodeFrameSolid,
+            tra2=[[0, 0, 0], [0, 0, -driftLeftGasGap/2]],
+            registry=reg
+        )
+        driftLeftGas2 = g4.solid.Subtraction(
+            name="driftLeftGas2",
+            obj1=driftLeftGas1,
+            obj2=sideSeparatorSolid,
+            tra2=[[0, 0, 0], [0, 0, -driftLeftGasGap/2]],
+            registry=reg
+        )
+
+        cathodeFeedThroughPosition = utils.get_position_of_physical_volume("cathodeFeedthrough", reg)
+        cathodeFeedThroughPosition[2] -= driftLeftGasGap/2 # relative to driftLeftGas1 center
+        cathodeFeedThroughRotation = utils.get_rotation_of_physical_volume("cathodeFeedthrough", reg)
+        driftLeftGas3 = g4.solid.Subtraction(
+            name="driftLeftGas3",
+            obj1=driftLeftGas2,
+            obj2=cathodeFeedThroughSolid,
+            tra2=[cathodeFeedThroughRotation, cathodeFeedThroughPosition],
+            registry=reg
+        ) 
+        #rotation=[90*np.pi/180, 0, 0],
+        #position=[-cathodeWireLength/2+first_wire_distance_to_frame, 0, cathodeWireRadius],
+        if subtract_cathode_wires:
+            cathodeWired = utils.get_solid_by_name("cathodeWiredFull", reg)
+            cathodeWiredPosition = utils.get_position_of_physical_volume("cathodeWired", reg)
+            cathodeWiredPosition[2] -= driftLeftGasGap/2 # relative to driftLeftGas2 center
+            cathodeWiredRotation = utils.get_rotation_of_physical_volume("cathodeWired", reg)
+            driftLeftGas = g4.solid.Subtraction(
+                name="driftLeftGas",
+                obj1=driftLeftGas3,
+                obj2=cathodeWired,
+                tra2=[cathodeWiredRotation, cathodeWiredPosition],
+                registry=reg
+            )
+        else:  # the plain cathode foil is outside the drift gas (see cathodeSideThickness), placed wires are daughters of it
+            driftLeftGas = driftLeftGas3
+    else:
+        driftLeftGas = driftLeftGas0
+    transferGasSolid = g4.solid.Box(
+        name="transferGasSolid",
+        pX=sensitiveGasWidth,
+        pY=sensitiveGasWidth,
+        pZ=transferGasGap,
+        registry=reg,
+        lunit="mm"
+    )
 
     """
-    reg_noDaughters = g4.Registry()
+    sensitiveGasLeft = g4.solid.Union(
+        name="sensitiveGasLeft",
+        obj1=driftLeftGas,
+        obj2=transferGasSolid,
+        tra2=[[0, 0, 0], [0, 0, driftLeftGasGap/2 + gem.gemCopperFoilThickness*2 + gem.gemKaptonFoilThickness + transferGasGap/2]],
+        registry=reg
+    )
+    """
 
-    # Create a new registry without daughters
-    for name, solid in reg.solidDict.items():
-        reg_noDaughters.transferSolid(solid)
-    for name, material in reg.materialDict.items():
-        reg_noDaughters.transferMaterial(material)
-    world_noDaughters = g4.LogicalVolume(ws, galactic,"world",reg_noDaughters)
-    utils.get_childless_volume(world, world_volume=world_noDaughters, registry=reg_noDaughters)
+    # the gas starts at the cathode (or its slab at the envelope level), as on the left side
+    driftRightGasGap = mM_position_z - micromegas.mMBaseThickness/2 - micromegas.mMBoardThickness - cathodeSideThickness
+    driftRightGas0 = g4.solid.Box(
+        name="driftRightGas0",
+        pX=sensitiveGasWidth,
+        pY=sensitiveGasWidth,
+        pZ=driftRightGasGap,
+        registry=reg,
+        lunit="mm"
+    )
+
+    if detailed_fieldcage:
+        driftRightGas1 = g4.solid.Subtraction(
+            name="driftRightGas1",
+            obj1=driftRightGas0,
+            obj2=cathodeFrameSolid,
+            tra2=[[0, 0, 0], [0, 0, driftRightGasGap/2]],
+            registry=reg
+        )
+
+        driftRightGas2 = g4.solid.Subtraction(
+            name="driftRightGas2",
+            obj1=driftRightGas1,
+            obj2=sideSeparatorSolid,
+            tra2=[[0, 0, 0], [0, 0, driftRightGasGap/2]],
+            registry=reg
+        )
+
+        cathodeFeedThroughPosition = utils.get_position_of_physical_volume("cathodeFeedthrough", reg)
+        cathodeFeedThroughPosition[2] += driftRightGasGap/2 # relative to driftRightGas1 center
+        cathodeFeedThroughRotation = utils.get_rotation_of_physical_volume("cathodeFeedthrough", reg)
+        driftRightGas3 = g4.solid.Subtraction(
+            name="driftRightGas3",
+            obj1=driftRightGas2,
+            obj2=cathodeFeedThroughSolid,
+            tra2=[cathodeFeedThroughRotation, cathodeFeedThroughPosition],
+            registry=reg
+        )
+
+        if subtract_cathode_wires:
+            cathodeWiredPosition = utils.get_position_of_physical_volume("cathodeWired", reg)
+            cathodeWiredPosition[2] += driftRightGasGap/2 # relative to driftRightGas2 center
+            cathodeWiredRotation = utils.get_rotation_of_physical_volume("cathodeWired", reg)
+            driftRightGas = g4.solid.Subtraction(
+                name="driftRightGas",
+                obj1=driftRightGas3,
+                obj2=cathodeWired,
+                tra2=[cathodeWiredRotation, cathodeWiredPosition],
+                registry=reg
+            )
+        else:
+            driftRightGas = driftRightGas3
+    else:
+        driftRightGas = driftRightGas0
 
-    reg_noDaughters.setWorld(world_noDaughters.name)
+    """
+    sensitiveGasBothSides = g4.solid.Union(
+        name="sensitiveGasBothSides",
+        obj1=sensitiveGasLeft,
+        obj2=driftRightGas,
+        tra2=[[0, np.pi, 0], [0, 0, -(driftLeftGasGap/2 + cathodeSideThickness)]],
+        registry=reg
+    )
     """
 
-    reg_noDaughters = utils.transfer_childless_world(reg)
-    world_noDaughters = reg_noDaughters.getWorldVolume()
-    w = pyg4ometry.gdml.Writer()
-    w.addDetector(reg_noDaughters)
-    name = args.file.split(".gdml")[0] + "_noDaughters.gdml"
-    w.write(name)
+    gas_material = innerGas_LV.material
+    """
+    sensitiveGasLeft_LV = g4.LogicalVolume(
+        name="sensitiveGasLeft_LV",
+        solid=sensitiveGasLeft,
+        material=gas_material,
+        registry=reg
+    )
+    sensitiveGasLeft_PV = g4.PhysicalVolume(
+        name="sensitiveGasLeft",
+        logicalVolume=sensitiveGasLeft_LV,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, driftLeftGasGap/2 + cathodeSideThickness],
+        registry=reg
+    )
+    """
 
+    driftGasLeft_LV = g4.LogicalVolume(
+        name="driftGasLeft_LV",
+        solid=driftLeftGas,
+        material=gas_material,
+        registry=reg
+    )
+
+    driftGasLeft_PV = g4.PhysicalVolume(
+        name="driftGasLeft",
+        logicalVolume=driftGasLeft_LV,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, driftLeftGasGap/2 + cathodeSideThickness],
+        registry=reg
+    )
+
+    transferGasLeft_LV = g4.LogicalVolume(
+        name="transferGasLeft_LV",
+        solid=transferGasSolid,
+        material=gas_material,
+        registry=reg
+    )
+
+    transferGasLeft_PV = g4.PhysicalVolume(
+        name="transferGasLeft",
+        logicalVolume=transferGasLeft_LV,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, driftLeftGasGap + cathodeSideThickness + gem.gemCopperFoilThickness*2 + gem.gemKaptonFoilThickness + transferGasGap/2],
+        registry=reg
+    )
+
+    driftGasRight_LV = g4.LogicalVolume(
+        name="driftGasRight_LV",
+        solid=driftRightGas,
+        material=gas_material,
+        registry=reg
+    )
+
+    driftGasRight_PV = g4.PhysicalVolume(
+        name="driftGasRight",
+        logicalVolume=driftGasRight_LV,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, -(driftRightGasGap/2 + cathodeSideThickness)],
+        registry=reg
+    )
+
+    if detailed_fieldcage and config["cathode_type"] == "wired" and config["cathode_wires"] == "placements":
+        # the field cage assembly is placed at the origin of the inner gas, the wires go to the drift gas that contains them
+        fieldcage.place_cathode_wires(driftGasLeft_LV, reg, position=[0, 0, -(driftLeftGasGap/2 + cathodeSideThickness)], z_min=0)
+        fieldcage.place_cathode_wires(driftGasRight_LV, reg, position=[0, 0, driftRightGasGap/2 + cathodeSideThickness], z_max=0)
+
+    # Create the physical volumes
+
+    micromegasRight_PV = g4.PhysicalVolume(
+        name="micromegasRight",
+        logicalVolume=micromegas_assembly,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, -mM_position_z],
+        registry=reg
+    )
+
+
+    gemLeft_PV = g4.PhysicalVolume(
+        name="gemLeft",
+        logicalVolume=gem_assembly,
+        motherVolume=innerGas_LV,
+        rotation=[np.pi, 0, 0],
+        position=[0, 0, gem_position_z],
+        registry=reg
+    )
+
+    micromegasLeft_PV = g4.PhysicalVolume(
+        name="micromegasLeft",
+        logicalVolume=micromegas_assembly,
+        motherVolume=innerGas_LV,
+        rotation=[np.pi, 0, 0],
+        position=[0, 0, mM_position_z],
+        registry=reg
+    )
+
+    vesselassembly_PV = g4.PhysicalVolume(
+        name="vesselassembly",
+        logicalVolume=vessel_assembly,
+        motherVolume=outerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, 0],
+        registry=reg
+    )
+
+    shielding_PV = g4.PhysicalVolume(
+        name="shielding",
+        logicalVolume=shielding_assembly,
+        motherVolume=world,
+        rotation=[0, 0, 0],
+        position=[0, 0, 0],
+        registry=reg
+    )
+
+    fieldcage_PV = g4.PhysicalVolume(
+        name="fieldcage",
+        logicalVolume=fieldcage_assembly,
+        motherVolume=innerGas_LV,
+        rotation=[0, 0, 0],
+        position=[0, 0, 0],
+        registry=reg
+    )
+
+
+    if config["gas_daughters"]:
+        utils.place_subtracted_parts(reg, verify=verify)
+    if config["simplify_frames"]:
+        booleans.simplify_frames(reg)
+    if config["flatten_booleans"]:
+        booleans.flatten_booleans(reg, mode=config["flatten_booleans"])
+
+    reg.setWorld(world.name)
+
+    return reg
+
+
+def main(argv=None, config=None):
     """
-    gas_wo_daughters = utils.get_solid_by_name("gasSolid-0-17", reg_noDaughters)
-    v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
-    v.addSolid(gas_wo_daughters)
-    v.addAxes(1000)
-    v.view()
+    Command line interface: builds the detector for the configuration given by config and the command line options
+    and writes it to a GDML file, going through the geometry cache.
     """
+    config = make_config(config)
+    parser = argparse.ArgumentParser(description="Generate the GDML geometry of the TREX-DM detector.")
+    parser.add_argument("--childless", action="store_true", default=False)
+    parser.add_argument("--childless-subtrees", nargs="+", default=None, metavar="PATTERN", help="With --childless, only flatten the volumes matching these names or glob patterns (e.g. gas_LV 'fieldcage*')")
+    parser.add_argument("-f", "--file", type=str, default=None, help="Output GDML file name. Defaults to a name describing the configuration.")
+    parser.add_argument("--compression", choices=["gz", "zst"], default=None, help="Compress the GDML files as they are written (.gdml.gz or .gdml.zst; zst needs the zstandard package)")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Always rebuild the geometry instead of using the GDML cache")
+    parser.add_argument("--gas", type=str, default=config["gas"], help="Gas mixture (default: %(default)s)")
+    parser.add_argument("--cathode-type", choices=["wired", "plain"], default=config["cathode_type"])
+    parser.add_argument("--cathode-wires", choices=["union", "multiunion", "placements"], default=config["cathode_wires"], help="How the wires of the wired cathode are built (default: %(default)s)")
+    parser.add_argument("--left-calibration", choices=["open", "closed"], default="open" if config["left_calibration_open"] else "closed")
+    parser.add_argument("--right-calibration", choices=["open", "closed"], default="open" if config["right_calibration_open"] else "closed")
+    parser.add_argument("--open-calibration-lead-blocks", action="store_true", default=config["open_calibration_lead_blocks"])
+    parser.add_argument("--simplify-mm-geometry", action="store_true", default=config["simplify_mm_geometry"])
+    parser.add_argument("--collapse-laminates", action="store_true", default=config["collapse_laminates"], help="Merge the thin layers of the Micromegas board, limandes, GEM and plain cathode into single volumes of mixed material (see materials.py)")
+    parser.add_argument("--lod", choices=["full", "reduced", "envelope"], default=config["lod"], help="Level of detail of every assembly (default: %(default)s, see envelopes.py)")
+    parser.add_argument("--ring-replicas", action="store_true", default=config["ring_replicas"], help="Place the field cage rings of each side as a replica of a slice with one ring (see fieldcage.py)")
+    parser.add_argument("--flatten-booleans", choices=["multiunion", "balanced"], default=config["flatten_booleans"], help="Rewrite union and subtraction chains as multi-unions or balanced trees (see booleans.py)")
+    parser.add_argument("--simplify-frames", action="store_true", default=config["simplify_frames"], help="Build the square box minus box frames as single polyhedra (see booleans.py)")
+    parser.add_argument("--gas-daughters", action="store_true", default=config["gas_daughters"], help="Keep the gas volumes as primitives and place the parts subtracted from them as daughters (see utils.py)")
+    parser.add_argument("--verify", action="store_true", default=False, help="With --gas-daughters, check by point sampling that the material of every point is unchanged and fail otherwise (the geometry is always rebuilt)")
+    parser.add_argument("--max-boolean-depth", type=int, default=None, help="Fail if any solid has a larger boolean depth (see booleans.py)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="Log a summary of the childless flattening (-v) or every volume it creates (-vv)")
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        # only the generator modules log at the requested level, not pyg4ometry
+        logging.basicConfig(format="%(name)s: %(message)s")
+        for name in (__name__, "utils"):
+            logging.getLogger(name).setLevel(logging.DEBUG if args.verbose > 1 else logging.INFO)
+
+    config = make_config(
+        config,
+        gas=args.gas,
+        cathode_type=args.cathode_type,
+        cathode_wires=args.cathode_wires,
+        left_calibration_open=args.left_calibration == "open",
+        right_calibration_open=args.right_calibration == "open",
+        open_calibration_lead_blocks=args.open_calibration_lead_blocks,
+        simplify_mm_geometry=args.simplify_mm_geometry,
+        collapse_laminates=args.collapse_laminates,
+        lod=args.lod,
+        ring_replicas=args.ring_replicas,
+        flatten_booleans=args.flatten_booleans,
+        simplify_frames=args.simplify_frames,
+        gas_daughters=args.gas_daughters,
+    )
+    if args.file is None:
+        args.file = default_name(config)
+    if args.compression and not args.file.endswith("." + args.compression):
+        args.file += "." + args.compression
+    noDaughtersName, extension = childless_name(args.file)
+    if args.childless_subtrees and not args.childless:
+        parser.error("--childless-subtrees requires --childless")
+    # the childless file depends on the flattened subtrees, so they are part of its cache suffix
+    childless_suffix = "_noDaughters"
+    if args.childless_subtrees:
+        childless_suffix += "-" + hashlib.sha256(" ".join(sorted(args.childless_subtrees)).encode()).hexdigest()[:12]
+
+    # The cache key covers the configuration and the source of every module used in the build
+    cache_key = cache.config_key(config, modules=cache.GENERATOR_MODULES + ["trexdm"])
+    if not args.no_cache and not args.verify and cache.contains(cache_key, extension=extension) and (not args.childless or cache.contains(cache_key, childless_suffix, extension=extension)):
+        if args.max_boolean_depth is not None:
+            try:
+                booleans.check_depth_budget(cache.load_registry(cache_key, extension=extension), args.max_boolean_depth)
+            except ValueError as error:
+                parser.exit(1, f"{error}\n")
+        cache.fetch(cache_key, args.file, extension=extension)
+        print(f"Geometry found in cache ({cache_key[:12]}), written to {args.file}")
+        if args.childless:
+            cache.fetch(cache_key, noDaughtersName, childless_suffix, extension=extension)
+            print(f"Geometry found in cache ({cache_key[:12]}), written to {noDaughtersName}")
+        return
+
+    import pyg4ometry
+    import utils
+
+    # Meshes are only needed for visualisation and building them dominates the generation time
+    pyg4ometry.config.doMeshing = False
+    try:
+        reg = build_detector(config, verify=args.verify)
+    except ValueError as error:
+        if not args.verify:
+            raise
+        parser.exit(1, f"{error}\n")
+    if args.verify and config["gas_daughters"]:
+        print("Gas daughters verified: the material of every sampled point is unchanged")
+    # only the volumes written to the file, not the ones dropped by the pruning (e.g. the cathode split by --gas-daughters)
+    reachable = utils.get_reachable(reg)["logical_volume"]
+    for volume_name in ("cathodeWired_LV", "driftGasLeft_LV", "driftGasRight_LV"):
+        if volume_name in reachable:
+            solid = reg.logicalVolumeDict[volume_name].solid
+            print(f"Boolean depth of {volume_name} ({solid.name}): {booleans.analyse_solid(solid)['depth']}")
+    if args.max_boolean_depth is not None:
+        try:
+            booleans.check_depth_budget(reg, args.max_boolean_depth)
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+
+    digest, written, removed = utils.write_gdml(reg, args.file)
+    if any(removed.values()):
+        print(f"Removed {removed['solid']} solids, {removed['material']} materials and {removed['logical_volume']} logical volumes not reachable from the world")
+    print(f"{args.file} {'written' if written else 'unchanged'} (sha256 {digest})")
+    cache.store(cache_key, args.file, extension=extension)
+
+    if args.childless:
+        world = reg.getWorldVolume()
+        logger.debug("Original world daughters: %s", ", ".join(daughter.name for daughter in world.daughterVolumes))
+
+        """
+        reg_noDaughters = g4.Registry()
+
+        # Create a new registry without daughters
+        for name, solid in reg.solidDict.items():
+            reg_noDaughters.transferSolid(solid)
+        for name, material in reg.materialDict.items():
+            reg_noDaughters.transferMaterial(material)
+        world_noDaughters = g4.LogicalVolume(ws, galactic,"world",reg_noDaughters)
+        utils.get_childless_volume(world, world_volume=world_noDaughters, registry=reg_noDaughters)
+
+        reg_noDaughters.setWorld(world_noDaughters.name)
+        """
+
+        if args.childless_subtrees:
+            reg_noDaughters = utils.transfer_childless_subtrees(reg, args.childless_subtrees)
+        else:
+            reg_noDaughters = utils.transfer_childless_world(reg)
+        world_noDaughters = reg_noDaughters.getWorldVolume()
+        digest, written, _ = utils.write_gdml(reg_noDaughters, noDaughtersName)
+        print(f"{noDaughtersName} {'written' if written else 'unchanged'} (sha256 {digest})")
+        cache.store(cache_key, noDaughtersName, childless_suffix, extension=extension)
+
+        """
+        gas_wo_daughters = utils.get_solid_by_name("gasSolid-0-17", reg_noDaughters)
+        v = pyg4ometry.visualisation.VtkViewerColouredMaterial()
+        v.addSolid(gas_wo_daughters)
+        v.addAxes(1000)
+        v.view()
+        """
+
+
+if __name__ == "__main__":
+    main()
+
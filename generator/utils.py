@@ -1,31 +1,177 @@
+import bisect
+import collections
+import fnmatch
+import itertools
+import logging
+import time
+import weakref
+
 from pyg4ometry import geant4 as g4
 import pyg4ometry.transformation as tf
 from pyg4ometry.exceptions import IdenticalNameError
 import numpy as np
 
-def substract_daughters_from_mother(mother, solid_mother=None, rotation_mother=[0, 0, 0], position_mother=[0, 0, 0], base_name="", registry=None):
+import booleans
+
+logger = logging.getLogger(__name__)
+
+# Counters of the childless flattening (subtractions, name collisions, volumes created) and time in seconds spent in
+# every subtree (including the subtrees below it), by path. Reset by transfer_childless_world, which logs a summary.
+counters = collections.Counter()
+subtree_times = {}
+
+# Subtractions already built in each registry: {registry: {(mother solid name, daughter logical volume name,
+# rotation, position): subtraction solid}}. Volumes reached through several paths (both Micromegas, the rings...)
+# reuse the solids built the first time instead of building them again.
+_subtractions = weakref.WeakKeyDictionary()
+
+def reset_stats():
+    counters.clear()
+    subtree_times.clear()
+
+def log_summary(top=10):
+    """
+    Logs (at INFO level) the counters of the childless flattening and the slowest subtrees.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("Childless flattening: %s", ", ".join(f"{name}={count}" for name, count in sorted(counters.items())))
+    lookups = counters["subtraction_cache_hits"] + counters["subtraction_cache_misses"]
+    if lookups:
+        logger.info("Subtraction cache hit rate: %.1f%% of %d subtractions", 100 * counters["subtraction_cache_hits"] / lookups, lookups)
+    for name, elapsed in sorted(subtree_times.items(), key=lambda item: item[1], reverse=True)[:top]:
+        logger.info("    %8.3f s  %s", elapsed, name)
+
+# Placements are carried through the flattening as 4x4 homogeneous matrices T: a point p in the frame of a volume is
+# at T @ (p, 1) in the frame of its mother, so T_mother @ T_daughter places a daughter in the frame of its grandmother.
+# Geant4 placements apply the inverse of the rotation given by their Tait-Bryan angles, so the rotation block of T is
+# the transpose of tbxyz2matrix(rotation). The angles are only computed back when a solid or volume is created.
+
+def get_matrix(rotation=(0, 0, 0), position=(0, 0, 0)):
+    """
+    Returns the 4x4 matrix of a placement with the given Tait-Bryan angles and position.
+    """
+    matrix = np.eye(4)
+    rotation_matrix = tf.tbxyz2matrix(rotation).T
+    # remove the rounding noise of the trigonometric functions (e.g. sin(pi)), which would drift down the tree
+    rotation_matrix[np.abs(rotation_matrix) < 1e-12] = 0
+    matrix[:3, :3] = rotation_matrix
+    matrix[:3, 3] = position
+    return matrix
+
+def to_rotations_positions(matrices):
+    """
+    Returns the (N, 3) arrays of Tait-Bryan angles and positions of the placements given by an (N, 4, 4) array of
+    matrices. Same angles as tf.matrix2tbxyz, for all the placements at once.
+    """
+    rotations = matrices[:, :3, :3].transpose(0, 2, 1)
+    a_12, a_13 = rotations[:, 0, 1], rotations[:, 0, 2]
+    a_31 = np.clip(rotations[:, 2, 0], -1, 1)
+    with np.errstate(invalid="ignore"):
+        angles = np.column_stack([
+            np.arctan2(rotations[:, 2, 1], rotations[:, 2, 2]),
+            np.arcsin(-a_31),
+            np.arctan2(rotations[:, 1, 0], rotations[:, 0, 0]),
+        ])
+    # gimbal lock
+    angles[a_31 == -1] = np.column_stack([np.arctan2(a_12, a_13), np.full_like(a_12, np.pi / 2), np.zeros_like(a_12)])[a_31 == -1]
+    angles[a_31 == 1] = np.column_stack([np.arctan2(-a_12, -a_13), np.full_like(a_12, -np.pi / 2), np.zeros_like(a_12)])[a_31 == 1]
+    # adding 0.0 turns the negative zeros into zeros
+    return angles + 0.0, matrices[:, :3, 3] + 0.0
+
+def to_rotation_position(matrix):
+    """
+    Returns the Tait-Bryan angles and the position of the placement given by a 4x4 matrix.
+    """
+    angles, positions = to_rotations_positions(matrix[None])
+    return angles[0].tolist(), positions[0]
+
+def get_copies(physical):
+    """
+    Returns the list of (name, 4x4 placement matrix) of the copies of a daughter volume: the physical volume itself,
+    or one copy per slice of a replica along x, y or z (<replica name>_<copy number>), placed as Geant4 does, centred
+    on its mother.
+    """
+    if physical.type == "placement":
+        return [(physical.name, get_matrix(physical.rotation.eval(), physical.position.eval()))]
+    if physical.type != "replica" or physical.axis not in (1, 2, 3):
+        raise ValueError(f"Daughter {physical.name}: only placements and replicas along x, y or z are supported.")
+    from pyg4ometry.gdml import Units
+    from pyg4ometry.gdml.Defines import evaluateToFloat
+    count = int(evaluateToFloat(physical.registry, physical.nreplicas))
+    width = evaluateToFloat(physical.registry, physical.width)*Units.unit(physical.wunit)
+    copies = []
+    for i in range(count):
+        position = [0.0, 0.0, 0.0]
+        position[physical.axis - 1] = -width*(count - 1)/2 + i*width
+        copies.append((f"{physical.name}_{i}", get_matrix(position=position)))
+    return copies
+
+def prepare_replicated_volume(volume):
+    """
+    Gives a logical volume without a mesh an empty one, before it is replicated. pyg4ometry builds the meshes of a
+    replica from the mesh of its logical volume even with meshing disabled (pyg4ometry.config.doMeshing), when the
+    logical volumes have no mesh at all. Returns volume.
+    """
+    if not hasattr(volume, "mesh"):
+        volume.mesh = None
+    return volume
+
+# Copies of the daughters of each volume: {volume: (tuple of the daughter physical volumes, [(physical volume, copy
+# name)], (N, 4, 4) array)}
+_daughter_copies = weakref.WeakKeyDictionary()
+
+def get_daughter_copies(volume):
+    """
+    Returns the list of (physical volume, copy name) of the copies of the daughters of a logical or assembly volume
+    (see get_copies) and the (N, 4, 4) array with their placement matrices.
+    They are cached and rebuilt when the daughters of the volume are not the same physical volumes as in the last call
+    (added, removed or replaced). Moving a daughter in place is not detected.
+    """
+    daughters = tuple(volume.daughterVolumes)
+    cached, copies, matrices = _daughter_copies.get(volume, (None, None, None))
+    # physical volumes compare by identity
+    if cached != daughters:
+        copies, matrices = [], []
+        for physical in daughters:
+            for name, matrix in get_copies(physical):
+                copies.append((physical, name))
+                matrices.append(matrix)
+        matrices = np.array(matrices).reshape(-1, 4, 4)
+        _daughter_copies[volume] = (daughters, copies, matrices)
+    return copies, matrices
+
+def get_daughter_matrices(volume):
+    """
+    Returns the (N, 4, 4) array with the placement matrices of the copies of the daughters of a logical or assembly
+    volume (see get_daughter_copies).
+    """
+    return get_daughter_copies(volume)[1]
+
+def substract_daughters_from_mother(mother, solid_mother=None, rotation_mother=[0, 0, 0], position_mother=[0, 0, 0], base_name="", registry=None, transform=None):
     """
     Subtracts the daughter volumes from the mother volume.
     This is a utility function to create a subtraction solid.
+    param transform: 4x4 placement matrix of the daughters of mother in the frame of the mother solid (see get_matrix).
+    Defaults to the matrix of rotation_mother and position_mother.
     """
     if registry is None:
         reg = g4.Registry()
     else:
         reg = registry
 
-    daughters = []
     mother_solid = None
     #mother_material = None
     if isinstance(mother, g4.PhysicalVolume):
-        daughters = mother.logicalVolume.daughterVolumes
+        volume = mother.logicalVolume
         mother_solid = mother.logicalVolume.solid
         #mother_material = mother.logicalVolume.material
     elif isinstance(mother, g4.LogicalVolume):
-        daughters = mother.daughterVolumes
+        volume = mother
         mother_solid = mother.solid
         #mother_material = mother.material
     elif isinstance(mother, g4.AssemblyVolume):
-        daughters = mother.daughterVolumes
+        volume = mother
         if solid_mother is None:
             raise TypeError("solid_mother must be provided for AssemblyVolume")
         mother_solid = solid_mother
@@ -37,96 +183,133 @@ def substract_daughters_from_mother(mother, solid_mother=None, rotation_mother=[
         solid_name_base = mother_solid.name
     else:
         solid_name_base = base_name
+    subtractions = _subtractions.setdefault(reg, {})
+    if transform is None:
+        transform = get_matrix(rotation_mother, position_mother)
 
-    for i, daughter in enumerate(daughters):
+    # placements of all the daughters in the frame of the mother solid
+    copies, matrices = get_daughter_copies(volume)
+    matrices = transform @ matrices
+    for i, ((daughter, _), matrix) in enumerate(zip(copies, matrices)):
         daughter_logical = daughter.logicalVolume
         solid_name = f"{solid_name_base}-{i}"
         if isinstance(daughter_logical, g4.AssemblyVolume):
-            assembly_pos = daughter.position.eval()
-            assembly_rot = daughter.rotation.eval()
-            rot = tf.matrix2tbxyz( tf.tbxyz2matrix(assembly_rot) @ tf.tbxyz2matrix(rotation_mother) )
-            pos = np.array(position_mother) + tf.tbxyz2matrix(rotation_mother) @ assembly_pos
             mother_solid = substract_daughters_from_mother(
                                             daughter_logical,
                                             solid_mother=mother_solid,
-                                            rotation_mother=rot, # assembly_rot, ??
-                                            position_mother=pos, #assembly_pos, ??
                                             base_name=solid_name,
-                                            registry=reg
+                                            registry=reg,
+                                            transform=matrix
                                         )
             continue
-        daughter_solid = daughter_logical.solid
-        daughter_rotation = np.array(daughter.rotation.eval())
-        daughter_position = np.array(daughter.position.eval())
-        final_rot = tf.matrix2tbxyz( tf.tbxyz2matrix(daughter_rotation) @ tf.tbxyz2matrix(rotation_mother) )
-        final_pos = np.array(position_mother) + tf.tbxyz2matrix(rotation_mother) @ daughter_position
+        key = (mother_solid.name, daughter_logical.name, matrix.tobytes())
+        if key in subtractions:
+            counters["subtraction_cache_hits"] += 1
+            mother_solid = subtractions[key]
+            continue
+        counters["subtraction_cache_misses"] += 1
+        final_rot, final_pos = to_rotation_position(matrix)
         try:
-            print(f"Subtracting {daughter_logical.name} from {mother_solid.name} to create {solid_name}: rot={final_rot}, pos={final_pos}")
+            logger.debug("Subtracting %s from %s to create %s: rot=%s, pos=%s", daughter_logical.name, mother_solid.name, solid_name, final_rot, final_pos)
             mother_solid = g4.solid.Subtraction(
                 name=solid_name,
                 obj1=mother_solid,
-                obj2=daughter_solid,
+                obj2=daughter_logical.solid,
                 tra2=[final_rot, final_pos.tolist()],
                 registry=reg
             )
+            counters["subtractions"] += 1
         except IdenticalNameError:
-            print(f"Solid with name {solid_name} already exists, retrieving it.")
+            logger.debug("Solid with name %s already exists, retrieving it.", solid_name)
+            counters["name_collisions"] += 1
             mother_solid = get_solid_by_name(solid_name, reg)
+        subtractions[key] = mother_solid
     
     #subtracted_solid = g4.LogicalVolume(mother_solid, mother_material, solid_name_base + "_subtracted", reg)
     
     return mother_solid
 
+# Registry dictionaries holding the objects of each kind, keyed by their exact name
+REGISTRY_DICTS = {
+    "solid": "solidDict",
+    "material": "materialDict",
+    "logical_volume": "logicalVolumeDict",
+    "physical_volume": "physicalVolumeDict",
+}
+
+KIND_LABELS = {
+    "solid": "Solid",
+    "material": "Material",
+    "logical_volume": "Logical volume",
+    "physical_volume": "Physical volume",
+}
+
+# Sorted names of each registry, used for prefix queries: {registry: {kind: (set of the names, sorted names)}}
+_name_index = weakref.WeakKeyDictionary()
+
+def get_by_name(name, registry, kind):
+    """
+    Returns the object of the given kind ("solid", "material", "logical_volume" or "physical_volume") with exactly
+    the given name. The lookup is a single dictionary access on the registry, so it is always in sync with it.
+    If the object is not found, it raises a KeyError.
+    """
+    objects = getattr(registry, REGISTRY_DICTS[kind])
+    try:
+        return objects[name]
+    except KeyError:
+        similar = [other for other in objects if name in other]
+        message = f"{KIND_LABELS[kind]} with name '{name}' not found in registry"
+        if similar:
+            raise KeyError(f"{message}, similar names found: {', '.join(similar)}") from None
+        raise KeyError(f"{message}.") from None
+
+def get_names(registry, kind):
+    """
+    Returns the sorted names of the objects of the given kind in the registry.
+    The list is cached and rebuilt when objects of that kind have been added, removed or renamed since the last call
+    (e.g. by prune_registry).
+    """
+    objects = getattr(registry, REGISTRY_DICTS[kind])
+    index = _name_index.setdefault(registry, {})
+    cached, names = index.get(kind, (None, None))
+    if cached is None or objects.keys() != cached:
+        names = sorted(objects)
+        index[kind] = (frozenset(names), names)
+    return names
+
+def get_by_prefix(prefix, registry, kind):
+    """
+    Returns the objects of the given kind whose name starts with prefix (e.g. "ringLeft"), sorted by name.
+    """
+    objects = getattr(registry, REGISTRY_DICTS[kind])
+    names = get_names(registry, kind)
+    found = []
+    for i in range(bisect.bisect_left(names, prefix), len(names)):
+        if not names[i].startswith(prefix):
+            break
+        found.append(objects[names[i]])
+    return found
+
 def get_solid_by_name(name, registry):
     """
     Returns the solid with the given name from the registry.
     If the solid is not found, it raises a KeyError.
     """
-    solids = registry.findSolidByName(name)
-    if not solids:
-        raise KeyError(f"Solid with name '{name}' not found in registry.")
-
-    if len(solids) > 1:
-        for solid in solids:
-            if solid.name == name:
-                return solid
-        raise KeyError(f"Solid with name '{name}' not found in registry, similar names found: {', '.join(s.name for s in solids)}")
-    
-    return solids[0]
+    return get_by_name(name, registry, "solid")
 
 def get_logical_volume_by_name(name, registry):
     """
     Returns the logical volume with the given name from the registry.
     If the logical volume is not found, it raises a KeyError.
     """
-    logical_volumes = registry.findLogicalVolumeByName(name)
-    if not logical_volumes:
-        raise KeyError(f"Logical volume with name '{name}' not found in registry.")
-
-    if len(logical_volumes) > 1:
-        for lv in logical_volumes:
-            if lv.name == name:
-                return lv
-        raise KeyError(f"Logical volume with name '{name}' not found in registry, similar names found: {', '.join(lv.name for lv in logical_volumes)}")
-    
-    return logical_volumes[0]
+    return get_by_name(name, registry, "logical_volume")
 
 def get_physical_volume_by_name(name, registry):
     """
     Returns the physical volume with the given name from the registry.
     If the physical volume is not found, it raises a KeyError.
     """
-    physical_volumes = registry.findPhysicalVolumeByName(name)
-    if not physical_volumes:
-        raise KeyError(f"Physical volume with name '{name}' not found in registry.")
-
-    if len(physical_volumes) > 1:
-        for pv in physical_volumes:
-            if pv.name == name:
-                return pv
-        raise KeyError(f"Physical volume with name '{name}' not found in registry, similar names found: {', '.join(pv.name for pv in physical_volumes)}")
-    
-    return physical_volumes[0]
+    return get_by_name(name, registry, "physical_volume")
 
 def get_position_of_physical_volume(name, registry):
     """
@@ -149,85 +332,98 @@ def get_material_by_name(name, registry):
     Returns the material with the given name from the registry.
     If the material is not found, it raises a KeyError.
     """
-    materials = registry.findMaterialByName(name)
-    if not materials:
-        raise KeyError(f"Material with name '{name}' not found in registry.")
-
-    if len(materials) > 1:
-        for mat in materials:
-            if mat.name == name:
-                return mat
-        raise KeyError(f"Material with name '{name}' not found in registry, similar names found: {', '.join(mat.name for mat in materials)}")
-    
-    return materials[0]
+    return get_by_name(name, registry, "material")
 
-def get_childless_volume(volume, base_name="", position=[0, 0, 0], rotation=[0, 0, 0], world_volume=None, is_world_volume=True, registry=None):
+def get_childless_volume(volume, base_name="", position=[0, 0, 0], rotation=[0, 0, 0], world_volume=None, is_world_volume=True, registry=None, transform=None, batch_size=1000):
+    """
+    Places in world_volume every volume below volume without daughters and, for every volume with daughters, a copy
+    of it with its daughters subtracted (<path>_childless_LV). The volumes are named after the path of physical
+    volumes leading to them, e.g. "shielding/outerGas/vesselassembly/gas/fieldcage/ring1".
+    The tree is walked depth first with an explicit stack, so its depth is not bound by the recursion limit, and the
+    physical volumes are created in batches of batch_size.
+    param transform: 4x4 placement matrix of volume in world_volume (see get_matrix). Defaults to the matrix of
+    rotation and position.
+    """
     reg = registry if registry is not None else g4.Registry()
-    print(f"Getting childless volume for: {volume.name}, pos={position}, rot={rotation}, base_name={base_name}")
-    mother_logical = volume
-    mother_pos = np.array(position) if isinstance(position, (list, tuple)) else position
-    mother_rot_matrix = tf.tbxyz2matrix(rotation)
-    if volume.daughterVolumes and not is_world_volume and not isinstance(volume, g4.AssemblyVolume):
-        print(f"Removing children from solid of volume: {volume}")
-        subtracted_solid = substract_daughters_from_mother(volume,
-                                                           #position_mother=position,
-                                                           #rotation_mother=rotation,
-                                                           registry=reg)
-        #try:
-        print(f"Creating LV: {base_name + volume.name + '_childless_LV'} with solid {subtracted_solid.name}")
-        subtracted_logical = g4.LogicalVolume(
-            name=base_name +volume.name + "_childless_LV",
-            solid=subtracted_solid,
-            material=volume.material,
-            registry=reg
-        )
-        #except IdenticalNameError:
-            #subtracted_logical = get_logical_volume_by_name(volume.name + "_childless_LV", reg)
-        print(f"Creating PV at pos {mother_pos}, rot {tf.matrix2tbxyz(mother_rot_matrix)}")
-        g4.PhysicalVolume(
-            name=base_name + volume.name + "_childless_PV",
-            logicalVolume=subtracted_logical,
-            motherVolume=world_volume,
-            position=mother_pos,
-            rotation=tf.matrix2tbxyz(mother_rot_matrix), # rotation better to avoid converting to matrix and back to tbxyz
-            registry=reg
-        )
-    elif is_world_volume:
-        try:
-            print(f"Adding world volume: {volume.name}")
-            g4.LogicalVolume(
-                name=base_name + volume.name,
-                solid=volume.solid,
-                material=volume.material,
-                registry=reg
-            )
-        except IdenticalNameError:
-            print(f"World volume {volume.name} already exists, skipping creation.")
-
-    for physical in volume.daughterVolumes:
-        pos = np.array(physical.position.eval())
-        rot_matrix= tf.tbxyz2matrix(physical.rotation.eval())
-        logical = physical.logicalVolume
-        if not logical.daughterVolumes:
-            print(f"Creating PV {base_name + physical.name} at pos {mother_pos + mother_rot_matrix @ pos},  rot  {tf.matrix2tbxyz(mother_rot_matrix @ rot_matrix)}")
-            reg.transferLogicalVolume(logical)
+    if transform is None:
+        transform = get_matrix(rotation, position)
+
+    # (name, logical volume, placement matrix) of the physical volumes not created yet
+    pending = []
+    def create_physical_volumes():
+        if not pending:
+            return
+        rotations, positions = to_rotations_positions(np.array([matrix for _, _, matrix in pending]))
+        for (name, logical, _), rot, pos in zip(pending, rotations.tolist(), positions):
             g4.PhysicalVolume(
-                name=base_name + physical.name,
+                name=name,
                 logicalVolume=logical,
                 motherVolume=world_volume,
-                position=mother_pos + mother_rot_matrix @ pos,
-                rotation=tf.matrix2tbxyz(rot_matrix @ mother_rot_matrix),
+                position=pos,
+                rotation=rot,
                 registry=reg
             )
-        else:
-            get_childless_volume(logical,
-                                base_name=base_name + physical.name + "/",
-                                position=mother_pos + mother_rot_matrix @ pos,
-                                rotation=tf.matrix2tbxyz(rot_matrix @ mother_rot_matrix),
-                                world_volume=world_volume,
-                                is_world_volume=False,
-                                registry=reg
-                                )
+        counters["physical_volumes"] += len(pending)
+        pending.clear()
+
+    # Paths are tuples of daughter indices from volume, the name prefix of each path is rendered once
+    prefixes = {(): base_name}
+    # Entries (volume, path, placement matrix, name): volumes with daughters have no name, volumes without daughters
+    # are placed under their name, and (None, path, None, start time) marks the end of the subtree of path
+    stack = [(volume, (), transform, None)]
+    while stack:
+        volume, path, transform, name = stack.pop()
+        if volume is None:
+            subtree_times[prefixes[path][:-1]] = time.perf_counter() - name
+            continue
+        if name is not None:
+            logger.debug("Creating PV %s", name)
+            if reg.logicalVolumeDict.get(volume.name) is not volume:
+                reg.transferLogicalVolume(volume, {})
+            pending.append((name, volume, transform))
+            if len(pending) >= batch_size:
+                create_physical_volumes()
+            continue
+
+        prefix = prefixes[path]
+        is_world = is_world_volume and not path
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Getting childless volume for: %s, pos=%s, rot=%s, base_name=%s", volume.name, transform[:3, 3], to_rotation_position(transform)[0], prefix)
+        if volume.daughterVolumes and not is_world and not isinstance(volume, g4.AssemblyVolume):
+            logger.debug("Removing children from solid of volume: %s", volume.name)
+            subtracted_solid = substract_daughters_from_mother(volume, registry=reg)
+            logger.debug("Creating LV: %s with solid %s", prefix + volume.name + "_childless_LV", subtracted_solid.name)
+            subtracted_logical = g4.LogicalVolume(
+                name=prefix + volume.name + "_childless_LV",
+                solid=subtracted_solid,
+                material=volume.material,
+                registry=reg
+            )
+            counters["logical_volumes"] += 1
+            pending.append((prefix + volume.name + "_childless_PV", subtracted_logical, transform))
+        elif is_world and world_volume is None:
+            logger.debug("Adding world volume: %s", volume.name)
+            world_volume = g4.LogicalVolume(
+                name=prefix + volume.name,
+                solid=volume.solid,
+                material=volume.material,
+                registry=reg
+            )
+
+        if path:
+            stack.append((None, path, None, time.perf_counter()))
+        # placements of all the daughters in the frame of the world, pushed in reverse to be placed in order
+        copies, matrices = get_daughter_copies(volume)
+        matrices = transform @ matrices
+        for i in reversed(range(len(matrices))):
+            physical, copy_name = copies[i]
+            logical = physical.logicalVolume
+            if not logical.daughterVolumes:
+                stack.append((logical, None, matrices[i], prefix + copy_name))
+            else:
+                prefixes[path + (i,)] = prefix + copy_name + "/"
+                stack.append((logical, path + (i,), matrices[i], None))
+    create_physical_volumes()
 
 def transfer_childless_world(origin_registry):
     """
@@ -237,26 +433,500 @@ def transfer_childless_world(origin_registry):
     if not isinstance(origin_registry, g4.Registry):
         raise TypeError("Both origin_registry and target_registry must be instances of g4.Registry")
     world_volume = origin_registry.getWorldVolume()
-    print(f"Transferring world volume: {world_volume.name}")
     if world_volume is None:
         raise ValueError("No world volume found in origin_registry")
+    logger.debug("Transferring world volume: %s", world_volume.name)
+    reset_stats()
 
     target_registry = g4.Registry()
 
+    # an explicit rename dictionary, as the default one of transferSolid is shared between calls
+    renamed = {}
     for name, solid in origin_registry.solidDict.items():
-        #print(f"Transferring solid: {name}")
-        target_registry.transferSolid(solid)
+        target_registry.transferSolid(solid, renamed)
     for name, material in origin_registry.materialDict.items():
-        #print(f"Transferring material: {name}")
-        target_registry.transferMaterial(material)
+        target_registry.transferMaterial(material, renamed)
     world_volume_target = g4.LogicalVolume(world_volume.solid, world_volume.material, "world", target_registry)
     get_childless_volume(world_volume, world_volume=world_volume_target, is_world_volume=True, registry=target_registry)
-    
-    for name, solid in origin_registry.solidDict.items():
-        if name not in target_registry.solidDict.keys():
-            print(f"Transferring missing solid: {name}")
-            target_registry.transferSolid(solid)
 
-    print(world_volume_target.name)
     target_registry.setWorld(world_volume_target.name)
+    log_summary()
     return target_registry
+
+def get_reachable(registry):
+    """
+    Returns the names of the objects reachable from the world volume of the registry, by kind:
+    {"logical_volume": set, "physical_volume": set, "solid": set, "material": set}.
+    The solids include the operands of the boolean solids and the materials their components (elements, isotopes).
+    """
+    volumes = get_subtree_volumes(registry.getWorldVolume())
+    reachable = {kind: set() for kind in REGISTRY_DICTS}
+    reachable["logical_volume"].update(volumes)
+    solids = []
+    materials = []
+    for volume in volumes.values():
+        reachable["physical_volume"].update(physical.name for physical in volume.daughterVolumes)
+        if volume.type == "logical":
+            solids.append(volume.solid)
+            materials.append(volume.material)
+    while solids:
+        solid = solids.pop()
+        if solid.name not in reachable["solid"]:
+            reachable["solid"].add(solid.name)
+            solids.extend(booleans.get_operands(solid))
+    while materials:
+        material = materials.pop()
+        if material.name not in reachable["material"]:
+            reachable["material"].add(material.name)
+            materials.extend(component[0] for component in getattr(material, "components", []))
+    return reachable
+
+def prune_registry(registry):
+    """
+    Removes from the registry the logical volumes, physical volumes, solids and materials that are not reachable from
+    its world volume, such as the intermediate solids of the generators or the solids of the other cathode type.
+    Returns the number of removed objects of each kind, {kind: number}.
+    """
+    reachable = get_reachable(registry)
+    removed = {}
+    for kind, dict_name in REGISTRY_DICTS.items():
+        objects = getattr(registry, dict_name)
+        unreachable = [name for name in objects if name not in reachable[kind]]
+        for name in unreachable:
+            del objects[name]
+            if kind == "logical_volume":
+                registry.assemblyVolumeDict.pop(name, None)
+        removed[kind] = len(unreachable)
+    if any(removed.values()):
+        logger.info("Pruned objects not reachable from the world: %s", ", ".join(f"{count} {KIND_LABELS[kind].lower()}s" for kind, count in removed.items()))
+    return removed
+
+def write_gdml(registry, filename, prune=True):
+    """
+    Writes the registry to a GDML file with the streaming writer (see writer.py). The file is left untouched if it
+    already holds the same document.
+    param prune: If True, the objects not reachable from the world volume are removed from the registry first
+    (see prune_registry), so they are not written.
+    Returns the tuple (content hash of the document, True if the file was written or False if it was unchanged,
+    number of removed objects of each kind).
+    """
+    import writer
+    removed = prune_registry(registry) if prune else {kind: 0 for kind in REGISTRY_DICTS}
+    digest, written = writer.write(registry, filename)
+    if not written:
+        logger.info("%s unchanged (sha256 %s)", filename, digest)
+    return digest, written, removed
+
+def matches_any(names, patterns):
+    """
+    Returns True if any of the names matches any of the glob patterns (e.g. "fieldcage*").
+    """
+    return any(fnmatch.fnmatchcase(name, pattern) for name in names for pattern in patterns)
+
+def get_subtree_volumes(volume, volumes=None):
+    """
+    Returns the dictionary {name: volume} of volume and of every logical and assembly volume below it.
+    """
+    if volumes is None:
+        volumes = {}
+    stack = [volume]
+    while stack:
+        volume = stack.pop()
+        if volume.name in volumes:
+            continue
+        volumes[volume.name] = volume
+        stack.extend(physical.logicalVolume for physical in volume.daughterVolumes)
+    return volumes
+
+def transfer_childless_subtrees(origin_registry, patterns):
+    """
+    Returns a new registry with the geometry of origin_registry where only the subtrees of the volumes matching
+    patterns are flattened: a matching volume keeps its solid and material, but its daughters are replaced by every
+    volume below it without daughters and by copies of the others with their daughters subtracted, named after their
+    path (see get_childless_volume). The rest of the hierarchy is kept as regular placements, and only the solids and
+    materials used by the new geometry are transferred.
+    param patterns: Names or glob patterns (e.g. "gas_LV", "fieldcage*") matched against the names of the logical
+    and assembly volumes and of the physical volumes placing them.
+    """
+    world_volume = origin_registry.getWorldVolume()
+    if world_volume is None:
+        raise ValueError("No world volume found in origin_registry")
+    reset_stats()
+
+    def matches(physical, volume):
+        return matches_any([volume.name] if physical is None else [physical.name, volume.name], patterns)
+
+    # volumes with a matching volume below them, which are copied with new daughters
+    affected = {}
+    def is_affected(volume):
+        if volume.name not in affected:
+            affected[volume.name] = any(matches(physical, physical.logicalVolume) or is_affected(physical.logicalVolume) for physical in volume.daughterVolumes)
+        return affected[volume.name]
+
+    def get_mode(physical, volume):
+        if matches(physical, volume):
+            return "flattened"
+        return "copied" if is_affected(volume) else "original"
+
+    # how each volume is used: {name: set of "original", "copied" and "flattened"}, the volumes used, and the name of
+    # the first physical volume flattening each volume, which prefixes the names of the volumes of its subtree
+    modes = collections.defaultdict(set)
+    used_volumes = {}
+    placements = {}
+    stack = [(None, world_volume)]
+    while stack:
+        physical, volume = stack.pop()
+        mode = get_mode(physical, volume)
+        if mode in modes[volume.name]:
+            continue
+        modes[volume.name].add(mode)
+        if mode == "flattened":
+            placements[volume.name] = volume.name if physical is None else physical.name
+        if mode == "copied":
+            used_volumes[volume.name] = volume
+            stack.extend((daughter, daughter.logicalVolume) for daughter in volume.daughterVolumes)
+        else:
+            get_subtree_volumes(volume, used_volumes)
+
+    # transfer the solids (with their operands) and materials (with their components) used, in their original order
+    used_solids = set()
+    used_materials = set()
+    for volume in used_volumes.values():
+        if volume.type != "logical":
+            continue
+        solids = [volume.solid]
+        while solids:
+            solid = solids.pop()
+            used_solids.add(solid.name)
+            solids.extend(booleans.get_operands(solid))
+        materials = [volume.material]
+        while materials:
+            material = materials.pop()
+            used_materials.add(material.name)
+            materials.extend(component[0] for component in getattr(material, "components", []))
+    target_registry = g4.Registry()
+    renamed = {}  # shared by the transfers so that every object is transferred once
+    for name, material in origin_registry.materialDict.items():
+        if name in used_materials:
+            target_registry.transferMaterial(material, renamed)
+    for name, solid in origin_registry.solidDict.items():
+        if name in used_solids:
+            target_registry.transferSolid(solid, renamed)
+    counters["removed_solids"] += len(origin_registry.solidDict) - len(used_solids)
+
+    built = {}
+    def build(volume, mode):
+        key = (volume.name, mode)
+        if key in built:
+            return built[key]
+        if mode == "original":
+            for name, original in get_subtree_volumes(volume).items():
+                if name not in target_registry.logicalVolumeDict:
+                    target_registry.transferLogicalVolume(original, renamed)
+                    for physical in original.daughterVolumes:
+                        target_registry.transferPhysicalVolume(physical, renamed)
+                    counters["kept_volumes"] += 1
+            built[key] = volume
+            return volume
+        # volumes also used in another way get a suffix
+        suffix = ""
+        if mode == "copied" and "original" in modes[volume.name]:
+            suffix = "_copy"
+        elif mode == "flattened" and len(modes[volume.name]) > 1:
+            suffix = "_childless"
+        if volume.type == "assembly":
+            copy = g4.AssemblyVolume(volume.name + suffix, target_registry)
+        else:
+            copy = g4.LogicalVolume(volume.solid, volume.material, volume.name + suffix, target_registry)
+        built[key] = copy
+        if mode == "flattened":
+            logger.debug("Flattening the subtree of %s", volume.name)
+            counters["flattened_subtrees"] += 1
+            start = time.perf_counter()
+            placement = placements[volume.name]
+            get_childless_volume(volume, base_name=placement + "/", world_volume=copy, is_world_volume=True, registry=target_registry)
+            subtree_times[placement] = time.perf_counter() - start
+            return copy
+        counters["copied_volumes"] += 1
+        for physical in volume.daughterVolumes:
+            daughter = build(physical.logicalVolume, get_mode(physical, physical.logicalVolume))
+            if physical.type == "replica":
+                g4.ReplicaVolume(
+                    physical.name + suffix,
+                    prepare_replicated_volume(daughter),
+                    copy,
+                    physical.axis,
+                    physical.nreplicas,
+                    physical.width,
+                    physical.offset,
+                    target_registry,
+                    wunit=physical.wunit,
+                    ounit=physical.ounit,
+                )
+                continue
+            g4.PhysicalVolume(
+                physical.rotation.eval(),
+                physical.position.eval(),
+                daughter,
+                physical.name + suffix,
+                copy,
+                target_registry,
+                copyNumber=physical.copyNumber,
+            )
+        return copy
+
+    world_target = build(world_volume, get_mode(None, world_volume))
+    target_registry.setWorld(world_target.name)
+    log_summary()
+    return target_registry
+
+# Subtracted parts as daughters: a gas volume built as a primitive minus the solids of the volumes placed next to it
+# (A - B1 - ... - Bn) keeps only the primitive A, and the parts of the Bi inside A are placed in it as daughters, with
+# the same material. Geant4 then navigates the gas as a primitive with voxelised daughters instead of evaluating the
+# whole chain of subtractions at every step.
+
+def get_subtraction_chain(solid):
+    """
+    Returns the tuple (base solid, list of (subtracted solid, transformation)) of a chain of subtractions
+    A - B1 - ... - Bn, with the (A, a) transformations of the subtracted solids relative to A (see booleans.py).
+    """
+    subtracted = []
+    while solid.type == "Subtraction":
+        (solid, _), operand = booleans.get_operand_transforms(solid)
+        subtracted.insert(0, operand)
+    return solid, subtracted
+
+def is_convex(solid):
+    """
+    Returns True for the primitives known to be convex: boxes and full cylinders.
+    """
+    if solid.type == "Box":
+        return True
+    if solid.type == "Tubs":
+        return solid.evaluateParameterWithUnits("pRMin") == 0 and solid.evaluateParameterWithUnits("pDPhi") >= 2*np.pi - 1e-9
+    return False
+
+def is_disjoint(solid, transform, base, tolerance=1e-9):
+    """
+    Returns True if solid, placed with the (A, a) transformation in the frame of the primitive base, provably does not
+    overlap base: their extents are disjoint, or both are coaxial cylinders whose radial ranges are disjoint (a tube
+    around a cylinder, like the vessel around the gas). Returns False when it cannot tell.
+    """
+    import sampling
+    low, high = sampling.get_operand_extent(solid, transform)
+    base_low, base_high = sampling.get_extent(base)
+    if np.any(np.minimum(high, base_high) - np.maximum(low, base_low) <= tolerance):
+        return True
+    A, a = transform
+    if solid.type == "Tubs" and base.type == "Tubs" and np.allclose(np.abs(A[:, 2]), [0, 0, 1]) and np.allclose(a[:2], 0):
+        rmin, rmax = solid.evaluateParameterWithUnits("pRMin"), solid.evaluateParameterWithUnits("pRMax")
+        base_rmin, base_rmax = base.evaluateParameterWithUnits("pRMin"), base.evaluateParameterWithUnits("pRMax")
+        return rmin >= base_rmax - tolerance or base_rmin >= rmax - tolerance
+    return False
+
+def classify_part(solid, transform, base, tolerance=1e-9):
+    """
+    Returns where solid, placed with the (A, a) transformation in the frame of the primitive base, is with respect to
+    base: "outside" (at most touching it), "inside" (possibly touching its surface) or "crossing" its surface. A part
+    is only "inside" if the corners of its extent are inside a convex base, and only "outside" if it is provably
+    disjoint from base (see is_disjoint). Any other part is "crossing", even if it does not actually reach base: it is
+    then cut from the gas instead of overlapping it, at worst leaving an empty daughter, so the result is always safe.
+    """
+    import sampling
+    if is_disjoint(solid, transform, base, tolerance=tolerance):
+        return "outside"
+    # the corners are moved inwards by the tolerance, so that a part touching the surface of base is inside
+    low, high = sampling.get_operand_extent(solid, transform)
+    corners = np.array(list(itertools.product(*zip(low + tolerance, high - tolerance))))
+    if is_convex(base) and np.all(sampling.inside(base, corners)):
+        return "inside"
+    return "crossing"
+
+def get_placements(volume, matrix=None, path=()):
+    """
+    Returns the list of (physical volume, path of assembly physical volumes above it, placement matrix in the frame of
+    volume) of the daughters of volume, with the daughters of assembly volumes placed directly and a replica once per
+    copy, as Geant4 does.
+    """
+    if matrix is None:
+        matrix = np.eye(4)
+    placements = []
+    copies, matrices = get_daughter_copies(volume)
+    for (physical, _), daughter_matrix in zip(copies, matrix @ matrices):
+        if physical.logicalVolume.type == "assembly":
+            placements.extend(get_placements(physical.logicalVolume, daughter_matrix, path + (physical,)))
+        else:
+            placements.append((physical, path, daughter_matrix))
+    return placements
+
+def remove_physical_volume(physical, registry):
+    """
+    Removes a physical volume from its mother volume and from the registry.
+    """
+    physical.motherVolume.daughterVolumes.remove(physical)
+    physical.motherVolume._daughterVolumesDict.pop(physical.name, None)
+    del registry.physicalVolumeDict[physical.name]
+
+def place_subtracted_parts(registry, patterns=None, verify=False, n_points=100000):
+    """
+    Rewrites the gas volumes of the registry whose solid is a chain of subtractions from a primitive, A - B1 - ... - Bn,
+    so that their solid is the primitive A and the parts of the subtracted solids inside A are daughters of the gas.
+    Only the subtracted solids that are the solid of a volume placed next to the gas (in the same mother volume or
+    assembly, at the same position) are handled, see classify_part:
+    * parts provably outside A, that only touch the gas, are not subtracted anymore;
+    * volumes inside A are moved into the gas;
+    * volumes crossing the surface of A keep their part outside of A (their solid minus A) and the parts of their
+    union leaves inside A are placed in the gas, as the leaf itself or its intersection with A. Volumes with nothing
+    left outside of the gases (none of n_points points sampled in their extent is inside) are removed.
+    The other subtractions are kept. The material at every point of the geometry is unchanged.
+    param patterns: Names or glob patterns of the logical volumes to rewrite. Defaults to every volume made of a gas.
+    The replicated volumes and the volumes holding a replica are never rewritten.
+    param verify: If True, the material at n_points points sampled in the extent of every rewritten gas is compared
+    with the material there before (see sampling.get_materials) and a ValueError is raised if any differs.
+    Returns the list of (gas logical volume name, statistics of its solid before, after, {"outside": number of
+    parts, "moved": volumes, "split": volumes, "kept": subtractions}), see booleans.analyse_solid.
+    """
+    import sampling
+
+    volumes = registry.logicalVolumeDict
+    placement_counts = collections.Counter()
+    mothers = {}
+    # the replicas and the volumes holding them, which must keep their solid
+    replicated = set()
+    for volume in volumes.values():
+        for physical in volume.daughterVolumes:
+            placement_counts[physical.logicalVolume.name] += 1
+            mothers[physical.logicalVolume.name] = (volume, physical)
+            if physical.type != "placement":
+                replicated.update((volume.name, physical.logicalVolume.name))
+
+    def is_gas(volume):
+        return volume.type == "logical" and getattr(volume.material, "state", None) == "gas"
+
+    gases = []
+    for volume in volumes.values():
+        if (patterns is None and not is_gas(volume)) or (patterns is not None and not matches_any([volume.name], patterns)):
+            continue
+        if volume.type != "logical" or volume.solid.type != "Subtraction" or placement_counts[volume.name] != 1 or volume.name in replicated:
+            continue
+        base, subtracted = get_subtraction_chain(volume.solid)
+        if not booleans.get_operands(base):
+            gases.append((volume, base, subtracted))
+
+    # materials at points sampled in the extent of every gas, in the frame of its mother, before any change
+    checks = []
+    if verify:
+        rng = np.random.default_rng(0)
+        for volume, base, _ in gases:
+            mother, physical = mothers[volume.name]
+            while mother.type == "assembly":
+                mother, _ = mothers[mother.name]
+            low, high = sampling.get_extent(base)
+            points = rng.uniform(low, high, size=(n_points, 3))
+            placements = {physical: matrix for physical, _, matrix in get_placements(mother)}
+            gas_matrix = placements[physical]
+            points = points @ gas_matrix[:3, :3].T + gas_matrix[:3, 3]
+            checks.append((volume, mother, points, sampling.get_materials(mother, points)))
+
+    # solids of the volumes before any change, as the parts crossing several gases are split once per gas
+    original_solids = {name: volume.solid for name, volume in volumes.items() if volume.type == "logical"}
+    split = {}
+    report = []
+    for volume, base, subtracted in gases:
+        before = booleans.analyse_solid(volume.solid)
+        mother, gas_physical = mothers[volume.name]
+        counts = collections.Counter()
+        # placements next to the gas, in the frame of the gas
+        placements = get_placements(mother)
+        gas_inverse = np.linalg.inv(next(matrix for physical, _, matrix in placements if physical is gas_physical))
+        siblings = [(physical, path, gas_inverse @ matrix) for physical, path, matrix in placements if physical is not gas_physical]
+        kept = []
+        for operand, transform in subtracted:
+            operand_matrix = np.eye(4)
+            operand_matrix[:3, :3], operand_matrix[:3, 3] = transform
+            sibling = next(((physical, path, matrix) for physical, path, matrix in siblings
+                            if original_solids.get(physical.logicalVolume.name) is operand and np.allclose(matrix, operand_matrix, atol=1e-9)), None)
+            # a volume reached through an assembly placed several times cannot be moved or changed for this gas only
+            if sibling is None or any(placement_counts[physical.logicalVolume.name] != 1 for physical in sibling[1]):
+                kept.append((operand, transform))
+                continue
+            physical, _, matrix = sibling
+            logical = physical.logicalVolume
+            leaves = booleans.get_union_leaves(operand, transform) if operand.type in ("Union", "MultiUnion") else [(operand, transform)]
+            parts = [(leaf, leaf_transform, classify_part(leaf, leaf_transform, base)) for leaf, leaf_transform in leaves]
+            if all(where == "outside" for _, _, where in parts):
+                logger.debug("%s only touches %s, not subtracted anymore", physical.name, volume.name)
+                counts["outside"] += 1
+                continue
+            if all(where == "inside" for _, _, where in parts):
+                logger.debug("Moving %s into %s", physical.name, volume.name)
+                remove_physical_volume(physical, registry)
+                rotation, position = to_rotation_position(matrix)
+                g4.PhysicalVolume(rotation, position.tolist(), logical, physical.name, volume, registry, copyNumber=physical.copyNumber)
+                counts["moved"] += 1
+                continue
+            # the solid of the volume changes, which is only possible if it is placed once and has no daughters
+            if placement_counts[logical.name] != 1 or logical.daughterVolumes:
+                kept.append((operand, transform))
+                continue
+            logger.debug("Splitting %s between %s and its mother", physical.name, volume.name)
+            part_name = logical.name[:-len("_LV")] if logical.name.endswith("_LV") else logical.name
+            gas_name = volume.name[:-len("_LV")] if volume.name.endswith("_LV") else volume.name
+            base_rotation, base_position = booleans.to_rotation_position(booleans.invert((matrix[:3, :3], matrix[:3, 3])))
+            logical.solid = g4.solid.Subtraction(
+                name=f"{logical.solid.name}_outside_{gas_name}",
+                obj1=logical.solid,
+                obj2=base,
+                tra2=[base_rotation, base_position],
+                registry=registry
+            )
+            for i, (leaf, leaf_transform, where) in enumerate(parts):
+                if where == "outside":
+                    continue
+                solid = leaf
+                if where == "crossing":
+                    base_rotation, base_position = booleans.to_rotation_position(booleans.invert(leaf_transform))
+                    solid = g4.solid.Intersection(
+                        name=f"{leaf.name}_in_{gas_name}_{i}",
+                        obj1=leaf,
+                        obj2=base,
+                        tra2=[base_rotation, base_position],
+                        registry=registry
+                    )
+                part = g4.LogicalVolume(solid, logical.material, f"{part_name}_in_{gas_name}_{i}_LV", registry)
+                leaf_matrix = np.eye(4)
+                leaf_matrix[:3, :3], leaf_matrix[:3, 3] = leaf_transform
+                rotation, position = to_rotation_position(leaf_matrix)
+                g4.PhysicalVolume(rotation, position.tolist(), part, f"{physical.name}_in_{gas_name}_{i}", volume, registry)
+            split[physical.name] = physical
+            counts["split"] += 1
+
+        counts["kept"] = len(kept)
+        solid = base
+        for i, (operand, transform) in enumerate(kept):
+            solid = g4.solid.Subtraction(
+                name=f"{volume.solid.name}_kept{i}" if i < len(kept) - 1 else f"{volume.solid.name}_kept",
+                obj1=solid,
+                obj2=operand,
+                tra2=booleans.to_rotation_position(transform),
+                registry=registry
+            )
+        volume.solid = solid
+        after = booleans.analyse_solid(volume.solid)
+        logger.info("%s: %s parts outside, %s volumes moved, %s split, %s subtractions kept", volume.name, counts["outside"], counts["moved"], counts["split"], counts["kept"])
+        report.append((volume.name, before, after, dict(counts)))
+
+    # the volumes split between several gases may have nothing left outside of them
+    rng = np.random.default_rng(0)
+    for physical in split.values():
+        solid = physical.logicalVolume.solid
+        low, high = sampling.get_extent(solid)
+        if not np.any(sampling.inside(solid, rng.uniform(low, high, size=(n_points, 3)))):
+            logger.debug("Nothing of %s is left outside of the gases, removing it", physical.name)
+            remove_physical_volume(physical, registry)
+
+    for volume, mother, points, materials in checks:
+        mismatches = int(np.count_nonzero(sampling.get_materials(mother, points) != materials))
+        if mismatches:
+            raise ValueError(f"The materials in the extent of {volume.name} differ in {mismatches} of {len(points)} sampled points after placing the subtracted parts as daughters.")
+    return report
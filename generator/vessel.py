@@ -1,9 +1,10 @@
-import vtk
 import pyg4ometry
 from pyg4ometry import geant4 as g4
 from pyg4ometry import transformation as tf
 import pyg4ometry.geant4 as g4
 import numpy as np
+import envelopes
+import materials
 import utils
 
 vesselRadius = 192.5
@@ -33,139 +34,23 @@ calibrationExternalTapPosToVesselDistance = -2
 calibrationInternalTapLength = 5
 calibrationInternalTapRadius = 25
 
-def generate_vessel_assembly(name="vessel_assembly", registry=None, left_calibration_is_open=True, right_calibration_is_open=False, gas="Argon1%Isobutane1.1bar"):
+def generate_vessel_assembly(name="vessel_assembly", registry=None, left_calibration_is_open=True, right_calibration_is_open=False, gas="Argon1%Isobutane1.1bar", lod="full"):
     """
     Generates the vessel geometry for the TREX-DM detector.
+    param lod: Level of detail, see envelopes.LEVELS. The vessel is the same at "full" and "reduced"; at "envelope" it
+    is a closed cylinder with the gas cylinder (gas_LV) as its daughter.
     Returns a Geant4 Registry containing the vessel geometry.
     """
+    envelopes.check_level(lod)
     # Registry
     if registry is None:
         reg = g4.Registry()
     else:
         reg = registry 
-    """  
-    copper = g4.MaterialPredefined("G4_Cu")
-    air = g4.MaterialPredefined("G4_AIR") 
-    """
-    copper = g4.nist_material_2geant4Material("G4_Cu")
-    air = g4.nist_material_2geant4Material("G4_AIR")
-
-    argon_element = g4.nist_element_2geant4Element("G4_Ar")
-    argon = g4.MaterialCompound("ArgonGas",
-                                density=0.00163897,
-                                state="gas",
-                                #temperature=293.15,
-                                #temperature_unit="K",
-                                #pressure=1,
-                                #pressure_unit="bar",
-                                number_of_components=1,
-                                registry=reg)
-    argon.add_element_massfraction(argon_element, 1)
-    neon_element = g4.nist_element_2geant4Element("G4_Ne")
-    neon = g4.MaterialCompound("NeonGas",
-                                density=0.0008282,
-                                state="gas",
-                                #temperature=293.15,
-                                #temperature_unit="K",
-                                #pressure=1,
-                                #pressure_unit="bar",
-                                number_of_components=1,
-                                registry=reg)
-    neon.add_element_massfraction(neon_element, 1)
-
-    hydrogen = g4.nist_material_2geant4Material("G4_H")
-    carbon = g4.nist_material_2geant4Material("G4_C")
-    isobutanegas = g4.MaterialCompound("IsobutaneGas",
-                                       density=0.00238467,
-                                       #temperature=293.15,
-                                       #temperature_unit="K",
-                                      #pressure=1,
-                                       #pressure_unit="bar",
-                                       number_of_components=2,
-                                       state="gas",
-                                       registry=reg)
-    isobutanegas.add_material(hydrogen, 0.1734180721461297)
-    isobutanegas.add_material(carbon, 0.8265819278538703)
-    if gas == "Argon1%Isobutane1bar":
-        gas_material = g4.MaterialCompound("Argon1%Isobutane1bar",
-                                           density=0.00161882,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=1,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(argon, 0.9855)
-        gas_material.add_material(isobutanegas, 0.0145)
-    elif gas == "Argon1%Isobutane1.1bar":
-        gas_material = g4.MaterialCompound("Argon1%Isobutane1.1bar",
-                                           density=0.00178070,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=1.1,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(argon, 0.9855)
-        gas_material.add_material(isobutanegas, 0.0145)
-    elif gas == "Argon2%Isobutane1.1bar":
-        gas_material = g4.MaterialCompound("Argon2%Isobutane1.1bar",
-                                           density=0.00178877,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=1.1,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(argon, 0.9711)
-        gas_material.add_material(isobutanegas, 0.0289)
-    elif gas == "Neon2%Isobutane1.1bar":
-        gas_material = g4.MaterialCompound("Neon2%Isobutane1.1bar",
-                                           density=0.00091108,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=1.1,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(neon, 0.9445)
-        gas_material.add_material(isobutanegas, 0.0555)
-    elif gas == "Neon2%Isobutane2bar":
-        gas_material = g4.MaterialCompound("Neon2%Isobutane2bar",
-                                           density=0.00165651,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=2,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(neon, 0.9445)
-        gas_material.add_material(isobutanegas, 0.0555)
-    elif gas == "Neon2%Isobutane4bar":
-        gas_material = g4.MaterialCompound("Neon2%Isobutane4bar",
-                                           density=0.00331302,
-                                           state="gas",
-                                           #temperature=298.15,
-                                           #temperature_unit="K",
-                                           #pressure=4,
-                                           #pressure_unit="bar",
-                                           number_of_components=2,
-                                           registry=reg
-                                           )
-        gas_material.add_material(neon, 0.9445)
-        gas_material.add_material(isobutanegas, 0.0555)
-    else:
-        raise ValueError(f"Gas mixture '{gas}' is not defined.")
+    # Materials
+    copper = materials.get_material("G4_Cu", reg)
+    air = materials.get_material("G4_AIR", reg)
+    gas_material = materials.get_material(gas, reg)
 
     copperVesselTubeSolid = g4.solid.Tubs(
         name = "copperVesselTubeSolid",
@@ -402,6 +287,47 @@ def generate_vessel_assembly(name="vessel_assembly", registry=None, left_calibra
         registry=reg
     )
 
+    if lod == "envelope":
+        import sampling
+        # the taps and the calibration shieldings sticking in or out of the walls are spread over them
+        vesselEnvelope = g4.solid.Tubs(
+            name="vesselEnvelope",
+            pRMin=0,
+            pRMax=vesselRadius + vesselThickness,
+            pDz=vesselLength + 2*vesselThickness,
+            pSPhi=0,
+            pDPhi=360,
+            aunit="deg",
+            lunit="mm",
+            registry=reg
+        )
+        wall_volume = sampling.get_volume(vesselEnvelope) - sampling.get_volume(gasTube)
+        vesselEnvelope_LV = g4.LogicalVolume(
+            name="vesselEnvelope_LV",
+            solid=vesselEnvelope,
+            material=materials.get_mixture_material("vesselEnvelopeMixture", envelopes.get_masses(vessel_LV, reg), wall_volume, reg),
+            registry=reg
+        )
+        utils.remove_physical_volume(vessel_PV, reg)
+        utils.remove_physical_volume(gas_PV, reg)
+        gas_LV.solid = gasTube
+        gas_PV = g4.PhysicalVolume(
+            name="gas",
+            logicalVolume=gas_LV,
+            motherVolume=vesselEnvelope_LV,
+            position=[0, 0, 0],
+            rotation=[0, 0, 0],
+            registry=reg
+        )
+        vesselEnvelope_PV = g4.PhysicalVolume(
+            name="vesselEnvelope",
+            logicalVolume=vesselEnvelope_LV,
+            motherVolume=vessel_assembly,
+            position=[0, 0, 0],
+            rotation=[0, 0, 0],
+            registry=reg
+        )
+
     return reg
 
 if __name__ == "__main__":
@@ -415,14 +341,13 @@ if __name__ == "__main__":
     vessel_assembly = utils.get_logical_volume_by_name("vessel_assembly", reg)
 
     if args.gdml:
-        galactic = g4.nist_material_2geant4Material("G4_Galactic")
+        galactic = materials.get_material("G4_Galactic", reg)
         assembly_LV = vessel_assembly.logicalVolume(material=galactic)
         reg.setWorld(assembly_LV.name)
-        w = pyg4ometry.gdml.Writer()
-        w.addDetector(reg)
-        w.write('vessel.gdml')
+        utils.write_gdml(reg, 'vessel.gdml')
 
     if args.vis:
+        import pyg4ometry.visualisation
         v = pyg4ometry.visualisation.VtkViewer()
         v.addLogicalVolume(vessel_assembly)
         v.addAxes(200)
@@ -0,0 +1,543 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+
+from pyg4ometry.gdml import Defines, Reader
+from pyg4ometry.gdml.Writer import Writer as DomWriter, VisOptionsToAuxiliary
+from pyg4ometry.geant4._Material import Element, Isotope, Material
+
+# Streaming GDML writer: the sections of the file (defines, materials, solids, structure, setup) are written to the
+# file handle one element at a time, in the same order and layout as pyg4ometry.gdml.Writer, instead of building the
+# DOM of the whole document in memory first.
+# Every number is evaluated and written with the same fixed precision, so the output only depends on the geometry
+# and is byte-identical across runs.
+# Objects without a native serializer here (solids other than boxes, tubes, polyhedra and booleans, replicas,
+# surfaces...) are written through pyg4ometry.gdml.Writer one element at a time, so only the DOM of a single element
+# is in memory.
+
+PRECISION = 15 # significant digits of the numbers
+
+GDML_HEADER = '<gdml xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://cern.ch/service-spi/app/releases/GDML/schema/gdml.xsd">'
+
+# Compressed outputs, by file extension: compression level of the streams
+COMPRESSION_LEVELS = {
+    ".gz": 6,
+    ".zst": 10,
+}
+
+# The hash of the document is written in a comment after the root element, so it is known when the document ends
+HASH_COMMENT_START = "<!-- sha256:"
+HASH_TAIL = 128 # bytes read from the end of a file to find the hash
+_hash_pattern = re.compile(rb"<!-- sha256:([0-9a-f]{64}) -->")
+
+_escapes = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}
+
+def format_number(value):
+    """
+    Returns the fixed precision representation of a number, without negative zeros.
+    """
+    return f"{float(value) + 0.0:.{PRECISION}g}"
+
+def _escape(value):
+    return "".join(_escapes.get(character, character) for character in str(value))
+
+def _tag(name, attributes, close=True):
+    text = " ".join([name] + [f'{key}="{_escape(value)}"' for key, value in attributes])
+    return f"<{text}/>" if close else f"<{text}>"
+
+class _Stream:
+    """
+    Writes the indented lines of the document to the file handle f.
+    """
+    def __init__(self, f, registry):
+        self.f = f
+        self.registry = registry
+        self.depth = 0
+        self._fallback = None
+
+    def line(self, text):
+        self.f.write("\t"*self.depth + text + "\n")
+
+    def element(self, name, *attributes):
+        self.line(_tag(name, attributes))
+
+    def open(self, name, *attributes):
+        self.line(_tag(name, attributes, close=False))
+        self.depth += 1
+
+    def close(self, name):
+        self.depth -= 1
+        self.line(f"</{name}>")
+
+    def number(self, value):
+        return format_number(Defines.evaluateToFloat(self.registry, value))
+
+    def fallback(self):
+        """
+        Returns the pyg4ometry writer used for the objects without a native serializer.
+        """
+        if self._fallback is None:
+            self._fallback = DomWriter()
+            self._fallback.registry = self.registry
+        return self._fallback
+
+    def node(self, node):
+        """
+        Writes a DOM element of the fallback writer and releases it.
+        """
+        if node.parentNode is not None:
+            node.parentNode.removeChild(node)
+        for text in node.toprettyxml(indent="\t").splitlines():
+            if text.strip():
+                self.line(text)
+        node.unlink()
+
+def _write_vector(stream, vector, allow_ref=True, suppress_trivial=True, name=None):
+    """
+    Writes a position, rotation or scale, as pyg4ometry.gdml.Writer.writeVectorVariable.
+    """
+    if vector is None:
+        return
+    kind = type(vector).__name__.lower()
+    if allow_ref and vector.name in stream.registry.defineDict:
+        stream.element(f"{kind}ref", ("ref", vector.name))
+        return
+    if suppress_trivial and not vector.nonzero():
+        return
+    attributes = []
+    if name or vector.name:
+        attributes.append(("name", name or vector.name))
+    attributes += [(axis, format_number(float(getattr(vector, axis)))) for axis in ("x", "y", "z")]
+    if vector.unit != "none":
+        attributes.append(("unit", vector.unit))
+    stream.element(kind, *attributes)
+
+def _write_defines(stream):
+    if not stream.registry.defineDict:
+        stream.element("define")
+        return
+    stream.open("define")
+    for define in stream.registry.defineDict.values():
+        if isinstance(define, (Defines.Position, Defines.Rotation, Defines.Scale)):
+            _write_vector(stream, define, allow_ref=False, suppress_trivial=False)
+        else:
+            fallback = stream.fallback()
+            fallback.writeDefine(define)
+            stream.node(fallback.defines.lastChild)
+    stream.close("define")
+
+def _get_materials(registry):
+    """
+    Returns the materials written by pyg4ometry.gdml.Writer, in order: those of the registry and then those of the
+    logical volumes, each after its components.
+    """
+    materials = {}
+    def add(material):
+        if material.name in materials:
+            return
+        for component in getattr(material, "components", []):
+            if getattr(material, "type", None) in ("composite", "element-composite"):
+                add(component[0])
+        materials[material.name] = material
+    for material in registry.materialDict.values():
+        add(material)
+    for name in registry.logicalVolumeList:
+        volume = registry.logicalVolumeDict[name]
+        if volume.type == "logical":
+            add(volume.material)
+    return list(materials.values())
+
+def _write_material(stream, material):
+    if isinstance(material, Isotope):
+        stream.open("isotope", ("name", material.name), ("Z", int(material.Z)), ("N", int(material.N)))
+        stream.element("atom", ("value", stream.number(material.a)))
+        stream.close("isotope")
+    elif isinstance(material, Element):
+        attributes = [("name", material.name), ("formula", material.symbol)]
+        if material.type == "element-simple":
+            stream.open("element", *attributes, ("Z", int(material.Z)))
+            stream.element("atom", ("value", stream.number(material.A)))
+        else:
+            stream.open("element", *attributes)
+            for component in material.components:
+                stream.element("fraction", ("ref", component[0].name), ("n", stream.number(component[1])))
+        stream.close("element")
+    elif isinstance(material, Material) and material.type in ("simple", "composite"):
+        # predefined (NIST) and arbitrary materials are only referenced by name
+        attributes = [("name", material.name)]
+        if material.state != "" and material.state is not None:
+            attributes.append(("state", material.state))
+        if material.type == "simple":
+            attributes.append(("Z", int(material.atomic_number)))
+        stream.open("material", *attributes)
+        for name, matrix in material.properties.items():
+            if not isinstance(matrix, Defines.Matrix):
+                raise ValueError(f"Only references to matrices can be used for material property {name}")
+            stream.element("property", ("name", name), ("ref", matrix.name))
+        for name, tag in (("temperature", "T"), ("pressure", "P")):
+            value = material.state_variables.get(name)
+            if value is not None:
+                stream.element(tag, ("value", stream.number(value)), ("unit", material.state_variables[name + "_unit"]))
+        stream.element("D", ("value", stream.number(material.density)))
+        if material.type == "simple":
+            stream.element("atom", ("value", stream.number(material.atomic_weight)))
+        elif material.type == "composite":
+            for component, fraction, fraction_type in material.components:
+                if fraction_type == "massfraction":
+                    stream.element("fraction", ("ref", component.name), ("n", stream.number(fraction)))
+                elif fraction_type == "natoms":
+                    stream.element("composite", ("ref", component.name), ("n", int(fraction)))
+        stream.close("material")
+
+def _write_box(stream, solid):
+    stream.element("box", ("name", solid.name), ("x", stream.number(solid.pX)), ("y", stream.number(solid.pY)),
+                   ("z", stream.number(solid.pZ)), ("lunit", solid.lunit))
+
+def _write_tubs(stream, solid):
+    stream.element("tube", ("name", solid.name), ("rmin", stream.number(solid.pRMin)), ("rmax", stream.number(solid.pRMax)),
+                   ("z", stream.number(solid.pDz)), ("startphi", stream.number(solid.pSPhi)),
+                   ("deltaphi", stream.number(solid.pDPhi)), ("lunit", solid.lunit), ("aunit", solid.aunit))
+
+def _write_polyhedra(stream, solid):
+    stream.open("polyhedra", ("name", solid.name), ("startphi", stream.number(solid.pSPhi)),
+                ("deltaphi", stream.number(solid.pDPhi)), ("numsides", stream.number(solid.numSide)),
+                ("lunit", solid.lunit), ("aunit", solid.aunit))
+    for rmin, rmax, z in zip(solid.rInner, solid.rOuter, solid.zPlane):
+        stream.element("zplane", ("rmin", stream.number(rmin)), ("rmax", stream.number(rmax)), ("z", stream.number(z)))
+    stream.close("polyhedra")
+
+def _write_boolean(stream, solid):
+    tag = solid.type.lower()
+    stream.open(tag, ("name", solid.name))
+    stream.element("first", ("ref", solid.obj1.name))
+    stream.element("second", ("ref", solid.obj2.name))
+    rotation, position = solid.tra2
+    _write_vector(stream, position, name=solid.name + "_translation")
+    _write_vector(stream, rotation, name=solid.name + "_rotation")
+    stream.close(tag)
+
+def _write_multi_union(stream, solid):
+    stream.open("multiUnion", ("name", solid.name))
+    for i, (operand, (rotation, position)) in enumerate(zip(solid.objects, solid.transformations), start=1):
+        node = f"{solid.name}-node-{i}"
+        stream.open("multiUnionNode", ("name", node))
+        stream.element("solid", ("ref", operand.name))
+        _write_vector(stream, position, name=position.name or f"{node}-position")
+        _write_vector(stream, rotation, name=rotation.name or f"{node}-rotation")
+        stream.close("multiUnionNode")
+    stream.close("multiUnion")
+
+# Native serializers of the solids, by solid type
+SOLID_WRITERS = {
+    "Box": _write_box,
+    "Tubs": _write_tubs,
+    "Polyhedra": _write_polyhedra,
+    "Union": _write_boolean,
+    "Subtraction": _write_boolean,
+    "Intersection": _write_boolean,
+    "MultiUnion": _write_multi_union,
+}
+
+def _get_operands(solid):
+    if solid.type in ("Union", "Subtraction", "Intersection"):
+        return [solid.obj1, solid.obj2]
+    if solid.type == "MultiUnion":
+        return list(solid.objects)
+    if solid.type == "Scaled":
+        return [solid.solid]
+    return []
+
+def _write_solids(stream):
+    written = set()
+    stream.open("solids")
+    for solid in stream.registry.solidDict.values():
+        # operands first, without recursion as the boolean chains may be deep
+        stack = [(solid, False)]
+        while stack:
+            solid, expanded = stack.pop()
+            if solid.name in written:
+                continue
+            operands = [operand for operand in _get_operands(solid) if operand.name not in written]
+            if operands and not expanded:
+                stack.append((solid, True))
+                stack.extend((operand, False) for operand in reversed(operands))
+                continue
+            written.add(solid.name)
+            if solid.type in SOLID_WRITERS:
+                SOLID_WRITERS[solid.type](stream, solid)
+            else:
+                fallback = stream.fallback()
+                fallback.writeSolid(solid)
+                stream.node(fallback.solids.lastChild)
+    stream.close("solids")
+
+def _write_auxiliary(stream, auxiliary):
+    attributes = [("auxtype", auxiliary.auxtype), ("auxvalue", auxiliary.auxvalue)]
+    if auxiliary.auxunit:
+        attributes.append(("auxunit", auxiliary.auxunit))
+    if not auxiliary.subaux:
+        stream.element("auxiliary", *attributes)
+        return
+    stream.open("auxiliary", *attributes)
+    for sub in auxiliary.subaux:
+        _write_auxiliary(stream, sub)
+    stream.close("auxiliary")
+
+def _write_physical_volume(stream, physical):
+    attributes = [("name", physical.name)]
+    if physical.copyNumber != 0:
+        attributes.append(("copynumber", int(float(physical.copyNumber))))
+    stream.open("physvol", *attributes)
+    stream.element("volumeref", ("ref", physical.logicalVolume.name))
+    _write_vector(stream, physical.position)
+    _write_vector(stream, physical.rotation)
+    _write_vector(stream, physical.scale)
+    stream.close("physvol")
+
+def _write_daughter(stream, daughter):
+    if daughter.type == "placement":
+        _write_physical_volume(stream, daughter)
+        return
+    fallback = stream.fallback()
+    if daughter.type == "parametrised":
+        stream.node(fallback.writeParametrisedVolume(daughter))
+    elif daughter.type == "replica":
+        stream.node(fallback.writeReplicaVolume(daughter))
+    elif daughter.type == "division":
+        stream.node(fallback.writeDivisionVolume(daughter))
+    else:
+        raise ValueError(f"Unknown daughter volume type: {daughter.type}")
+
+def _write_logical_volume(stream, volume):
+    stream.open("volume", ("name", volume.name))
+    stream.element("materialref", ("ref", volume.material.name))
+    stream.element("solidref", ("ref", volume.solid.name))
+    auxiliaries = []
+    if volume.auxiliary:
+        auxiliaries = list(volume.auxiliary) if type(volume.auxiliary) in (list, tuple) else [volume.auxiliary]
+    if volume.visOptions:
+        auxiliaries.append(VisOptionsToAuxiliary(volume.visOptions))
+    for auxiliary in auxiliaries:
+        _write_auxiliary(stream, auxiliary)
+    for daughter in volume.daughterVolumes:
+        _write_daughter(stream, daughter)
+    stream.close("volume")
+
+def _write_structure(stream):
+    registry = stream.registry
+    stream.open("structure")
+    for name in registry.logicalVolumeList:
+        volume = registry.logicalVolumeDict[name]
+        if volume.type == "logical":
+            _write_logical_volume(stream, volume)
+        elif volume.type == "assembly":
+            stream.open("assembly", ("name", volume.name))
+            for daughter in volume.daughterVolumes:
+                _write_physical_volume(stream, daughter)
+            stream.close("assembly")
+    for surface in registry.surfaceDict.values():
+        fallback = stream.fallback()
+        if surface.type == "bordersurface":
+            fallback.writeBorderSurface(surface)
+        elif surface.type == "skinsurface":
+            fallback.writeSkinSurface(surface)
+        else:
+            continue
+        stream.node(fallback.structure.lastChild)
+    stream.close("structure")
+
+def write_stream(registry, f):
+    """
+    Writes the GDML document of registry to the text file handle f, section by section.
+    """
+    # refresh the ordering of the logical volumes, as pyg4ometry.gdml.Writer
+    registry.setWorld(registry.worldName)
+    stream = _Stream(f, registry)
+    stream.line('<?xml version="1.0" ?>')
+    stream.line(GDML_HEADER)
+    stream.depth += 1
+    _write_defines(stream)
+    materials = _get_materials(registry)
+    if materials:
+        stream.open("materials")
+        for material in materials:
+            _write_material(stream, material)
+        stream.close("materials")
+    else:
+        stream.element("materials")
+    _write_solids(stream)
+    _write_structure(stream)
+    if registry.userInfo:
+        stream.open("userinfo")
+        for auxiliary in registry.userInfo:
+            _write_auxiliary(stream, auxiliary)
+        stream.close("userinfo")
+    stream.open("setup", ("name", "Default"), ("version", "1.0"))
+    stream.element("world", ("ref", registry.worldName))
+    stream.close("setup")
+    stream.close("gdml")
+
+class _HashingFile:
+    """
+    Text file handle that also feeds what is written to a SHA-256 digest. Without a file handle, it only hashes.
+    """
+    def __init__(self, f=None):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, text):
+        self.digest.update(text.encode())
+        return self.f.write(text) if self.f is not None else len(text)
+
+def get_compression(filename):
+    """
+    Returns the compression of a GDML file from its extension (".gz", ".zst"), or None if it is not compressed.
+    """
+    extension = os.path.splitext(filename)[1]
+    return extension if extension in COMPRESSION_LEVELS else None
+
+class _GzipFile(gzip.GzipFile):
+    """
+    Gzip stream over a file handle that it closes. It is created without file name nor time stamp in the header, so
+    the same document always gives the same file.
+    """
+    def close(self):
+        f = self.fileobj
+        super().close()
+        if f is not None:
+            f.close()
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Compressed .zst GDML files require the zstandard package (pip install zstandard)") from None
+    return zstandard
+
+def open_binary(filename, mode="r", compression=None):
+    """
+    Opens a GDML file as a binary file handle of its uncompressed content, compressing or decompressing on the fly.
+    param mode: "r" or "w".
+    param compression: Compression of the file (see get_compression). Defaults to the one of its extension.
+    """
+    compression = compression or get_compression(filename)
+    if compression is None:
+        return open(filename, mode + "b")
+    f = open(filename, mode + "b")
+    if compression == ".gz":
+        return _GzipFile(filename="", mode=mode + "b", fileobj=f, compresslevel=COMPRESSION_LEVELS[".gz"], mtime=0)
+    zstandard = _import_zstandard()
+    if mode == "w":
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVELS[".zst"]).stream_writer(f, closefd=True)
+    return zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+
+def _open_text(filename, mode="r", compression=None):
+    return io.TextIOWrapper(open_binary(filename, mode, compression), encoding="utf-8")
+
+def read_hash(filename):
+    """
+    Returns the content hash written at the end of a GDML file by write, or None if it has none.
+    Compressed files are decompressed on the fly.
+    """
+    try:
+        if get_compression(filename) is None:
+            with open(filename, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - HASH_TAIL))
+                tail = f.read()
+        else:
+            tail = b""
+            with open_binary(filename) as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    tail = (tail + chunk)[-HASH_TAIL:]
+    except (FileNotFoundError, EOFError, OSError):
+        return None
+    match = _hash_pattern.search(tail)
+    return match.group(1).decode() if match else None
+
+def check_hash(filename):
+    """
+    Returns True if the content of a GDML file written by write matches its hash. The file is read in chunks, so the
+    memory use does not grow with its size.
+    """
+    expected = read_hash(filename)
+    if expected is None:
+        return False
+    digest = hashlib.sha256()
+    tail = b""
+    # the last HASH_TAIL bytes are held back, as the hash comment at the end is not part of the document
+    with open_binary(filename) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            tail += chunk
+            digest.update(tail[:-HASH_TAIL])
+            tail = tail[-HASH_TAIL:]
+    digest.update(tail[:tail.rindex(HASH_COMMENT_START.encode())])
+    return digest.hexdigest() == expected
+
+def get_hash(registry):
+    """
+    Returns the SHA-256 hash of the GDML document of registry (see write), without keeping the document.
+    """
+    hashing = _HashingFile()
+    write_stream(registry, hashing)
+    return hashing.digest.hexdigest()
+
+class _Reader(Reader):
+    """
+    GDML reader preparing the logical volume of every replica before the replica is built, see
+    utils.prepare_replicated_volume.
+    """
+    def parsePhysicalVolumeChildren(self, node, vol):
+        import utils
+        for child in node.childNodes:
+            if child.nodeType == node.ELEMENT_NODE and child.tagName == "replicavol":
+                volref = child.getElementsByTagName("volumeref")[0].attributes["ref"].value
+                utils.prepare_replicated_volume(self._registry.logicalVolumeDict[volref])
+        super().parsePhysicalVolumeChildren(node, vol)
+
+def read_registry(filename):
+    """
+    Reads a GDML file, compressed or not, into a pyg4ometry Registry.
+    The reader of pyg4ometry only takes plain files, so a compressed file is decompressed to a temporary file first.
+    """
+    if get_compression(filename) is None:
+        return _Reader(filename).getRegistry()
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_filename = os.path.join(tmp, "geometry.gdml")
+        with open_binary(filename) as f, open(plain_filename, "wb") as plain:
+            shutil.copyfileobj(f, plain)
+        return _Reader(plain_filename).getRegistry()
+
+def write(registry, filename):
+    """
+    Writes the GDML file of registry with write_stream, followed by a comment with the SHA-256 hash of the document.
+    Files ending with .gz or .zst are compressed as they are written (see COMPRESSION_LEVELS).
+    If the file already has a hash comment, the document is first only hashed: when the hash is the same and the
+    content of the file matches it (see check_hash), the file is left untouched (content and modification time) and
+    nothing is compressed or written. A file edited after it was written does not match its hash and is replaced.
+    Returns the tuple (hash, True if the file was written or False if it was unchanged).
+    """
+    expected = read_hash(filename)
+    if expected is not None and get_hash(registry) == expected and check_hash(filename):
+        return expected, False
+    # written to a temporary name first, so the file is never seen partially written
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with _open_text(tmp_filename, "w", get_compression(filename)) as f:
+        hashing = _HashingFile(f)
+        write_stream(registry, hashing)
+        digest = hashing.digest.hexdigest()
+        f.write(f"{HASH_COMMENT_START}{digest} -->\n")
+    os.replace(tmp_filename, filename)
+    return digest, True
+
+def to_string(registry):
+    """
+    Returns the GDML document of registry as a string.
+    """
+    f = io.StringIO()
+    write_stream(registry, f)
+    return f.getvalue()